@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+Access Log - non-blocking, batched JSON-lines access records
+Request threads (or the event loop) only append a dict to a bounded
+in-memory queue; a background writer thread serializes and flushes them
+in batches, one JSON object per line, ready for promtail's json stage and
+Loki. When the queue is full the record is dropped and counted instead
+of stalling the request.
+"""
+
+import atexit
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import List, Optional
+
+from request_timing import TIMING
+from template_metrics import REGISTRY
+
+# Destination from TEMPLATE_ACCESS_LOG: unset or "-" for stdout, a file
+# path to append to, "off" to disable
+ACCESS_LOG_ENV = "TEMPLATE_ACCESS_LOG"
+QUEUE_SIZE = 8192                 # records buffered before dropping
+BATCH_SIZE = 512                  # records per write
+FLUSH_INTERVAL = 0.5              # seconds a partial batch may wait
+# Which server script wrote a record (e.g. "dual_stack_server")
+SERVER_NAME = os.path.splitext(os.path.basename(sys.argv[0] or 'python'))[0]
+
+# Cache outcome of the current request ("hit", "miss", "not_modified",
+# "raw"), set by the catalog code and reset per request
+CACHE_RESULT: ContextVar[Optional[str]] = ContextVar('cache_result', default=None)
+
+
+def note_cache(result: str):
+    CACHE_RESULT.set(result)
+
+
+def timestamp(when: float) -> str:
+    """RFC 3339 UTC timestamp with milliseconds (promtail's RFC3339Nano parses it)"""
+    return datetime.fromtimestamp(when, timezone.utc).isoformat(timespec='milliseconds').replace('+00:00', 'Z')
+
+
+def access_record(client: str, method: str, target: str, status: int, size: int,
+                  latency: float, encoding: str) -> dict:
+    """One access log line; ``latency`` in seconds"""
+    record = {
+        'ts': timestamp(time.time()),
+        'server': SERVER_NAME,
+        'pid': os.getpid(),
+        'client': client,
+        'method': method,
+        'path': target,
+        'status': status,
+        'bytes': size,
+        'latency_ms': round(latency * 1000, 3),
+        'encoding': encoding,
+        'cache': CACHE_RESULT.get(),
+    }
+    timing = TIMING.get()
+    if timing is not None:
+        record['timing_ms'] = timing.as_dict()
+    return record
+
+
+class AccessLog:
+    """Bounded queue of access records drained by a writer thread"""
+
+    def __init__(self, destination: Optional[str] = None, queue_size: int = QUEUE_SIZE,
+                 batch_size: int = BATCH_SIZE, flush_interval: float = FLUSH_INTERVAL):
+        self.destination = destination
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.records: 'queue.Queue[dict]' = queue.Queue(queue_size)
+        self.dropped = 0
+        self._pid = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> 'AccessLog':
+        return cls(os.environ.get(ACCESS_LOG_ENV, '-'))
+
+    @property
+    def enabled(self) -> bool:
+        return self.destination not in (None, '', 'off')
+
+    def configure(self, destination: Optional[str]):
+        """Change the destination before the first record is logged"""
+        self.destination = destination
+
+    def log(self, record: dict):
+        """Queue a record without blocking; drop and count it if the queue is full"""
+        if not self.enabled:
+            return
+        if self._pid != os.getpid():
+            self._start()
+        try:
+            self.records.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            REGISTRY.inc('template_server_access_log_dropped_total')
+
+    def _start(self):
+        # Also runs again in forked workers, which inherit no writer thread
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self.records = queue.Queue(self.records.maxsize)
+            threading.Thread(target=self._writer, name="access-log", daemon=True).start()
+            self._pid = os.getpid()
+
+    def _open(self):
+        if self.destination == '-':
+            return sys.stdout.fileno(), False
+        return os.open(self.destination, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644), True
+
+    def _writer(self):
+        records = self.records
+        try:
+            fd, owned = self._open()
+        except OSError as e:
+            print(f"⚠️  Access log disabled: {e}")
+            self.destination = None
+            return
+        try:
+            while True:
+                batch = self._next_batch(records)
+                self._write(fd, batch)
+                for _ in batch:
+                    records.task_done()
+        finally:
+            if owned:
+                os.close(fd)
+
+    def _next_batch(self, records: 'queue.Queue[dict]') -> List[dict]:
+        """Wait for a first record, then take what arrives within flush_interval"""
+        batch = [records.get()]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(records.get(timeout=remaining) if remaining > 0
+                             else records.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, fd: int, batch: List[dict]):
+        data = "".join(json.dumps(record, ensure_ascii=False, separators=(',', ':')) + "\n"
+                       for record in batch).encode('utf-8')
+        try:
+            # One O_APPEND write per batch keeps lines of pre-fork workers intact
+            while data:
+                data = data[os.write(fd, data):]
+        except OSError:
+            self.dropped += len(batch)
+            REGISTRY.inc('template_server_access_log_dropped_total', (), len(batch))
+
+    def flush(self, timeout: float = 2.0):
+        """Best effort wait for queued records (e.g. at exit)"""
+        if self._pid != os.getpid():
+            return
+        deadline = time.monotonic() + timeout
+        while self.records.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+
+# Process-wide access log shared by every server in this repository
+ACCESS_LOG = AccessLog.from_env()
+atexit.register(ACCESS_LOG.flush)
@@ -0,0 +1,885 @@
+#!/usr/bin/env python3
+"""
+Async Portainer Template Server - unified asyncio engine
+One event loop serves thousands of concurrent keep-alive connections with
+bounded memory. Replaces the thread-per-connection servers while keeping
+their behaviours: IPv4/IPv6 dual-stack binding, CORS, JSON-only mode and
+the test dashboard. With --workers N a supervisor forks N engine processes
+that share the port through SO_REUSEPORT, so the kernel spreads
+connections across cores. --unix-socket adds (or with --no-tcp, replaces
+the TCP listener with) a Unix domain socket for a reverse proxy on the
+same host.
+"""
+
+import argparse
+import asyncio
+import gc
+import json
+import mimetypes
+import os
+import shutil
+import signal
+import socket
+import stat
+import sys
+import tempfile
+import time
+from contextlib import suppress
+from dataclasses import dataclass, field
+from http import HTTPStatus
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from access_log import ACCESS_LOG, ACCESS_LOG_ENV, CACHE_RESULT, access_record, note_cache
+from template_cache import (
+    CACHE_CONTROL, COMPOSE_PATH, COMPOSE_PREFIX, HEALTH_PATH, LEAN_PATH, PROBE_PATHS, READY_PATH, TEMPLATE_FILENAME,
+    TEMPLATE_LOOKUP_PREFIX, TEMPLATE_PATH, TEMPLATES_PATH, Payload, TemplateCache, TemplateNotFound, catalog_response, http_date, route_label, select_representation,
+    probe_response, record_lookup, report_listening, representation_cached, serves_raw_file,
+    start_warmup,
+)
+from rate_limiter import (
+    MAX_CONNECTIONS_PER_IP, RATE_BURST, RATE_LIMIT, ClientLimiter, client_key, retry_after,
+)
+from request_timing import SAMPLER, TIMING, TIMING_ENV, timed
+from template_changes import CHANGES_PATH
+from template_compose import CatalogComposer
+from template_variants import VariantStore
+from template_metrics import (
+    CONTENT_TYPE as METRICS_CONTENT_TYPE, METRICS_PATH, PUBLISH_INTERVAL, REGISTRY,
+)
+
+# Configuration
+PORT = 8091
+SERVER_NAME = "PortainerTemplateServer/async"
+
+MAX_HEADER_BYTES = 16 * 1024      # request line + headers
+MAX_BODY_BYTES = 64 * 1024        # request bodies are read and discarded
+MAX_CONNECTIONS = 10000           # beyond this new connections get a 503
+REQUEST_TIMEOUT = 10.0            # seconds to receive the first request head
+KEEPALIVE_TIMEOUT = 15.0          # idle seconds between keep-alive requests
+MAX_KEEPALIVE_REQUESTS = 1000     # requests per connection before closing
+WRITE_CHUNK = 64 * 1024           # bounded per-connection send buffer
+SEND_TIMEOUT = 30.0               # seconds a stalled client may block a chunk
+SHUTDOWN_GRACE = 10.0             # seconds to drain connections on shutdown
+RESTART_BACKOFF_MAX = 30.0        # cap on the delay before restarting a crash-looping worker
+SOCKET_MODE = 0o660               # permissions of the --unix-socket file
+
+CORS_HEADERS = (
+    ('Access-Control-Allow-Origin', '*'),
+    ('Access-Control-Allow-Methods', 'GET, HEAD, OPTIONS'),
+    ('Access-Control-Allow-Headers', 'Content-Type'),
+)
+CATALOG_HEADERS = (('Cache-Control', CACHE_CONTROL),)
+
+
+class HTTPError(Exception):
+    """Protocol-level error that ends the connection after a response"""
+
+    def __init__(self, status: int, message: str = ""):
+        super().__init__(message)
+        self.status = status
+        self.message = message or HTTPStatus(status).phrase
+
+
+@dataclass
+class Request:
+    method: str
+    target: str
+    version: str
+    headers: Dict[str, str]
+    client: str
+    path: str = ""
+    query: Dict[str, List[str]] = field(default_factory=dict)
+
+    def __post_init__(self):
+        parts = urlsplit(self.target)
+        self.path = unquote(parts.path) or "/"
+        self.query = parse_qs(parts.query)
+
+    @property
+    def keep_alive(self) -> bool:
+        connection = self.headers.get('connection', '').lower()
+        if self.version == 'HTTP/1.0':
+            return 'keep-alive' in connection
+        return 'close' not in connection
+
+
+@dataclass
+class Response:
+    status: int
+    headers: List[Tuple[str, str]] = field(default_factory=list)
+    body: bytes = b""
+    payload: Optional[Payload] = None   # catalog bodies, possibly sendfile-backed
+
+
+def text_response(status: int, message: str = "") -> Response:
+    body = (message or HTTPStatus(status).phrase).encode('utf-8') + b"\n"
+    return Response(status, [('Content-Type', 'text/plain; charset=utf-8'),
+                             ('Content-Length', str(len(body)))], body)
+
+
+def json_response(data, status: int = 200) -> Response:
+    body = json.dumps(data, indent=2, ensure_ascii=False).encode('utf-8')
+    return Response(status, [('Content-Type', 'application/json; charset=utf-8'),
+                             ('Content-Length', str(len(body)))], body)
+
+
+def too_many(wait: float, message: str) -> Response:
+    response = text_response(429, message)
+    response.headers.append(('Retry-After', retry_after(wait)))
+    return response
+
+
+def create_listen_socket(port: int, host: Optional[str] = None, backlog: int = 1024,
+                         reuse_port: bool = False, verbose: bool = True) -> socket.socket:
+    """Bind a dual-stack socket (IPv4+IPv6) or fall back to IPv4 only"""
+    if host is None:
+        if socket.has_dualstack_ipv6():
+            try:
+                sock = socket.create_server(("::", port), family=socket.AF_INET6, backlog=backlog,
+                                            reuse_port=reuse_port, dualstack_ipv6=True)
+                if verbose:
+                    print("✅ Dual-stack server (IPv4+IPv6) bound")
+                return sock
+            except OSError as e:
+                print(f"IPv6 failed ({e}), falling back to IPv4...")
+        host = "0.0.0.0"
+    family = socket.AF_INET6 if ':' in host else socket.AF_INET
+    sock = socket.create_server((host, port), family=family, backlog=backlog,
+                                reuse_port=reuse_port)
+    if verbose:
+        print(f"✅ Server bound on {host}")
+    return sock
+
+
+def create_unix_socket(path: str, mode: int = SOCKET_MODE, backlog: int = 1024) -> socket.socket:
+    """Bind a Unix domain socket (e.g. for a reverse proxy on the same host)
+
+    A stale socket file left by a crashed server is replaced; one another
+    server still accepts on is not.
+    """
+    if os.path.lexists(path):
+        if not stat.S_ISSOCK(os.lstat(path).st_mode):
+            raise OSError(f"{path} exists and is not a socket")
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+            try:
+                probe.connect(path)
+            except (ConnectionRefusedError, FileNotFoundError):
+                os.unlink(path)
+            else:
+                raise OSError(f"{path} is in use by another server")
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.bind(path)
+        os.chmod(path, mode)
+        sock.listen(backlog)
+    except OSError:
+        sock.close()
+        raise
+    print(f"✅ Unix socket bound at {path} (mode {mode:o})")
+    return sock
+
+
+class AsyncTemplateServer:
+    """Single-process asyncio HTTP/1.1 server for the template catalog"""
+
+    def __init__(self, web_dir, port: int = PORT, host: Optional[str] = None,
+                 json_only: bool = False, dashboard: bool = False,
+                 max_connections: int = MAX_CONNECTIONS,
+                 keepalive_timeout: float = KEEPALIVE_TIMEOUT,
+                 max_keepalive_requests: int = MAX_KEEPALIVE_REQUESTS,
+                 quiet: bool = False, rate_limiter: Optional[ClientLimiter] = None,
+                 unix_socket: Optional[str] = None, socket_mode: int = SOCKET_MODE,
+                 tcp: bool = True):
+        self.web_dir = Path(web_dir).absolute()
+        self.port = port
+        self.host = host
+        self.json_only = json_only
+        self.dashboard = dashboard
+        self.max_connections = max_connections
+        self.keepalive_timeout = keepalive_timeout
+        self.max_keepalive_requests = max_keepalive_requests
+        self.quiet = quiet
+        self.rate_limiter = rate_limiter
+        self.unix_socket = unix_socket
+        self.socket_mode = socket_mode
+        self.tcp = tcp
+        # Bound by start() (or inherited from the pre-fork supervisor)
+        self.unix_sock: Optional[socket.socket] = None
+        self.owns_unix_socket = False
+        self.cache = TemplateCache(self.web_dir / TEMPLATE_FILENAME)
+        self.test_results = None
+        self.variants: Optional[VariantStore] = None
+        self.composer: Optional[CatalogComposer] = None
+        self.active_connections = 0
+        self.closing = False
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._unix_server: Optional[asyncio.AbstractServer] = None
+        self._date = (0, "")
+
+    # -- connection handling -------------------------------------------------
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        peer = writer.get_extra_info('peername')
+        sock = writer.get_extra_info('socket')
+        # Unix socket peers are the local reverse proxy: every client would
+        # share one key, so per-IP limits are left to the proxy
+        unix = sock is not None and sock.family == socket.AF_UNIX
+        client = "unix" if unix else (peer[0] if peer else "-")
+        limiter = None if unix else self.rate_limiter
+        REGISTRY.inc('template_server_connections_total', ('unix' if unix else 'tcp',))
+        if sock is not None and sock.family in (socket.AF_INET, socket.AF_INET6):
+            # asyncio only disables Nagle for sockets created with
+            # proto=IPPROTO_TCP; socket.create_server() leaves proto at 0
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+        if self.active_connections >= self.max_connections:
+            with suppress(ConnectionError):
+                await self.write_response(writer, None, text_response(503, "Server busy"), False)
+            writer.close()
+            return
+        key = client_key(peer) if peer and not unix else client
+        if limiter is not None and not limiter.open_connection(key):
+            with suppress(ConnectionError):
+                await self.write_response(writer, None, too_many(1.0, "Too many connections"), False)
+            writer.close()
+            return
+
+        self.active_connections += 1
+        REGISTRY.inc('template_server_active_connections', (), 1)
+        served = 0
+        try:
+            while not self.closing:
+                timeout = REQUEST_TIMEOUT if served == 0 else self.keepalive_timeout
+                try:
+                    request = await self.read_request(reader, client, timeout)
+                except HTTPError as e:
+                    await self.write_response(writer, None, text_response(e.status, e.message), False)
+                    break
+                if request is None:
+                    break
+
+                served += 1
+                started = time.perf_counter()
+                CACHE_RESULT.set(None)
+                SAMPLER.start()
+                wait = limiter.acquire(key) if limiter is not None else 0.0
+                if wait:
+                    response = too_many(wait, "Rate limit exceeded")
+                else:
+                    response = await self.dispatch(request)
+                keep_alive = (request.keep_alive and not self.closing and not wait
+                              and served < self.max_keepalive_requests)
+                await self.write_response(writer, request, response, keep_alive,
+                                          self.max_keepalive_requests - served)
+                self.record_request(request, response, started)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.TimeoutError):
+            pass
+        finally:
+            self.active_connections -= 1
+            if limiter is not None:
+                limiter.close_connection(key)
+            REGISTRY.inc('template_server_active_connections', (), -1)
+            writer.close()
+            with suppress(ConnectionError, asyncio.TimeoutError):
+                await asyncio.wait_for(writer.wait_closed(), 1.0)
+
+    async def read_request(self, reader: asyncio.StreamReader, client: str,
+                           timeout: float) -> Optional[Request]:
+        """Read one request head (and discard any body); None on clean EOF/idle"""
+        try:
+            head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), timeout)
+        except asyncio.IncompleteReadError as e:
+            if e.partial.strip():
+                raise HTTPError(400, "Incomplete request")
+            return None
+        except asyncio.LimitOverrunError:
+            raise HTTPError(431)
+        except asyncio.TimeoutError:
+            return None
+
+        lines = head.lstrip(b"\r\n").decode('latin-1').split("\r\n")
+        parts = lines[0].split()
+        if len(parts) != 3 or not parts[2].startswith("HTTP/1."):
+            raise HTTPError(400, "Bad request line")
+        method, target, version = parts
+
+        headers: Dict[str, str] = {}
+        for line in lines[1:]:
+            if not line:
+                continue
+            name, sep, value = line.partition(":")
+            if not sep:
+                raise HTTPError(400, "Bad header line")
+            name = name.strip().lower()
+            value = value.strip()
+            headers[name] = f"{headers[name]}, {value}" if name in headers else value
+
+        # Request bodies are never used, only skipped: a Transfer-Encoding
+        # body cannot be skipped without decoding it, so it is refused (and
+        # the connection closed) rather than misread as the next request
+        if 'transfer-encoding' in headers:
+            raise HTTPError(501, "Chunked request bodies are not supported")
+        length = headers.get('content-length')
+        if length:
+            try:
+                length = int(length)
+            except ValueError:
+                raise HTTPError(400, "Bad Content-Length")
+            if length < 0:
+                raise HTTPError(400, "Bad Content-Length")
+            if length > MAX_BODY_BYTES:
+                raise HTTPError(413)
+            try:
+                await asyncio.wait_for(reader.readexactly(length), REQUEST_TIMEOUT)
+            except asyncio.IncompleteReadError:
+                raise HTTPError(400, "Incomplete request body")
+
+        return Request(method.upper(), target, version, headers, client)
+
+    async def write_response(self, writer: asyncio.StreamWriter, request: Optional[Request],
+                             response: Response, keep_alive: bool, remaining: int = 0):
+        """Write status line, headers and body with bounded buffering
+
+        ``remaining`` is the number of further requests the connection may
+        carry, advertised as Keep-Alive "max".
+        """
+        status = HTTPStatus(response.status)
+        lines = [f"HTTP/1.1 {status.value} {status.phrase}",
+                 f"Server: {SERVER_NAME}",
+                 f"Date: {self.http_date()}"]
+        lines.extend(f"{name}: {value}" for name, value in response.headers)
+        lines.extend(f"{name}: {value}" for name, value in CORS_HEADERS)
+        if keep_alive:
+            lines.append("Connection: keep-alive")
+            lines.append(f"Keep-Alive: timeout={int(self.keepalive_timeout)}, "
+                         f"max={remaining}")
+        else:
+            lines.append("Connection: close")
+        timing = TIMING.get() if request is not None else None
+        if timing is not None:
+            lines.append(f"Server-Timing: {timing.header()}")
+        head = ("\r\n".join(lines) + "\r\n\r\n").encode('latin-1')
+
+        payload = response.payload
+        body = payload.view() if payload is not None else memoryview(response.body)
+        with timed('write'):
+            if not body or (request is not None and request.method == 'HEAD'):
+                writer.write(head)
+            elif len(body) <= WRITE_CHUNK:
+                # One segment for small responses
+                writer.write(head + body)
+            else:
+                writer.write(head)
+                if payload is None or payload.spool is None or not await self.send_file(writer, payload):
+                    for offset in range(0, len(body), WRITE_CHUNK):
+                        writer.write(body[offset:offset + WRITE_CHUNK])
+                        await asyncio.wait_for(writer.drain(), SEND_TIMEOUT)
+            await writer.drain()
+
+    async def send_file(self, writer: asyncio.StreamWriter, payload: Payload) -> bool:
+        """Zero-copy send of a spooled payload; False if sendfile is unavailable"""
+        await asyncio.wait_for(writer.drain(), SEND_TIMEOUT)
+        loop = asyncio.get_running_loop()
+        try:
+            # No fallback: the read/send fallback would move the shared
+            # spool's file position under concurrent responses.
+            await asyncio.wait_for(
+                loop.sendfile(writer.transport, payload.spool, payload.offset,
+                              payload.length, fallback=False),
+                SEND_TIMEOUT)
+        except asyncio.SendfileNotAvailableError:
+            return False
+        return True
+
+    def http_date(self) -> str:
+        now = int(time.time())
+        if self._date[0] != now:
+            self._date = (now, http_date(now))
+        return self._date[1]
+
+    def record_request(self, request: Request, response: Response, started: float):
+        path = route_label(request.path)
+        encoding = next((value for name, value in response.headers
+                         if name == 'Content-Encoding'), 'identity')
+        elapsed = time.perf_counter() - started
+        REGISTRY.inc('template_server_requests_total', (path, str(response.status), encoding))
+        REGISTRY.observe('template_server_request_duration_seconds', elapsed, (path,))
+        size = 0
+        if request.method != 'HEAD':
+            size = response.payload.length if response.payload is not None else len(response.body)
+            if size:
+                REGISTRY.inc('template_server_response_bytes_total', (path,), size)
+        timing = TIMING.get()
+        if timing is not None:
+            timing.observe()
+        if not self.quiet and path not in PROBE_PATHS:
+            ACCESS_LOG.log(access_record(request.client, request.method, request.target,
+                                         response.status, size, elapsed, encoding))
+
+    # -- routing -------------------------------------------------------------
+
+    async def dispatch(self, request: Request) -> Response:
+        """Route a request; a handler bug becomes a logged 500, not a dropped connection"""
+        try:
+            return await self.route(request)
+        except Exception as e:
+            print(f"❌ Error handling {request.method} {request.target!r}: {type(e).__name__}: {e}")
+            return text_response(500)
+
+    async def route(self, request: Request) -> Response:
+        if request.method == 'OPTIONS':
+            return Response(200, [('Content-Length', '0')])
+        if request.method not in ('GET', 'HEAD'):
+            response = text_response(405)
+            response.headers.append(('Allow', 'GET, HEAD, OPTIONS'))
+            return response
+
+        if request.path == METRICS_PATH:
+            body = REGISTRY.render()
+            return Response(200, [('Content-Type', METRICS_CONTENT_TYPE),
+                                  ('Content-Length', str(len(body)))], body)
+        if request.path in PROBE_PATHS:
+            return Response(*probe_response(self.cache, request.path))
+        if (self.json_only or request.path in (TEMPLATE_PATH, LEAN_PATH, TEMPLATES_PATH)
+                or request.path.startswith(TEMPLATE_LOOKUP_PREFIX)):
+            return await self.serve_catalog(request)
+        if self.dashboard and request.path == '/':
+            return self.serve_dashboard()
+        if self.dashboard and request.path == '/test':
+            from test_server import test_results_response, wants_refresh
+            status, body = test_results_response(self.test_results, wants_refresh(request.query))
+            return Response(status, [('Content-Type', 'application/json; charset=utf-8'),
+                                     ('Content-Length', str(len(body)))], body)
+        if self.composer is not None and (request.path == COMPOSE_PATH
+                                          or request.path.startswith(COMPOSE_PREFIX)):
+            return await self.serve_composition(request)
+        if self.variants is not None and request.path.lstrip('/') in self.variants:
+            response = await self.serve_variant(request)
+            if response is not None:
+                return response
+        return await self.serve_static(request)
+
+    async def serve_catalog(self, request: Request) -> Response:
+        query = request.target.partition('?')[2]
+        record_lookup('snapshot', self.cache.ready)
+        try:
+            with timed('cache'):
+                snapshot = self.cache.get(wait=False)
+            if snapshot is None:
+                if serves_raw_file(request.path, query):
+                    return await self.serve_raw_catalog()
+                # Derived views need the snapshot; wait off the event loop
+                with timed('cache'):
+                    snapshot = await asyncio.to_thread(self.cache.get)
+        except FileNotFoundError:
+            return text_response(404, "Template file not found")
+        except (OSError, ValueError) as e:
+            return text_response(500, f"Error reading template: {e}")
+        def select():
+            with timed('select'):
+                return select_representation(snapshot, request.path, query), CACHE_RESULT.get()
+        try:
+            if representation_cached(snapshot, request.path, query):
+                representation = select()[0]
+            else:
+                # Filtering and compressing a miss takes tens of milliseconds:
+                # keep it off the event loop
+                representation, cache_result = await asyncio.to_thread(select)
+                note_cache(cache_result)
+        except TemplateNotFound as e:
+            return text_response(404, str(e))
+        except ValueError as e:
+            return text_response(400, str(e))
+        status, headers, payload = catalog_response(representation, request.headers, CATALOG_HEADERS)
+        return Response(status, headers, payload=payload)
+
+    async def serve_variant(self, request: Request) -> Optional[Response]:
+        """Catalog variant from the shared store; None to fall back to the file"""
+        def lookup():
+            # A miss encodes the variant: keep that off the event loop
+            return self.variants.get(request.path.lstrip('/')), CACHE_RESULT.get()
+        representation, cache_result = await asyncio.to_thread(lookup)
+        if representation is None:
+            return None
+        note_cache(cache_result)
+        status, headers, payload = catalog_response(representation, request.headers, CATALOG_HEADERS)
+        return Response(status, headers, payload=payload)
+
+    async def serve_composition(self, request: Request) -> Response:
+        """Composed catalog; a miss reads, filters and encodes off the event loop"""
+        def lookup():
+            return self.composer.get(request.path, request.target.partition('?')[2]), CACHE_RESULT.get()
+        try:
+            representation, cache_result = await asyncio.to_thread(lookup)
+        except LookupError as e:
+            return text_response(404, str(e))
+        except (OSError, ValueError) as e:
+            return text_response(500, f"Error composing catalog: {e}")
+        note_cache(cache_result)
+        status, headers, payload = catalog_response(representation, request.headers, CATALOG_HEADERS)
+        return Response(status, headers, payload=payload)
+
+    async def serve_raw_catalog(self) -> Response:
+        """Catalog straight from disk while the first snapshot is still loading"""
+        note_cache('raw')
+        with timed('read'):
+            body, mtime = await asyncio.to_thread(
+                lambda: (self.cache.path.read_bytes(), self.cache.path.stat().st_mtime))
+        return Response(200, [('Content-Type', 'application/json; charset=utf-8'),
+                              ('Content-Length', str(len(body))),
+                              ('Last-Modified', http_date(mtime))] + list(CATALOG_HEADERS), body)
+
+    def serve_dashboard(self) -> Response:
+        from test_server import render_dashboard
+        template_count = 0
+        server_status = "🟢 ONLINE"
+        try:
+            template_count = self.cache.get().template_count
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError):
+            server_status = "🔴 JSON ERROR"
+        body = render_dashboard(template_count, server_status, self.port).encode('utf-8')
+        return Response(200, [('Content-Type', 'text/html; charset=utf-8'),
+                              ('Content-Length', str(len(body)))], body)
+
+    async def serve_static(self, request: Request) -> Response:
+        """Serve other files below web_dir (index.html, badges, variants)"""
+        try:
+            path = (self.web_dir / request.path.lstrip('/')).resolve()
+        except (OSError, ValueError):
+            # e.g. an encoded NUL byte (/%00) or a name too long for the OS
+            return text_response(404)
+        if path != self.web_dir and self.web_dir not in path.parents:
+            return text_response(404)
+        if path.is_dir():
+            path = path / "index.html"
+        try:
+            body = await asyncio.to_thread(path.read_bytes)
+            mtime = path.stat().st_mtime
+        except OSError:
+            return text_response(404)
+
+        content_type = mimetypes.guess_type(path.name)[0] or 'application/octet-stream'
+        if path.suffix == '.json':
+            content_type = 'application/json'
+        return Response(200, [('Content-Type', content_type),
+                              ('Content-Length', str(len(body))),
+                              ('Last-Modified', http_date(mtime))], body)
+
+    # -- lifecycle -----------------------------------------------------------
+
+    async def start(self, sock: Optional[socket.socket] = None):
+        """Bind (unless a socket is given) and start accepting
+
+        TCP and the Unix socket are served by the same engine; either may
+        be switched off.
+        """
+        if self.tcp:
+            if sock is None:
+                sock = create_listen_socket(self.port, self.host)
+            self._server = await asyncio.start_server(self.handle_connection, sock=sock,
+                                                      limit=MAX_HEADER_BYTES)
+        if self.unix_socket:
+            if self.unix_sock is None:
+                self.unix_sock = create_unix_socket(self.unix_socket, self.socket_mode)
+                self.owns_unix_socket = True
+            self._unix_server = await asyncio.start_unix_server(
+                self.handle_connection, sock=self.unix_sock, limit=MAX_HEADER_BYTES)
+
+    async def shutdown(self, grace: float = SHUTDOWN_GRACE):
+        """Stop accepting, then let in-flight requests finish"""
+        self.closing = True
+        for server in (self._server, self._unix_server):
+            if server is not None:
+                server.close()
+        if self.owns_unix_socket:
+            with suppress(OSError):
+                os.unlink(self.unix_socket)
+        deadline = time.monotonic() + grace
+        while self.active_connections and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+
+    async def publish_metrics(self):
+        """Pre-fork workers: keep this worker's totals visible to its peers"""
+        while not self.closing:
+            REGISTRY.publish()
+            await asyncio.sleep(PUBLISH_INTERVAL)
+
+    async def serve(self, sock: Optional[socket.socket] = None):
+        if not self.cache.ready:
+            # Listen first; the raw file is served until validation finishes
+            start_warmup(self.cache)
+        if not self.json_only and self.variants is None:
+            self.variants = VariantStore(self.web_dir).start()
+        if not self.json_only and self.composer is None:
+            self.composer = CatalogComposer()
+        if self.dashboard and self.test_results is None:
+            from test_server import TestResultsCache
+            self.test_results = TestResultsCache(self.cache, self.web_dir.parent).start()
+        await self.start(sock)
+        report_listening()
+        publisher = (asyncio.create_task(self.publish_metrics())
+                     if REGISTRY.peer_dir is not None else None)
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            with suppress(NotImplementedError):
+                loop.add_signal_handler(sig, stop.set)
+        await stop.wait()
+        print("\n🛑 Server stopping, draining connections...")
+        await self.shutdown()
+        if publisher is not None:
+            publisher.cancel()
+
+
+class WorkerSupervisor:
+    """Pre-fork supervisor: N engine processes behind one port
+
+    With SO_REUSEPORT every worker gets its own listening socket and the
+    kernel load-balances new connections across them; elsewhere the
+    workers share one inherited socket. The sockets are bound here, before
+    forking, so a restarted worker picks up its predecessor's socket and
+    connections queued on it are not lost. The catalog and the variant
+    store are loaded here too, after binding and before forking, so
+    workers share them copy-on-write instead of each parsing them;
+    connections arriving meanwhile wait in the listen backlog. If the
+    catalog cannot be loaded, each worker retries in the background after
+    it starts.
+    """
+
+    def __init__(self, server: AsyncTemplateServer, workers: int):
+        self.server = server
+        self.workers = workers
+        self.reuse_port = hasattr(socket, 'SO_REUSEPORT')
+        self.sockets: List[socket.socket] = []
+        self.children: Dict[int, int] = {}        # pid -> worker slot
+        self.crashes: Dict[int, int] = {}         # slot -> consecutive quick crashes
+        self.started: Dict[int, float] = {}       # slot -> start time
+        self.stopping = False
+        self.metrics_dir = tempfile.mkdtemp(prefix="template-metrics-")
+
+    def bind(self):
+        server = self.server
+        if server.unix_socket:
+            # One socket file, inherited by every worker
+            server.unix_sock = create_unix_socket(server.unix_socket, server.socket_mode)
+        if not server.tcp:
+            self.sockets = [None] * self.workers
+        elif self.reuse_port:
+            self.sockets = [create_listen_socket(server.port, server.host, reuse_port=True,
+                                                 verbose=slot == 0)
+                            for slot in range(self.workers)]
+        else:
+            self.sockets = [create_listen_socket(server.port, server.host)] * self.workers
+
+    def preload(self):
+        """Load the catalog and variants once in the supervisor for every worker to inherit"""
+        server = self.server
+        started = time.perf_counter()
+        try:
+            snapshot = server.cache.get()
+        except Exception as e:
+            print(f"⚠️ Catalog not loaded before forking, workers will load it: {e}")
+        else:
+            print(f"📦 Catalog loaded before forking: {snapshot.template_count} templates "
+                  f"in {(time.perf_counter() - started) * 1000:.0f} ms, shared by all workers")
+        if not server.json_only and server.variants is None:
+            server.variants = VariantStore(server.web_dir).load()
+        # Keep the collector from touching (and so copying) every inherited object
+        gc.freeze()
+
+    def spawn(self, slot: int):
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                signal.signal(signal.SIGINT, signal.default_int_handler)
+                signal.signal(signal.SIGTERM, signal.SIG_DFL)
+                for other in set(self.sockets) - {self.sockets[slot], None}:
+                    other.close()
+                # Workers publish their totals so any of them can answer a scrape;
+                # only worker 0 keeps what the supervisor recorded before forking
+                if slot:
+                    REGISTRY.reset()
+                REGISTRY.peer_dir, REGISTRY.worker = self.metrics_dir, slot
+                print(f"👷 Worker {slot} started (pid {os.getpid()})")
+                asyncio.run(self.server.serve(self.sockets[slot]))
+            except BaseException as e:
+                print(f"❌ Worker {slot} failed: {e}")
+                code = 1
+            finally:
+                sys.stdout.flush()
+                os._exit(code)
+        self.children[pid] = slot
+        self.started[slot] = time.monotonic()
+
+    def stop(self, signum, frame):
+        self.stopping = True
+
+    def reap(self):
+        """Restart an exited worker; polls so a signal can end the loop"""
+        try:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            pid = 0
+        if not pid:
+            time.sleep(0.2)
+            return
+        slot = self.children.pop(pid, None)
+        if slot is None or self.stopping:
+            return
+        code = os.waitstatus_to_exitcode(status)
+        print(f"⚠️ Worker {slot} (pid {pid}) exited with {code}, restarting")
+        # Back off exponentially while a worker keeps dying right after start
+        if time.monotonic() - self.started[slot] < 5.0:
+            self.crashes[slot] = self.crashes.get(slot, 0) + 1
+        else:
+            self.crashes[slot] = 0
+        delay = min(RESTART_BACKOFF_MAX, 0.5 * (2 ** self.crashes[slot]) - 0.5)
+        deadline = time.monotonic() + delay
+        while not self.stopping and time.monotonic() < deadline:
+            time.sleep(0.1)
+        if not self.stopping:
+            self.spawn(slot)
+
+    def drain(self, grace: float = SHUTDOWN_GRACE):
+        """Forward SIGTERM so workers drain, then kill stragglers"""
+        print(f"\n🛑 Stopping {len(self.children)} workers, draining connections...")
+        for pid in self.children:
+            with suppress(ProcessLookupError):
+                os.kill(pid, signal.SIGTERM)
+        deadline = time.monotonic() + grace + 2.0
+        while self.children and time.monotonic() < deadline:
+            pid, _ = os.waitpid(-1, os.WNOHANG)
+            if pid:
+                self.children.pop(pid, None)
+            else:
+                time.sleep(0.05)
+        for pid in self.children:
+            with suppress(ProcessLookupError):
+                os.kill(pid, signal.SIGKILL)
+                os.waitpid(pid, 0)
+        self.children.clear()
+
+    def run(self):
+        self.bind()
+        mode = "SO_REUSEPORT" if self.reuse_port else "shared socket"
+        print(f"🧵 Pre-fork mode: {self.workers} workers ({mode})")
+        self.preload()
+        signal.signal(signal.SIGINT, self.stop)
+        signal.signal(signal.SIGTERM, self.stop)
+        for slot in range(self.workers):
+            self.spawn(slot)
+        try:
+            while not self.stopping:
+                self.reap()
+        finally:
+            self.drain()
+            for sock in set(self.sockets) - {None}:
+                sock.close()
+            if self.server.unix_sock is not None:
+                self.server.unix_sock.close()
+                with suppress(OSError):
+                    os.unlink(self.server.unix_socket)
+            shutil.rmtree(self.metrics_dir, ignore_errors=True)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Async Portainer template server")
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('--host', default=None,
+                        help="bind address (default: dual-stack '::', falling back to 0.0.0.0)")
+    parser.add_argument('--web-dir', default=str(Path(__file__).parent.absolute() / "web"))
+    parser.add_argument('--json-only', action='store_true',
+                        help="answer every GET with the catalog (json_only_server behaviour)")
+    parser.add_argument('--dashboard', action='store_true',
+                        help="serve the test dashboard on / and results on /test")
+    parser.add_argument('--max-connections', type=int, default=MAX_CONNECTIONS)
+    parser.add_argument('--keepalive-timeout', type=float, default=KEEPALIVE_TIMEOUT)
+    parser.add_argument('--max-keepalive-requests', type=int, default=MAX_KEEPALIVE_REQUESTS)
+    parser.add_argument('--quiet', action='store_true', help="disable per-request logging")
+    parser.add_argument('--access-log', default=None,
+                        help=f"JSON-lines access log file, '-' for stdout (default: ${ACCESS_LOG_ENV} or stdout)")
+    parser.add_argument('--timing-sample', type=float, default=None,
+                        help=f"fraction of requests timed per phase and answered with a Server-Timing "
+                             f"header (default: ${TIMING_ENV} or 0)")
+    parser.add_argument('--rate-limit', type=float, default=RATE_LIMIT,
+                        help="requests/second per client IP (default 0 = unlimited)")
+    parser.add_argument('--rate-burst', type=int, default=RATE_BURST)
+    parser.add_argument('--max-connections-per-ip', type=int, default=MAX_CONNECTIONS_PER_IP,
+                        help="concurrent connections per client IP (default 0 = unlimited)")
+    parser.add_argument('--unix-socket', metavar='PATH',
+                        help="also listen on a Unix domain socket (e.g. for a reverse proxy)")
+    parser.add_argument('--socket-mode', type=lambda value: int(value, 8), default=SOCKET_MODE,
+                        help=f"octal permissions of the Unix socket (default {SOCKET_MODE:o})")
+    parser.add_argument('--no-tcp', dest='tcp', action='store_false',
+                        help="listen on the Unix socket only")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="worker processes sharing the port (0 = one per CPU core)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    server = AsyncTemplateServer(
+        args.web_dir, port=args.port, host=args.host, json_only=args.json_only,
+        dashboard=args.dashboard, max_connections=args.max_connections,
+        keepalive_timeout=args.keepalive_timeout,
+        max_keepalive_requests=args.max_keepalive_requests, quiet=args.quiet,
+        unix_socket=args.unix_socket, socket_mode=args.socket_mode, tcp=args.tcp,
+    )
+    if not args.tcp and not args.unix_socket:
+        print("❌ --no-tcp needs --unix-socket")
+        sys.exit(2)
+    if args.access_log is not None:
+        ACCESS_LOG.configure(args.access_log)
+    if args.timing_sample is not None:
+        SAMPLER.configure(args.timing_sample)
+    if SAMPLER.rate:
+        print(f"⏱️ Server-Timing on {SAMPLER.rate:.0%} of requests")
+    if args.rate_limit > 0 or args.max_connections_per_ip > 0:
+        server.rate_limiter = ClientLimiter(args.rate_limit, args.rate_burst,
+                                            args.max_connections_per_ip)
+        print(f"🚦 Per-IP limits: {args.rate_limit:g} req/s (burst {args.rate_burst}), "
+              f"{args.max_connections_per_ip} connections")
+
+    if not server.cache.path.exists():
+        print(f"❌ {TEMPLATE_FILENAME} not found in {server.web_dir}")
+        sys.exit(1)
+
+    print("🚀 Starting Async Portainer Template Server...")
+    print(f"📂 Serving directory: {server.web_dir}")
+    if args.tcp:
+        print(f"🔗 Template URL (IPv4): http://localhost:{args.port}{TEMPLATE_PATH}")
+        print(f"🔗 Template URL (IPv6): http://[::1]:{args.port}{TEMPLATE_PATH}")
+    if args.unix_socket:
+        print(f"🔌 Unix socket: curl --unix-socket {args.unix_socket} http://localhost{TEMPLATE_PATH}")
+    print(f"🪶 Lean URL (Portainer fields only): http://localhost:{args.port}{LEAN_PATH}")
+    print(f"🔎 Filter API: http://localhost:{args.port}{TEMPLATES_PATH}?category=database&q=postgres")
+    print(f"🧩 Single template: http://localhost:{args.port}{TEMPLATES_PATH}/1 "
+          f"or {TEMPLATES_PATH}/by-name/nginx")
+    print(f"🧬 Composed catalogs: http://localhost:{args.port}{COMPOSE_PATH} "
+          f"or {COMPOSE_PREFIX}complete")
+    print(f"🔁 Changes feed: http://localhost:{args.port}{CHANGES_PATH}?since=<version>")
+    print(f"📈 Metrics: http://localhost:{args.port}{METRICS_PATH}")
+    print(f"❤️ Probes: http://localhost:{args.port}{HEALTH_PATH} and {READY_PATH}")
+    if args.json_only:
+        print("📄 JSON-only mode: every path serves the catalog")
+    if args.dashboard:
+        print(f"🧪 Test Dashboard: http://localhost:{args.port}/")
+    print("🔄 Server is running... (Ctrl+C to stop)")
+
+    workers = args.workers or os.cpu_count() or 1
+    if workers > 1:
+        WorkerSupervisor(server, workers).run()
+    else:
+        asyncio.run(server.serve())
+
+
+if __name__ == "__main__":
+    main()
@@ -6,7 +6,6 @@ This server starts both IPv4 and IPv6 listeners to handle Portainer's connection
 
 import http.server
 import socketserver
-import json
 import os
 import sys
 import socket
@@ -14,10 +13,19 @@ import threading
 import time
 from pathlib import Path
 
+from rate_limiter import ClientLimiter, RateLimitedServerMixin, RateLimitMixin
+from template_cache import (
+    CACHE_CONTROL, CachedCatalogMixin, KeepAliveMixin, TemplateCache, report_listening, start_warmup,
+)
+from template_compose import CatalogComposer
+from template_variants import VariantStore
+from worker_pool import BoundedPoolServerMixin, WorkerPool
+
 # Configuration
 PORT = 8091
 
-class CORSHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
+class CORSHTTPRequestHandler(RateLimitMixin, KeepAliveMixin, CachedCatalogMixin,
+                             http.server.SimpleHTTPRequestHandler):
     """HTTP handler with CORS headers for Portainer compatibility"""
     
     def end_headers(self):
@@ -25,20 +33,18 @@ class CORSHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
         self.send_header('Access-Control-Allow-Origin', '*')
         self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
         self.send_header('Access-Control-Allow-Headers', 'Content-Type')
-        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Cache-Control', CACHE_CONTROL)
         super().end_headers()
     
     def do_OPTIONS(self):
         """Handle preflight OPTIONS requests"""
-        self.send_response(200)
-        self.end_headers()
+        self.send_empty_response(200)
     
     def guess_type(self, path):
         """Override to ensure JSON files have correct content type"""
-        mimetype, encoding = super().guess_type(path)
         if path.endswith('.json'):
-            return 'application/json', encoding
-        return mimetype, encoding
+            return 'application/json'
+        return super().guess_type(path)
     
     def log_message(self, format, *args):
         """Custom log format"""
@@ -47,8 +53,9 @@ class CORSHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
             client_ip = f"[{client_ip}]"
         print(f"[{client_ip}] {format % args}")
 
-class ThreadedTCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
-    """Threaded TCP Server for better performance"""
+class ThreadedTCPServer(RateLimitedServerMixin, BoundedPoolServerMixin,
+                        socketserver.ThreadingMixIn, socketserver.TCPServer):
+    """Threaded TCP Server with optional per-IP limits and a bounded worker pool"""
     allow_reuse_address = True
     daemon_threads = True
 
@@ -66,6 +73,7 @@ def start_server(host, port, addr_family, server_name):
         
         server = CustomTCPServer((host, port), CORSHTTPRequestHandler)
         print(f"✅ {server_name} server started on {host}:{port}")
+        report_listening()
         server.serve_forever()
         
     except Exception as e:
@@ -86,15 +94,25 @@ def main():
         print("❌ portainer-template.json not found in web directory!")
         sys.exit(1)
     
-    # Validate JSON and count templates
-    try:
-        with open(template_file, 'r') as f:
-            data = json.load(f)
-            template_count = len(data.get('templates', []))
-            print(f"✅ Template validation successful - {template_count} templates found")
-    except Exception as e:
-        print(f"❌ Template validation failed: {e}")
-        sys.exit(1)
+    # Validate JSON in the background; the raw file is served until it is ready
+    cache = TemplateCache(template_file)
+    start_warmup(cache)
+    CORSHTTPRequestHandler.template_cache = cache
+    # Other catalog variants share one deduplicated in-memory copy
+    CORSHTTPRequestHandler.variant_store = VariantStore(web_dir).start()
+    # Combined catalogs from config/compositions.json, built on first request
+    CORSHTTPRequestHandler.composer = CatalogComposer()
+    # One limiter for both listeners, so IPv4 and IPv4-mapped IPv6 clients share it
+    ThreadedTCPServer.rate_limiter = ClientLimiter.from_env()
+    if ThreadedTCPServer.rate_limiter:
+        limiter = ThreadedTCPServer.rate_limiter
+        print(f"🚦 Per-IP limits: {limiter.rate:g} req/s (burst {limiter.burst}), "
+              f"{limiter.max_connections} connections")
+    # ...and one worker pool, so the bound covers both listeners
+    ThreadedTCPServer.worker_pool = WorkerPool.from_env()
+    if ThreadedTCPServer.worker_pool:
+        pool = ThreadedTCPServer.worker_pool
+        print(f"🧵 Worker pool: {pool.workers} workers, queue of {pool.pending.maxsize}")
     
     # Change to web directory
     os.chdir(str(web_dir))
@@ -103,7 +121,7 @@ def main():
     print(f"📂 Serving directory: {web_dir}")
     print(f"🔗 Template URL (IPv4): http://localhost:{PORT}/portainer-template.json")
     print(f"🔗 Template URL (IPv6): http://[::1]:{PORT}/portainer-template.json")
-    print(f"📊 Templates available: {template_count}")
+    print(f"🧬 Composed catalogs: http://localhost:{PORT}/catalogs")
     
     # Start servers in separate threads
     servers = []
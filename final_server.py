@@ -10,16 +10,18 @@ from http.server import SimpleHTTPRequestHandler
 import os
 import socket
 
+from template_cache import (
+    CACHE_CONTROL, CachedCatalogMixin, TemplateCache, TEMPLATE_FILENAME, report_listening, start_warmup,
+)
+
 PORT = 8091
 
-class CORSRequestHandler(SimpleHTTPRequestHandler):
+class CORSRequestHandler(CachedCatalogMixin, SimpleHTTPRequestHandler):
     def end_headers(self):
         self.send_header('Access-Control-Allow-Origin', '*')
         self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
         self.send_header('Access-Control-Allow-Headers', 'Content-Type')
-        self.send_header('Cache-Control', 'no-cache, no-store, must-revalidate')
-        self.send_header('Pragma', 'no-cache')
-        self.send_header('Expires', '0')
+        self.send_header('Cache-Control', CACHE_CONTROL)
         super().end_headers()
 
     def do_OPTIONS(self):
@@ -53,10 +55,12 @@ class DualStackTCPServer(socketserver.TCPServer):
             print("✅ IPv4 server started")
 
 def main():
-    os.chdir('/home/holythreekingstreescrowns/Schreibtisch/Portainer Template/web')
+    os.chdir(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'web'))
     
     print(f"🚀 Starting Final Portainer Template Server")
     print(f"📂 Serving from: {os.getcwd()}")
+    CORSRequestHandler.template_cache = TemplateCache(TEMPLATE_FILENAME)
+    start_warmup(CORSRequestHandler.template_cache)
     
     try:
         with DualStackTCPServer(("", PORT), CORSRequestHandler) as httpd:
@@ -64,6 +68,7 @@ def main():
             print(f"🔗 IPv6 URL: http://[::1]:{PORT}/portainer-template.json")
             print("✅ CORS headers enabled for Portainer compatibility")
             print("🔄 Server running... (Ctrl+C to stop)")
+            report_listening()
             
             httpd.serve_forever()
     except KeyboardInterrupt:
@@ -6,44 +6,28 @@ Only serves JSON content with proper CORS headers
 
 import http.server
 import socketserver
-import json
 import socket
 from pathlib import Path
 
+from template_cache import (
+    CACHE_CONTROL, CachedCatalogMixin, KeepAliveMixin, TemplateCache, report_listening, start_warmup,
+)
+
 PORT = 8091
 
-class JSONOnlyHandler(http.server.BaseHTTPRequestHandler):
+class JSONOnlyHandler(KeepAliveMixin, CachedCatalogMixin, http.server.BaseHTTPRequestHandler):
     """Handler that only serves JSON with proper headers"""
     
-    def do_GET(self):
-        # Only serve the portainer-template.json file
-        template_file = Path("portainer-template.json")
-        
-        if not template_file.exists():
-            self.send_error(404, "Template file not found")
-            return
-        
-        try:
-            with open(template_file, 'r', encoding='utf-8') as f:
-                content = f.read()
-            
-            # Validate JSON
-            json.loads(content)
-            
-            # Send response
-            self.send_response(200)
-            self.send_header('Content-Type', 'application/json; charset=utf-8')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.send_header('Access-Control-Allow-Methods', 'GET, OPTIONS')
-            self.send_header('Access-Control-Allow-Headers', 'Content-Type')
-            self.send_header('Cache-Control', 'no-cache, must-revalidate')
-            self.send_header('Content-Length', str(len(content.encode('utf-8'))))
-            self.end_headers()
-            
-            self.wfile.write(content.encode('utf-8'))
-            
-        except Exception as e:
-            self.send_error(500, f"Error reading template: {e}")
+    catalog_headers = (
+        ('Access-Control-Allow-Origin', '*'),
+        ('Access-Control-Allow-Methods', 'GET, OPTIONS'),
+        ('Access-Control-Allow-Headers', 'Content-Type'),
+        ('Cache-Control', CACHE_CONTROL),
+    )
+    
+    def is_catalog_request(self):
+        # Every path serves the portainer-template.json file
+        return True
     
     def do_OPTIONS(self):
         """Handle CORS preflight requests"""
@@ -51,15 +35,17 @@ class JSONOnlyHandler(http.server.BaseHTTPRequestHandler):
         self.send_header('Access-Control-Allow-Origin', '*')
         self.send_header('Access-Control-Allow-Methods', 'GET, OPTIONS')
         self.send_header('Access-Control-Allow-Headers', 'Content-Type')
+        self.send_header('Content-Length', '0')
         self.end_headers()
     
     def log_message(self, format, *args):
         """Custom log format"""
         print(f"🔗 [JSON Server] {format % args}")
 
-class DualStackTCPServer(socketserver.TCPServer):
+class DualStackTCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
     """TCP Server with IPv4/IPv6 dual-stack support"""
     allow_reuse_address = True
+    daemon_threads = True
     
     def __init__(self, server_address, RequestHandlerClass):
         # Try IPv6 with dual-stack first
@@ -84,7 +70,7 @@ class DualStackTCPServer(socketserver.TCPServer):
 def main():
     # Change to web directory where the template file is
     import os
-    web_dir = "/home/holythreekingstreescrowns/Schreibtisch/Portainer Template/web"
+    web_dir = Path(__file__).parent.absolute() / "web"
     os.chdir(web_dir)
     
     # Validate template file exists and is valid JSON
@@ -93,25 +79,20 @@ def main():
         print("❌ portainer-template.json not found!")
         return
     
-    try:
-        with open(template_file, 'r') as f:
-            data = json.load(f)
-            template_count = len(data.get('templates', []))
-            print(f"✅ {template_count} templates validated")
-    except Exception as e:
-        print(f"❌ Template validation failed: {e}")
-        return
+    cache = TemplateCache(template_file)
+    start_warmup(cache)
+    JSONOnlyHandler.template_cache = cache
     
     print(f"🚀 Starting JSON-only Portainer Template Server")
     print(f"📂 Serving from: {web_dir}")
     print(f"🔗 Template URL: http://localhost:{PORT}/")
     print(f"🔗 IPv6 URL: http://[::1]:{PORT}/")
-    print(f"📊 Templates: {template_count}")
     print("✅ CORS headers enabled for Portainer")
     
     try:
         with DualStackTCPServer(("", PORT), JSONOnlyHandler) as httpd:
             print(f"🔄 Server running on port {PORT}... (Ctrl+C to stop)")
+            report_listening()
             httpd.serve_forever()
     except KeyboardInterrupt:
         print("\n🛑 Server stopped by user")
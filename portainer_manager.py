@@ -41,7 +41,20 @@ class PortainerTemplateManager:
         
         # Step 1: Fetch templates
         print("\n📥 Step 1: Fetching templates from sources...")
-        await self.fetcher.run(sources)
+        outcome = await self.fetcher.run(sources)
+        if outcome is not None and not outcome['updated']:
+            failed = outcome['failed']
+            if failed:
+                # Nothing new to merge; merging now would only drop the failed sources
+                total = len(failed) + len(outcome['unchanged'])
+                scope = f"All {total}" if len(failed) == total else f"{len(failed)} of {total}"
+                print(f"\n❌ {scope} sources failed to fetch and none changed - "
+                      f"merged templates left as they are")
+                return False
+            if (self.merger.output_dir / "master_templates.json").exists():
+                # Conditional fetch found nothing new: the merged output is current
+                print("\n✅ No source changed upstream - merged templates are up to date")
+                return True
         
         # Step 2: Validate templates (optional)
         if validate:
@@ -177,10 +190,12 @@ Examples:
     update_parser = subparsers.add_parser('update', help='Perform full update cycle')
     update_parser.add_argument('--no-validate', action='store_true', help='Skip validation step')
     update_parser.add_argument('--sources', help='Comma-separated list of sources to fetch')
+    update_parser.add_argument('--force', action='store_true', help='Download and merge even if sources are unchanged')
     
     # Fetch command
     fetch_parser = subparsers.add_parser('fetch', help='Fetch templates from sources')
     fetch_parser.add_argument('--sources', help='Comma-separated list of sources to fetch')
+    fetch_parser.add_argument('--force', action='store_true', help='Download even if sources are unchanged')
     
     # Merge command
     merge_parser = subparsers.add_parser('merge', help='Merge individual templates')
@@ -206,11 +221,14 @@ Examples:
         return
     
     manager = PortainerTemplateManager()
+    manager.fetcher.force = getattr(args, 'force', False)
     
     try:
         if args.command == 'update':
             source_list = args.sources.split(',') if args.sources else None
-            await manager.full_update(validate=not args.no_validate, sources=source_list)
+            success = await manager.full_update(validate=not args.no_validate, sources=source_list)
+            if not success:
+                sys.exit(1)
         
         elif args.command == 'fetch':
             source_list = args.sources.split(',') if args.sources else None
@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""
+Rate Limiter - per-client token buckets and connection caps
+Keeps one small entry per client IP (IPv4-mapped IPv6 addresses count as
+their IPv4 address) and answers over-limit clients with 429 Too Many
+Requests + Retry-After. Entries are kept in last-use order: those whose
+bucket has refilled and that have no open connections carry no state and
+are expired from the old end a few at a time, and a full table evicts its
+least recently used clients, so every lookup does bounded work however
+many distinct clients (e.g. rotating IPv6 addresses) show up.
+"""
+
+import ipaddress
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from template_metrics import REGISTRY
+
+# Defaults, overridable with TEMPLATE_RATE_LIMIT / TEMPLATE_RATE_BURST /
+# TEMPLATE_MAX_CONNECTIONS_PER_IP; 0 disables the respective limit. Both
+# limits are opt-in: Portainer instances and health checkers behind one
+# NAT address would otherwise share a single client's budget. For a
+# server exposed directly to untrusted clients, e.g. 10 req/s and 20
+# connections per IP are reasonable starting points.
+RATE_LIMIT = 0.0                  # sustained requests per second per client
+RATE_BURST = 50                   # requests a client may send back-to-back
+MAX_CONNECTIONS_PER_IP = 0        # concurrent connections per client
+MAX_CLIENTS = 65536               # cap on tracked clients without open connections
+EXPIRE_BATCH = 4                  # oldest entries examined per new client
+
+
+def client_key(address) -> str:
+    """Normalized client IP: "::ffff:192.0.2.1" and "192.0.2.1" are one client"""
+    host = address[0] if isinstance(address, tuple) else str(address)
+    host = host.split('%', 1)[0]
+    try:
+        ip = ipaddress.ip_address(host)
+    except ValueError:
+        return host
+    if ip.version == 6 and ip.ipv4_mapped is not None:
+        ip = ip.ipv4_mapped
+    return str(ip)
+
+
+class Client:
+    __slots__ = ('tokens', 'updated', 'connections')
+
+    def __init__(self, tokens: float, now: float):
+        self.tokens = tokens
+        self.updated = now
+        self.connections = 0
+
+
+class ClientLimiter:
+    """Token bucket per client IP plus a cap on its concurrent connections"""
+
+    def __init__(self, rate: float = RATE_LIMIT, burst: int = RATE_BURST,
+                 max_connections: int = MAX_CONNECTIONS_PER_IP, max_clients: int = MAX_CLIENTS):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.max_connections = max_connections
+        self.max_clients = max_clients
+        # Least recently used first
+        self.clients: 'OrderedDict[str, Client]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> Optional['ClientLimiter']:
+        """Limiter configured from the environment, or None if everything is disabled"""
+        rate = float(os.environ.get('TEMPLATE_RATE_LIMIT', RATE_LIMIT))
+        burst = int(os.environ.get('TEMPLATE_RATE_BURST', RATE_BURST))
+        connections = int(os.environ.get('TEMPLATE_MAX_CONNECTIONS_PER_IP', MAX_CONNECTIONS_PER_IP))
+        if rate <= 0 and connections <= 0:
+            return None
+        return cls(rate, burst, connections)
+
+    def _client(self, key: str, now: float) -> Client:
+        client = self.clients.get(key)
+        if client is not None:
+            self.clients.move_to_end(key)
+            return client
+        self._expire(now)
+        client = self.clients[key] = Client(float(self.burst), now)
+        return client
+
+    def _expire(self, now: float):
+        """Make room for a new client with bounded work (lock held)
+
+        Looks at no more than EXPIRE_BATCH of the least recently used
+        entries: ones indistinguishable from a new client are dropped, and
+        while the table is full the others go too. Entries with open
+        connections are kept (their counts must survive) and moved to the
+        recent end, so the table can only outgrow ``max_clients`` by
+        clients holding connections.
+        """
+        refill = self.burst / self.rate if self.rate > 0 else 0.0
+        for _ in range(min(EXPIRE_BATCH, len(self.clients))):
+            key, client = next(iter(self.clients.items()))
+            if client.connections:
+                self.clients.move_to_end(key)
+            elif now - client.updated >= refill or len(self.clients) >= self.max_clients:
+                del self.clients[key]
+            else:
+                break
+
+    def acquire(self, key: str) -> float:
+        """Take one request token; 0.0 if allowed, else seconds until one is available"""
+        if self.rate <= 0:
+            return 0.0
+        now = time.monotonic()
+        with self._lock:
+            client = self._client(key, now)
+            client.tokens = min(self.burst, client.tokens + (now - client.updated) * self.rate)
+            client.updated = now
+            if client.tokens >= 1.0:
+                client.tokens -= 1.0
+                return 0.0
+            wait = (1.0 - client.tokens) / self.rate
+        REGISTRY.inc('template_server_rate_limited_total', ('requests',))
+        return wait
+
+    def open_connection(self, key: str) -> bool:
+        """Count a new connection; False if the client is at its cap"""
+        if self.max_connections <= 0:
+            return True
+        with self._lock:
+            client = self._client(key, time.monotonic())
+            if client.connections >= self.max_connections:
+                allowed = False
+            else:
+                client.connections += 1
+                allowed = True
+        if not allowed:
+            REGISTRY.inc('template_server_rate_limited_total', ('connections',))
+        return allowed
+
+    def close_connection(self, key: str):
+        if self.max_connections <= 0:
+            return
+        with self._lock:
+            client = self.clients.get(key)
+            if client is not None and client.connections > 0:
+                client.connections -= 1
+
+
+def retry_after(seconds: float) -> str:
+    """Retry-After value: whole seconds, at least 1"""
+    return str(max(1, math.ceil(seconds)))
+
+
+def too_many_requests(seconds: float) -> bytes:
+    """Complete 429 response for sockets that never reach a request handler"""
+    body = b"Too many connections from this client\n"
+    return (f"HTTP/1.1 429 Too Many Requests\r\n"
+            f"Retry-After: {retry_after(seconds)}\r\n"
+            f"Content-Type: text/plain; charset=utf-8\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: close\r\n\r\n").encode('latin-1') + body
+
+
+class RateLimitedServerMixin:
+    """socketserver mixin enforcing per-IP connection caps before a thread is spawned
+
+    Set ``rate_limiter`` (a ClientLimiter) on the server; None disables it.
+    """
+
+    rate_limiter: Optional[ClientLimiter] = None
+
+    def verify_request(self, request, client_address) -> bool:
+        limiter = self.rate_limiter
+        if limiter is None:
+            return super().verify_request(request, client_address)
+        key = client_key(client_address)
+        if not limiter.open_connection(key):
+            try:
+                request.settimeout(1.0)
+                request.sendall(too_many_requests(1.0))
+            except OSError:
+                pass
+            return False
+        if not hasattr(self, 'limited_connections'):
+            self.limited_connections: Dict[int, str] = {}
+        self.limited_connections[id(request)] = key
+        return True
+
+    def shutdown_request(self, request):
+        key = getattr(self, 'limited_connections', {}).pop(id(request), None)
+        if key is not None:
+            self.rate_limiter.close_connection(key)
+        super().shutdown_request(request)
+
+
+class RateLimitMixin:
+    """http.server handler mixin answering over-rate clients with 429
+
+    Uses the ``rate_limiter`` of the server the handler belongs to.
+    """
+
+    def parse_request(self) -> bool:
+        if not super().parse_request():
+            return False
+        limiter = getattr(self.server, 'rate_limiter', None)
+        if limiter is None:
+            return True
+        wait = limiter.acquire(client_key(self.client_address))
+        if not wait:
+            return True
+        self.close_connection = True
+        body = b"Rate limit exceeded\n"
+        self.send_response(429)
+        self.send_header('Retry-After', retry_after(wait))
+        self.send_header('Content-Type', 'text/plain; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+        return False
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Request Timing - sampled per-phase timings for Server-Timing and metrics
+A sampled request carries a RequestTiming in a context variable; code on
+the request path wraps its phases (cache lookup, filtering, json
+serialization, compression, socket write) in ``timed(name)``. The
+phases finished before the headers go out are sent as a Server-Timing
+header, and all of them are recorded in the metrics registry and the
+access log. Unsampled requests only pay for a context variable lookup
+per phase.
+"""
+
+import os
+import random
+import time
+from contextlib import nullcontext
+from contextvars import ContextVar
+from typing import Dict, Optional
+
+from template_metrics import REGISTRY
+
+# Fraction of requests timed, from TEMPLATE_TIMING_SAMPLE: 0 (default) off,
+# 1 every request
+TIMING_ENV = "TEMPLATE_TIMING_SAMPLE"
+
+# Timing of the current request, None when it was not sampled
+TIMING: ContextVar[Optional['RequestTiming']] = ContextVar('request_timing', default=None)
+
+NO_PHASE = nullcontext()
+
+
+class RequestTiming:
+    """Phase durations of one request, in nanoseconds (repeated phases add up)
+
+    Phases may nest: "select" includes the "serialize" and "compress"
+    work of a cache miss.
+    """
+
+    __slots__ = ('started', 'phases')
+
+    def __init__(self):
+        self.started = time.perf_counter_ns()
+        self.phases: Dict[str, int] = {}
+
+    def add(self, name: str, duration_ns: int):
+        self.phases[name] = self.phases.get(name, 0) + duration_ns
+
+    def header(self) -> str:
+        """Server-Timing value, with "total" up to now (i.e. to the headers)"""
+        total = time.perf_counter_ns() - self.started
+        metrics = [f"{name};dur={ns / 1e6:.3f}" for name, ns in self.phases.items()]
+        metrics.append(f"total;dur={total / 1e6:.3f}")
+        return ", ".join(metrics)
+
+    def as_dict(self) -> Dict[str, float]:
+        """Phase durations in milliseconds, for the access log"""
+        return {name: round(ns / 1e6, 3) for name, ns in self.phases.items()}
+
+    def observe(self):
+        for name, ns in self.phases.items():
+            REGISTRY.observe('template_server_phase_duration_seconds', ns / 1e9, (name,))
+
+
+class Phase:
+    __slots__ = ('timing', 'name', 'started')
+
+    def __init__(self, timing: RequestTiming, name: str):
+        self.timing = timing
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        self.timing.add(self.name, time.perf_counter_ns() - self.started)
+        return False
+
+
+def timed(name: str):
+    """Context manager timing a phase of the current request (no-op if unsampled)"""
+    timing = TIMING.get()
+    return NO_PHASE if timing is None else Phase(timing, name)
+
+
+class TimingSampler:
+    """Decides per request whether it is timed"""
+
+    def __init__(self, rate: float = 0.0):
+        self.configure(rate)
+
+    @classmethod
+    def from_env(cls) -> 'TimingSampler':
+        return cls(float(os.environ.get(TIMING_ENV, 0) or 0))
+
+    def configure(self, rate: float):
+        self.rate = min(max(rate, 0.0), 1.0)
+
+    def start(self) -> Optional[RequestTiming]:
+        """Begin a request: set (and return) its timing, or None if not sampled"""
+        rate = self.rate
+        timing = (RequestTiming()
+                  if rate and (rate >= 1.0 or random.random() < rate) else None)
+        TIMING.set(timing)
+        return timing
+
+
+# Process-wide sampler shared by every server in this repository
+SAMPLER = TimingSampler.from_env()
@@ -0,0 +1,533 @@
+#!/usr/bin/env python3
+"""
+Template Server Benchmark
+
+Starts template server engines (in-process targets or the real server
+scripts) on loopback ports and drives them with an asyncio HTTP/1.1 load
+generator. Reports requests/second, latency percentiles, error rate and
+server RSS, optionally as JSON; --compare prints the change against an
+earlier report. Engine changes to the servers should come with
+before/after numbers from this tool.
+
+The async-uds target listens on a Unix domain socket only. With --proxy
+every target sits behind a minimal TCP relay (one upstream connection
+per client connection, like a reverse proxy), so "async" vs "async-uds"
+compares the proxy-to-server hop over loopback TCP and over a Unix socket.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import importlib
+import itertools
+import json
+import multiprocessing
+import os
+import socket
+import socketserver
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from functools import partial
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Union
+
+PROJECT_DIR = Path(__file__).parent.parent.absolute()
+sys.path.insert(0, str(PROJECT_DIR))
+
+DEFAULT_WEB_DIR = PROJECT_DIR / "web"
+DEFAULT_PATH = "/portainer-template.json"
+
+# A TCP port on 127.0.0.1 or the path of a Unix domain socket
+Endpoint = Union[int, str]
+
+
+# -- server targets ------------------------------------------------------------
+
+def run_threaded_server(port: int, web_dir: str):
+    """Current path: dual_stack_server handler on a ThreadingTCPServer"""
+    import dual_stack_server
+    from access_log import ACCESS_LOG
+    from template_cache import TEMPLATE_FILENAME, TemplateCache
+
+    class QuietHandler(dual_stack_server.CORSHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+    os.chdir(web_dir)
+    ACCESS_LOG.configure('off')
+    QuietHandler.template_cache = TemplateCache(Path(web_dir) / TEMPLATE_FILENAME)
+    QuietHandler.template_cache.get()
+    server = dual_stack_server.ThreadedTCPServer(("127.0.0.1", port), QuietHandler)
+    server.serve_forever()
+
+
+def run_async_server(port: int, web_dir: str):
+    """Unified asyncio engine from async_template_server"""
+    from async_template_server import AsyncTemplateServer
+    from template_variants import VariantStore
+
+    server = AsyncTemplateServer(web_dir, port=port, host="127.0.0.1", quiet=True)
+    server.cache.get()
+    server.variants = VariantStore(web_dir).load()
+    asyncio.run(server.serve())
+
+
+def run_async_uds_server(path: str, web_dir: str):
+    """Unified asyncio engine listening on a Unix domain socket only"""
+    from async_template_server import AsyncTemplateServer
+    from template_variants import VariantStore
+
+    server = AsyncTemplateServer(web_dir, quiet=True, unix_socket=path, tcp=False)
+    server.cache.get()
+    server.variants = VariantStore(web_dir).load()
+    asyncio.run(server.serve())
+
+
+def run_prefork_server(port: int, web_dir: str):
+    """asyncio engine in pre-fork mode, one worker per core"""
+    from async_template_server import AsyncTemplateServer, WorkerSupervisor
+    from template_variants import VariantStore
+
+    server = AsyncTemplateServer(web_dir, port=port, host="127.0.0.1", quiet=True)
+    server.cache.get()
+    server.variants = VariantStore(web_dir).load()
+    WorkerSupervisor(server, os.cpu_count() or 1).run()
+
+
+# Addresses the script targets are bound to instead of every interface;
+# the IPv4-mapped one keeps dual-stack (IPv6) sockets reachable on 127.0.0.1
+LOOPBACK = {socket.AF_INET: "127.0.0.1", socket.AF_INET6: "::ffff:127.0.0.1"}
+
+
+def bind_loopback(server_bind):
+    """Wrap socketserver's server_bind to bind loopback whatever host the script asks for"""
+    def bind(self):
+        host = LOOPBACK.get(self.address_family, self.server_address[0])
+        self.server_address = (host,) + tuple(self.server_address[1:])
+        server_bind(self)
+    return bind
+
+
+def run_script_server(module_name: str, port: int, web_dir: str):
+    """One of the server scripts, unmodified apart from its PORT
+
+    The scripts always serve the repository's web/ catalog fixture; access
+    logging and per-IP rate limits are switched off so they measure the
+    engine, not the limiter. Their sockets are bound to loopback only.
+    """
+    socketserver.TCPServer.server_bind = bind_loopback(socketserver.TCPServer.server_bind)
+    os.environ['TEMPLATE_ACCESS_LOG'] = 'off'
+    os.environ['TEMPLATE_RATE_LIMIT'] = '0'
+    os.environ['TEMPLATE_MAX_CONNECTIONS_PER_IP'] = '0'
+    module = importlib.import_module(module_name)
+    module.PORT = port
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        module.main()
+
+
+SCRIPT_SERVERS = ('template_server', 'dual_stack_server', 'stable_server',
+                  'json_only_server', 'final_server')
+
+TARGETS = {
+    'threaded': run_threaded_server,
+    'async': run_async_server,
+    'async-uds': run_async_uds_server,
+    'prefork': run_prefork_server,
+}
+TARGETS.update({name: partial(run_script_server, name) for name in SCRIPT_SERVERS})
+# Targets given a socket path instead of a port
+UNIX_TARGETS = ('async-uds',)
+
+
+def run_relay(port: int, upstream: Endpoint):
+    """Minimal reverse proxy hop: relay each client connection to its own upstream connection"""
+    async def pipe(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                data = await reader.read(256 * 1024)
+                if not data:
+                    break
+                writer.write(data)
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            upstream_reader, upstream_writer = await open_endpoint(upstream)
+        except OSError:
+            writer.close()
+            return
+        sock = writer.get_extra_info('socket')
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        await asyncio.gather(pipe(reader, upstream_writer), pipe(upstream_reader, writer))
+
+    async def serve():
+        server = await asyncio.start_server(handle, "127.0.0.1", port, backlog=1024)
+        async with server:
+            await server.serve_forever()
+
+    asyncio.run(serve())
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def process_rss(pid: int) -> int:
+    """Resident set size in bytes of a process and its descendants (Linux /proc)"""
+    total = 0
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    total += int(line.split()[1]) * 1024
+        for task in os.listdir(f"/proc/{pid}/task"):
+            with open(f"/proc/{pid}/task/{task}/children") as f:
+                total += sum(process_rss(int(child)) for child in f.read().split())
+    except (OSError, ValueError):
+        pass
+    return total
+
+
+class RSSSampler(threading.Thread):
+    """Peak RSS of a server process tree, sampled while a run is in progress"""
+
+    def __init__(self, pid: int, interval: float = 0.1):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.interval = interval
+        self.peak = process_rss(pid)
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.peak = max(self.peak, process_rss(self.pid))
+
+    def stop(self) -> int:
+        self.stopped.set()
+        self.join()
+        return self.peak
+
+
+def open_endpoint(endpoint: Endpoint):
+    """asyncio stream pair to a loopback port or a Unix socket"""
+    if isinstance(endpoint, str):
+        return asyncio.open_unix_connection(endpoint)
+    return asyncio.open_connection("127.0.0.1", endpoint)
+
+
+def describe_endpoint(endpoint: Endpoint) -> str:
+    return f"unix:{endpoint}" if isinstance(endpoint, str) else f"127.0.0.1:{endpoint}"
+
+
+def wait_for_endpoint(endpoint: Endpoint, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if isinstance(endpoint, str):
+                with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+                    sock.settimeout(1)
+                    sock.connect(endpoint)
+            else:
+                with socket.create_connection(("127.0.0.1", endpoint), timeout=1):
+                    pass
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"server on {describe_endpoint(endpoint)} did not start")
+
+
+# -- load generator ------------------------------------------------------------
+
+async def read_response(reader: asyncio.StreamReader):
+    """Read one response; returns (status, headers, body_length)"""
+    head = await reader.readuntil(b"\r\n\r\n")
+    lines = head.decode('latin-1').split("\r\n")
+    version, status = lines[0].split(" ", 2)[:2]
+    headers = {}
+    for line in lines[1:]:
+        name, _, value = line.partition(":")
+        if name:
+            headers[name.strip().lower()] = value.strip()
+
+    length = headers.get('content-length')
+    if length is not None:
+        await reader.readexactly(int(length))
+        size = int(length)
+    elif status in ('204', '304'):
+        size = 0
+    else:
+        size = len(await reader.read())
+        headers['connection'] = 'close'
+
+    closes = headers.get('connection', '').lower() == 'close' or (
+        version == 'HTTP/1.0' and headers.get('connection', '').lower() != 'keep-alive')
+    return int(status), headers, size, closes
+
+
+async def load_worker(config: Dict, deadline: float, stats: Dict):
+    request_headers = ["Host: 127.0.0.1"]
+    if config['accept_encoding']:
+        request_headers.append(f"Accept-Encoding: {config['accept_encoding']}")
+    if config['etag']:
+        request_headers.append(f"If-None-Match: {config['etag']}")
+    if not config['keep_alive']:
+        request_headers.append("Connection: close")
+    request = (f"GET {config['path']} HTTP/1.1\r\n" + "\r\n".join(request_headers)
+               + "\r\n\r\n").encode('latin-1')
+
+    reader = writer = None
+    while time.monotonic() < deadline:
+        started = time.perf_counter()
+        try:
+            if writer is None:
+                reader, writer = await open_endpoint(config['endpoint'])
+            writer.write(request)
+            status, _, size, closes = await asyncio.wait_for(read_response(reader), config['timeout'])
+        except (OSError, asyncio.IncompleteReadError, asyncio.TimeoutError, ValueError):
+            stats['errors'] += 1
+            closes = True
+        else:
+            stats['latencies'].append(time.perf_counter() - started)
+            stats['bytes'] += size
+            if status >= 400:
+                stats['errors'] += 1
+            else:
+                stats['status'][status] = stats['status'].get(status, 0) + 1
+
+        # We asked for Connection: close, whether or not the server echoes it
+        if (closes or not config['keep_alive']) and writer is not None:
+            writer.close()
+            reader = writer = None
+    if writer is not None:
+        writer.close()
+
+
+async def run_load_async(config: Dict) -> Dict:
+    stats = {'latencies': [], 'errors': 0, 'bytes': 0, 'status': {}}
+    deadline = time.monotonic() + config['duration']
+    await asyncio.gather(*(load_worker(config, deadline, stats)
+                           for _ in range(config['connections'])))
+    return stats
+
+
+def run_load(config: Dict) -> Dict:
+    """Entry point for one load-generator process"""
+    return asyncio.run(run_load_async(config))
+
+
+def fetch_etag(endpoint: Endpoint, path: str, accept_encoding: Optional[str]) -> Optional[str]:
+    async def fetch():
+        reader, writer = await open_endpoint(endpoint)
+        headers = "Host: 127.0.0.1\r\nConnection: close\r\n"
+        if accept_encoding:
+            headers += f"Accept-Encoding: {accept_encoding}\r\n"
+        writer.write(f"GET {path} HTTP/1.1\r\n{headers}\r\n".encode('latin-1'))
+        _, response_headers, _, _ = await read_response(reader)
+        writer.close()
+        return response_headers.get('etag')
+    return asyncio.run(fetch())
+
+
+def wait_for_ready(endpoint: Endpoint, path: str, timeout: float = 60.0):
+    """Wait until the catalog comes from the validated snapshot (it carries an ETag)"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if fetch_etag(endpoint, path, None):
+                return
+        except (OSError, asyncio.IncompleteReadError, ValueError):
+            pass
+        time.sleep(0.2)
+    print(f"⚠️ No ETag from {describe_endpoint(endpoint)} after {timeout:.0f}s, benchmarking anyway")
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def benchmark(endpoint: Endpoint, args, concurrency: int, keep_alive: bool = True,
+              conditional: bool = False, accept_encoding: Optional[str] = None,
+              server_pid: Optional[int] = None) -> Dict:
+    etag = fetch_etag(endpoint, args.path, accept_encoding) if conditional else None
+    processes = max(1, min(args.client_processes, concurrency))
+    base = {
+        'endpoint': endpoint, 'path': args.path, 'duration': args.duration,
+        'keep_alive': keep_alive, 'accept_encoding': accept_encoding,
+        'etag': etag, 'timeout': args.timeout,
+    }
+    configs = []
+    for i in range(processes):
+        share = concurrency // processes + (1 if i < concurrency % processes else 0)
+        configs.append(dict(base, connections=share))
+
+    sampler = RSSSampler(server_pid) if server_pid else None
+    if sampler:
+        sampler.start()
+    started = time.perf_counter()
+    with multiprocessing.Pool(processes) as pool:
+        results = pool.map(run_load, configs)
+    elapsed = time.perf_counter() - started
+    peak_rss = sampler.stop() if sampler else 0
+
+    latencies = sorted(lat for result in results for lat in result['latencies'])
+    errors = sum(result['errors'] for result in results)
+    total = len(latencies) + errors
+    status_counts: Dict[str, int] = {}
+    for result in results:
+        for status, count in result['status'].items():
+            status_counts[str(status)] = status_counts.get(str(status), 0) + count
+    return {
+        'concurrency': concurrency,
+        'keep_alive': keep_alive,
+        'conditional': conditional,
+        'accept_encoding': accept_encoding or 'identity',
+        'requests': total,
+        'rps': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+        'error_rate': round(errors / total, 4) if total else 0.0,
+        'mb_received': round(sum(r['bytes'] for r in results) / 1e6, 1),
+        'status': status_counts,
+        'server_rss_mb': round(peak_rss / 1e6, 1) if peak_rss else None,
+    }
+
+
+def scenarios(args) -> List[Tuple[int, bool, bool, Optional[str]]]:
+    """(concurrency, keep_alive, conditional, accept_encoding) combinations to run"""
+    keep_alive = (True, False) if args.matrix else (args.keep_alive,)
+    conditional = (False, True) if args.matrix else (args.conditional,)
+    encodings = [None if e in ('', 'identity') else e for e in args.accept_encoding]
+    return list(itertools.product(args.concurrency, keep_alive, conditional, encodings))
+
+
+def scenario_key(result: Dict) -> Tuple:
+    return (result['concurrency'], result.get('keep_alive', True),
+            result.get('conditional', False), result.get('accept_encoding', 'identity'))
+
+
+def compare(report: Dict, baseline: Dict):
+    """Print RPS / p99 / RSS changes against an earlier report"""
+    print(f"📊 Compared with {baseline.get('timestamp', 'baseline')}:")
+    for name, runs in report['results'].items():
+        before = {scenario_key(r): r for r in baseline.get('results', {}).get(name, [])}
+        for run in runs:
+            old = before.get(scenario_key(run))
+            if old is None:
+                continue
+            rps = (run['rps'] - old['rps']) / old['rps'] * 100 if old['rps'] else 0.0
+            p99 = (run['p99_ms'] - old['p99_ms']) / old['p99_ms'] * 100 if old['p99_ms'] else 0.0
+            line = (f"   {name:<18} {describe(run):<34} rps {old['rps']:>9.1f} -> {run['rps']:>9.1f} "
+                    f"({rps:+.1f}%)  p99 {old['p99_ms']:.2f} -> {run['p99_ms']:.2f}ms ({p99:+.1f}%)")
+            if old.get('server_rss_mb') and run.get('server_rss_mb'):
+                line += f"  rss {old['server_rss_mb']} -> {run['server_rss_mb']}MB"
+            print(line)
+
+
+def describe(result: Dict) -> str:
+    return (f"c={result['concurrency']} {'ka' if result['keep_alive'] else 'close'}"
+            f"{' 304' if result['conditional'] else ''} {result['accept_encoding']}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the template server engines")
+    parser.add_argument('--targets', nargs='+', choices=sorted(TARGETS), default=sorted(TARGETS))
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 16, 64])
+    parser.add_argument('--duration', type=float, default=5.0, help="seconds per run")
+    parser.add_argument('--path', default=DEFAULT_PATH)
+    parser.add_argument('--web-dir', default=str(DEFAULT_WEB_DIR),
+                        help="catalog directory (in-process targets only; the server scripts "
+                             "always serve the repository's web/)")
+    parser.add_argument('--accept-encoding', nargs='+', default=['gzip'],
+                        help="one run per value; 'identity' sends no Accept-Encoding")
+    parser.add_argument('--keep-alive', action=argparse.BooleanOptionalAction, default=True)
+    parser.add_argument('--conditional', action='store_true',
+                        help="send If-None-Match with the current ETag (304 path)")
+    parser.add_argument('--matrix', action='store_true',
+                        help="run keep-alive on/off x conditional on/off for every setting")
+    parser.add_argument('--proxy', action='store_true',
+                        help="put a TCP relay in front of every target (proxied TCP vs Unix socket upstream)")
+    parser.add_argument('--client-processes', type=int, default=max(1, (os.cpu_count() or 2) // 2))
+    parser.add_argument('--timeout', type=float, default=10.0)
+    parser.add_argument('--warmup', type=float, default=3.0,
+                        help="seconds to wait after the server is ready before measuring")
+    parser.add_argument('--output', help="write results as JSON to this file")
+    parser.add_argument('--compare', metavar='BASELINE',
+                        help="earlier --output file to print before/after changes against")
+    args = parser.parse_args(argv)
+    scripts = [name for name in args.targets if name in SCRIPT_SERVERS]
+    if scripts and Path(args.web_dir).absolute() != DEFAULT_WEB_DIR:
+        # They would serve a different catalog than the other targets
+        parser.error(f"--web-dir is not supported by the script targets ({', '.join(scripts)}); "
+                     f"pick --targets from {', '.join(sorted(set(TARGETS) - set(SCRIPT_SERVERS)))}")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    report = {
+        'timestamp': time.strftime("%Y-%m-%dT%H:%M:%S"),
+        'settings': {k: v for k, v in vars(args).items() if k != 'output'},
+        'results': {},
+    }
+
+    socket_dir = tempfile.mkdtemp(prefix="template-bench-")
+    for name in args.targets:
+        endpoint = os.path.join(socket_dir, f"{name}.sock") if name in UNIX_TARGETS else free_port()
+        server = multiprocessing.Process(target=TARGETS[name], args=(endpoint, args.web_dir), daemon=True)
+        server.start()
+        relay = None
+        try:
+            wait_for_endpoint(endpoint)
+            wait_for_ready(endpoint, args.path)
+            # Let background work (e.g. loading the catalog variants) settle
+            time.sleep(args.warmup)
+            print(f"🚀 {name} server on {describe_endpoint(endpoint)}")
+            target = endpoint
+            if args.proxy:
+                target = free_port()
+                relay = multiprocessing.Process(target=run_relay, args=(target, endpoint), daemon=True)
+                relay.start()
+                wait_for_endpoint(target)
+                print(f"   via relay on 127.0.0.1:{target}")
+            runs = []
+            for concurrency, keep_alive, conditional, encoding in scenarios(args):
+                result = benchmark(target, args, concurrency, keep_alive, conditional, encoding,
+                                   server.pid)
+                runs.append(result)
+                rss = f" rss={result['server_rss_mb']}MB" if result['server_rss_mb'] else ""
+                print(f"   {describe(result):<28} {result['rps']:>10.1f} req/s  "
+                      f"p50={result['p50_ms']:.2f}ms p95={result['p95_ms']:.2f}ms "
+                      f"p99={result['p99_ms']:.2f}ms errors={result['error_rate']:.2%}{rss}")
+            report['results'][name] = runs
+        finally:
+            if relay is not None:
+                relay.terminate()
+                relay.join(5)
+            server.terminate()
+            server.join(5)
+    shutil.rmtree(socket_dir, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"📄 Results written to {args.output}")
+    if args.compare:
+        with open(args.compare) as f:
+            compare(report, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
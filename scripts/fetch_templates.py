@@ -4,8 +4,12 @@ Portainer Template Fetcher
 
 Downloads templates from configured sources and saves them individually.
 Supports concurrent downloads, retry logic, and progress tracking.
+Requests are conditional: the ETag / Last-Modified validators and content
+hash of the last download are kept in each file's _metadata, and a source
+answering 304 (or sending identical bytes) leaves its file untouched.
 """
 
+import hashlib
 import json
 import os
 import sys
@@ -28,12 +32,17 @@ class TemplateSource:
     active: bool
     category: str
 
+# _metadata keys carried from one download to the next
+VALIDATOR_KEYS = ('etag', 'last_modified', 'content_hash')
+
 class TemplateFetcher:
-    def __init__(self, config_path: str = "config/sources.json"):
+    def __init__(self, config_path: str = "config/sources.json", force: bool = False):
         self.config_path = Path(config_path)
         self.output_dir = Path("templates/individual")
         self.config = self._load_config()
         self.session: Optional[aiohttp.ClientSession] = None
+        # Ignore stored validators and download everything
+        self.force = force
         
     def _load_config(self) -> Dict:
         """Load configuration from JSON file."""
@@ -61,15 +70,54 @@ class TemplateFetcher:
         
         return sources
     
+    def load_validators(self, source: TemplateSource) -> Dict:
+        """Validators of the last successful download of a source (empty if none)."""
+        if self.force:
+            return {}
+        try:
+            with open(self.output_dir / f"{source.name}.json", 'r') as f:
+                metadata = json.load(f).get('_metadata') or {}
+        except (OSError, ValueError, AttributeError):
+            return {}
+        if metadata.get('status') != 'success' or metadata.get('source_url') != source.url:
+            return {}
+        return {key: metadata[key] for key in VALIDATOR_KEYS if metadata.get(key)}
+    
+    def unchanged(self, source: TemplateSource, validators: Dict, reason: str) -> Dict:
+        """Result for a source whose saved file is still current."""
+        return {
+            '_metadata': {
+                'source_name': source.name,
+                'source_url': source.url,
+                'status': 'unchanged',
+                'reason': reason,
+                'checked_at': time.time(),
+                **validators
+            }
+        }
+    
     async def fetch_template(self, source: TemplateSource) -> Dict:
-        """Fetch a single template from source."""
+        """Fetch a single template from source, conditionally if it was fetched before."""
         timeout = aiohttp.ClientTimeout(total=self.config['settings']['timeout_seconds'])
+        validators = self.load_validators(source)
+        headers = {}
+        if validators.get('etag'):
+            headers['If-None-Match'] = validators['etag']
+        if validators.get('last_modified'):
+            headers['If-Modified-Since'] = validators['last_modified']
         
         for attempt in range(self.config['settings']['retry_attempts']):
             try:
-                async with self.session.get(source.url, timeout=timeout) as response:
+                async with self.session.get(source.url, timeout=timeout, headers=headers) as response:
+                    if response.status == 304 and validators:
+                        return self.unchanged(source, validators, 'not modified')
                     if response.status == 200:
-                        content = await response.text()
+                        raw = await response.read()
+                        content_hash = 'sha256:' + hashlib.sha256(raw).hexdigest()
+                        if content_hash == validators.get('content_hash'):
+                            # Upstream ignored the validators but sent the same bytes
+                            return self.unchanged(source, validators, 'same content')
+                        content = raw.decode(response.get_encoding() or 'utf-8')
                         template_data = json.loads(content)
                         
                         # Add metadata
@@ -79,7 +127,10 @@ class TemplateFetcher:
                             'description': source.description,
                             'category': source.category,
                             'fetched_at': time.time(),
-                            'status': 'success'
+                            'status': 'success',
+                            'etag': response.headers.get('ETag'),
+                            'last_modified': response.headers.get('Last-Modified'),
+                            'content_hash': content_hash
                         }
                         
                         # Handle different template formats
@@ -169,12 +220,21 @@ class TemplateFetcher:
         finally:
             await self.session.close()
     
-    def save_templates(self, templates: Dict[str, Dict]) -> None:
-        """Save fetched templates to individual files."""
-        success_count = 0
-        failed_count = 0
+    def save_templates(self, templates: Dict[str, Dict]) -> Dict[str, List[str]]:
+        """Save fetched templates to individual files (unchanged sources are left alone).
+        
+        Returns the source names by outcome: 'updated', 'unchanged' and 'failed'.
+        """
+        updated = []
+        unchanged = []
+        failed = []
         
         for source_name, template_data in templates.items():
+            if template_data.get('_metadata', {}).get('status') == 'unchanged':
+                reason = template_data['_metadata'].get('reason', 'not modified')
+                click.echo(f"⏭️  {source_name}: unchanged ({reason}), file kept")
+                unchanged.append(source_name)
+                continue
             try:
                 output_file = self.output_dir / f"{source_name}.json"
                 with open(output_file, 'w') as f:
@@ -183,43 +243,45 @@ class TemplateFetcher:
                 if template_data.get('_metadata', {}).get('status') == 'success':
                     template_count = len(template_data.get('templates', []))
                     click.echo(f"✅ {source_name}: {template_count} templates saved")
-                    success_count += 1
+                    updated.append(source_name)
                 else:
                     error = template_data.get('_metadata', {}).get('error', 'Unknown error')
                     click.echo(f"❌ {source_name}: Failed - {error}")
-                    failed_count += 1
+                    failed.append(source_name)
                     
             except Exception as e:
                 click.echo(f"❌ {source_name}: Save failed - {e}")
-                failed_count += 1
+                failed.append(source_name)
         
-        click.echo(f"\n📊 Summary: {success_count} successful, {failed_count} failed")
+        click.echo(f"\n📊 Summary: {len(updated)} updated, {len(unchanged)} unchanged, {len(failed)} failed")
+        return {'updated': updated, 'unchanged': unchanged, 'failed': failed}
     
-    async def run(self, filter_sources: Optional[List[str]] = None) -> None:
-        """Main execution method."""
+    async def run(self, filter_sources: Optional[List[str]] = None) -> Optional[Dict[str, List[str]]]:
+        """Main execution method; returns save_templates' outcome (None if nothing ran)."""
         sources = self.get_active_sources(filter_sources)
         
         if not sources:
             click.echo("❌ No active sources found!")
-            return
+            return None
         
         click.echo(f"🚀 Fetching templates from {len(sources)} sources...")
         
         templates = await self.fetch_all_templates(sources)
-        self.save_templates(templates)
+        return self.save_templates(templates)
 
 @click.command()
 @click.option('--sources', '-s', help='Comma-separated list of source names to fetch')
 @click.option('--config', '-c', default='config/sources.json', help='Path to config file')
 @click.option('--output', '-o', default='templates/individual', help='Output directory')
-def main(sources: Optional[str], config: str, output: str):
+@click.option('--force', '-f', is_flag=True, help='Download every source even if unchanged upstream')
+def main(sources: Optional[str], config: str, output: str, force: bool):
     """Fetch Portainer templates from configured sources."""
     
     # Parse source filter
     source_filter = sources.split(',') if sources else None
     
     # Create fetcher
-    fetcher = TemplateFetcher(config)
+    fetcher = TemplateFetcher(config, force=force)
     fetcher.output_dir = Path(output)
     
     # Run async fetch
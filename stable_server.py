@@ -6,17 +6,23 @@ Robust server that stays running and handles both connection types
 
 import http.server
 import socketserver
-import json
 import socket
 import threading
 import time
 from pathlib import Path
 
+from template_cache import (
+    CACHE_CONTROL, CachedCatalogMixin, KeepAliveMixin, TemplateCache, report_listening, start_warmup,
+)
+from worker_pool import BoundedPoolServerMixin, WorkerPool
+
 PORT = 8091
 
-class StableHandler(http.server.SimpleHTTPRequestHandler):
+class StableHandler(KeepAliveMixin, CachedCatalogMixin, http.server.SimpleHTTPRequestHandler):
     """Stable handler that doesn't crash on requests"""
     
+    catalog_headers = (('Cache-Control', CACHE_CONTROL),)
+    
     def end_headers(self):
         self.send_header('Access-Control-Allow-Origin', '*')
         self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
@@ -24,8 +30,7 @@ class StableHandler(http.server.SimpleHTTPRequestHandler):
         super().end_headers()
     
     def do_OPTIONS(self):
-        self.send_response(200)
-        self.end_headers()
+        self.send_empty_response(200)
     
     def guess_type(self, path):
         if path.endswith('.json'):
@@ -33,11 +38,11 @@ class StableHandler(http.server.SimpleHTTPRequestHandler):
         return super().guess_type(path)
     
     def log_message(self, format, *args):
-        """Quiet logging to prevent crashes"""
+        """Quiet error logging; access records go to the non-blocking ACCESS_LOG"""
         pass
 
-class StableTCPServer(socketserver.ThreadingTCPServer):
-    """Stable TCP server with proper error handling"""
+class StableTCPServer(BoundedPoolServerMixin, socketserver.ThreadingTCPServer):
+    """Stable TCP server with proper error handling and a bounded worker pool"""
     allow_reuse_address = True
     daemon_threads = True
     
@@ -69,10 +74,10 @@ def main():
         print("❌ Template file not found!")
         return
     
-    with open(template_file) as f:
-        data = json.load(f)
-        count = len(data.get('templates', []))
-        print(f"✅ {count} templates loaded")
+    cache = TemplateCache(template_file)
+    start_warmup(cache)
+    StableHandler.template_cache = cache
+    StableTCPServer.worker_pool = WorkerPool.from_env()
     
     import os
     os.chdir(web_dir)
@@ -84,6 +89,7 @@ def main():
     try:
         server = StableTCPServer(("", PORT), StableHandler)
         print(f"✅ Server running on port {PORT}")
+        report_listening()
         print("🔄 Serving requests... (Ctrl+C to stop)")
         
         # Start server in daemon thread so it doesn't block
@@ -0,0 +1,1174 @@
+#!/usr/bin/env python3
+"""
+Shared Template Cache - In-memory serving core for the template servers
+Loads the Portainer catalog once, keeps the encoded bytes (identity, gzip
+and brotli) in memory and reloads only when the file on disk changes
+(mtime/size/inode polling). Responses carry strong ETags and Last-Modified
+so polling clients get cheap 304 Not Modified answers. Large encodings are
+also spooled to unlinked files so they can be sent with sendfile(2), with
+byte Range support for resumed downloads.
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import select
+import socket
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from functools import cached_property
+from email.utils import formatdate, parsedate_to_datetime
+from pathlib import Path
+from typing import BinaryIO, Dict, Iterable, List, Optional, Tuple
+from urllib.parse import parse_qs, unquote
+
+from access_log import ACCESS_LOG, CACHE_RESULT, access_record, note_cache
+from request_timing import SAMPLER, TIMING, timed
+from template_changes import CHANGES_PATH, CatalogVersion, VersionHistory, catalog_delta
+from template_index import TemplateIndex
+from template_metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, METRICS_PATH, REGISTRY
+
+try:
+    import brotli
+except ImportError:  # optional - gzip and identity are always available
+    brotli = None
+
+TEMPLATE_FILENAME = "portainer-template.json"
+TEMPLATE_PATH = "/" + TEMPLATE_FILENAME
+LEAN_PATH = "/portainer-template.lean.json"
+TEMPLATES_PATH = "/templates"
+# /templates/{id} and /templates/by-name/{name}
+TEMPLATE_LOOKUP_PREFIX = TEMPLATES_PATH + "/"
+BY_NAME_PREFIX = TEMPLATE_LOOKUP_PREFIX + "by-name/"
+# Composed multi-collection catalogs (template_compose): /catalogs/{name}
+COMPOSE_PATH = "/catalogs"
+COMPOSE_PREFIX = COMPOSE_PATH + "/"
+
+# Liveness (process answers) and readiness (valid, fresh catalog) probes
+HEALTH_PATH = "/healthz"
+READY_PATH = "/readyz"
+PROBE_PATHS = (HEALTH_PATH, READY_PATH)
+# Seconds after which an unchanged catalog file makes /readyz fail; 0 disables
+MAX_CATALOG_AGE = float(os.environ.get('TEMPLATE_MAX_CATALOG_AGE', 0))
+
+# Paths reported as-is in metrics labels; anything else is "static" or
+# "other" so scanners cannot blow up label cardinality
+METRIC_ROUTES = (TEMPLATE_PATH, LEAN_PATH, TEMPLATES_PATH, COMPOSE_PATH, METRICS_PATH,
+                 "/", "/test") + PROBE_PATHS
+
+# Encoded results of distinct /templates queries kept per catalog version
+QUERY_CACHE_SIZE = 128
+
+# Template fields defined by the Portainer v2/v3 App Templates format; the
+# lean projection drops everything else (gemstone/certification blocks,
+# documentation, deployment, monitoring, ...)
+PORTAINER_TEMPLATE_FIELDS = (
+    'id', 'type', 'title', 'description', 'administrator_only', 'name', 'logo',
+    'registry', 'image', 'repository', 'stackfile', 'command', 'env', 'network',
+    'volumes', 'ports', 'labels', 'privileged', 'interactive', 'restart_policy',
+    'hostname', 'note', 'platform', 'categories',
+)
+
+# How often (seconds) the file is stat()ed for changes; hot requests in
+# between never touch the disk.
+DEFAULT_CHECK_INTERVAL = 1.0
+
+GZIP_LEVEL = 9
+# Quality 11 is ~30x slower than 9 on the full catalog for ~10% smaller output
+BROTLI_QUALITY = 9
+
+# Server preference when the client accepts several encodings equally
+ENCODING_PREFERENCE = ('br', 'gzip', 'identity')
+
+# Let clients keep a copy but always revalidate it (ETag / Last-Modified)
+CACHE_CONTROL = 'no-cache'
+
+# Encodings at least this large are also spooled to a file for sendfile(2);
+# smaller bodies are cheaper to write straight from memory.
+SENDFILE_MIN_BYTES = 64 * 1024
+
+# Reference point for time-to-listen reporting
+IMPORTED_AT = time.perf_counter()
+
+# HTTP/1.1 persistent connections for the http.server based handlers
+KEEPALIVE_TIMEOUT = 15.0        # idle seconds before a kept-alive socket is closed
+SEND_TIMEOUT = 60.0             # seconds a request may take to be read and answered
+MAX_KEEPALIVE_REQUESTS = 100    # requests per connection before "Connection: close"
+IDLE_POLL_INTERVAL = 0.1        # seconds between pool queue checks of an idle pooled connection
+
+
+@dataclass(frozen=True)
+class Payload:
+    """Bytes to send for one response, optionally backed by a spool file
+
+    ``offset``/``length`` select a byte range of ``data`` (and of the
+    identical ``spool`` file) for 206 Partial Content responses.
+    """
+    data: bytes
+    spool: Optional[BinaryIO]
+    offset: int
+    length: int
+
+    def view(self) -> memoryview:
+        return memoryview(self.data)[self.offset:self.offset + self.length]
+
+
+def spool_bytes(data: bytes) -> BinaryIO:
+    """Copy bytes into an anonymous (already unlinked) file
+
+    Writers rewriting the catalog in place cannot affect it, and the
+    file goes away once the last request using it drops the object.
+    """
+    spool = tempfile.TemporaryFile()
+    spool.write(data)
+    spool.flush()
+    return spool
+
+
+@dataclass(frozen=True)
+class EncodedBody:
+    """One representation pre-encoded in every supported content-coding"""
+    encodings: Dict[str, bytes]
+    etags: Dict[str, str]
+    last_modified: str
+    content_type: str = 'application/json; charset=utf-8'
+    spools: Dict[str, BinaryIO] = field(default_factory=dict, repr=False, compare=False)
+
+    @classmethod
+    def build(cls, body: bytes, last_modified: str, **kwargs) -> 'EncodedBody':
+        with timed('compress'):
+            encodings = compress_variants(body)
+            etags = {coding: content_etag(encoded) for coding, encoded in encodings.items()}
+            spools = {coding: spool_bytes(encoded) for coding, encoded in encodings.items()
+                      if len(encoded) >= SENDFILE_MIN_BYTES}
+        return cls(encodings, etags, last_modified, spools=spools, **kwargs)
+
+    def payload(self, encoding: str, byte_range: Optional[Tuple[int, int]] = None) -> Payload:
+        data = self.encoded(encoding)
+        offset, length = byte_range if byte_range else (0, len(data))
+        return Payload(data, self.spools.get(encoding), offset, length)
+
+    @property
+    def identity(self) -> bytes:
+        return self.encodings['identity']
+
+    def encoded(self, encoding: str) -> bytes:
+        """Body bytes for a negotiated content-coding"""
+        return self.encodings.get(encoding, self.identity)
+
+    def etag(self, encoding: str) -> str:
+        """Strong ETag of the bytes served for a content-coding"""
+        return self.etags.get(encoding, self.etags['identity'])
+
+
+@dataclass(frozen=True)
+class CatalogSnapshot:
+    """Immutable, pre-encoded view of one version of the catalog file
+
+    Derived representations (e.g. the lean projection) are built on first
+    use and then kept for the lifetime of the snapshot.
+    """
+    path: str
+    data: dict
+    template_count: int
+    signature: Tuple[int, int, int]
+    loaded_at: float
+    version: str
+    last_modified: str
+    catalog: EncodedBody
+    index: TemplateIndex
+    query_cache: 'OrderedDict[tuple, EncodedBody]' = field(
+        default_factory=OrderedDict, repr=False, compare=False)
+    query_lock: threading.Lock = field(default_factory=threading.Lock, repr=False, compare=False)
+    template_bodies: Dict[Tuple[int, bool], EncodedBody] = field(
+        default_factory=dict, repr=False, compare=False)
+    fingerprint: Optional[CatalogVersion] = field(default=None, repr=False, compare=False)
+    history: Optional[VersionHistory] = field(default=None, repr=False, compare=False)
+    deltas: Dict[Optional[str], EncodedBody] = field(default_factory=dict, repr=False, compare=False)
+
+    @property
+    def body(self) -> bytes:
+        return self.catalog.identity
+
+    def query(self, params: Dict[str, List[str]]) -> EncodedBody:
+        """Filtered Portainer document for /templates query parameters
+
+        Raises ValueError for malformed filters. Results are cached per
+        normalized query with LRU eviction.
+        """
+        lean = lean_requested(params)
+        key = self.query_key(params)
+        with self.query_lock:
+            cached = self.query_cache.get(key)
+            if cached is not None:
+                self.query_cache.move_to_end(key)
+        if cached is not None:
+            REGISTRY.inc('template_server_query_cache_total', ('hit',))
+            note_cache('hit')
+            return cached
+        REGISTRY.inc('template_server_query_cache_total', ('miss',))
+        note_cache('miss')
+
+        templates = self.index.search(
+            category=params.get('category', []), platform=params.get('platform', []),
+            type=params.get('type', []), image=params.get('image', []),
+            q=" ".join(params.get('q', [])),
+        )
+        if lean:
+            templates = [lean_template(t) for t in templates]
+        document = {'version': self.data.get('version', '2'), 'templates': templates}
+        result = EncodedBody.build(encode_json(document), self.last_modified)
+
+        with self.query_lock:
+            self.query_cache[key] = result
+            while len(self.query_cache) > QUERY_CACHE_SIZE:
+                self.query_cache.popitem(last=False)
+        return result
+
+    @staticmethod
+    def query_key(params: Dict[str, List[str]]) -> tuple:
+        """Normalized /templates query, the key of the query cache"""
+        return (lean_requested(params),) + tuple(
+            sorted((name, tuple(sorted(params.get(name, []))))
+                   for name in ('category', 'platform', 'type', 'image', 'q')))
+
+    def template(self, path: str, lean: bool = False) -> EncodedBody:
+        """Single template for /templates/{id} or /templates/by-name/{name}
+
+        Raises TemplateNotFound. Each template is encoded on first request
+        and kept for the lifetime of the snapshot.
+        """
+        key = self.template_key(path, lean)
+        body = self.template_bodies.get(key)
+        record_lookup('template', body is not None)
+        if body is None:
+            pos = key[0]
+            template = self.index.templates[pos]
+            if lean:
+                template = lean_template(template)
+            # A racing duplicate encode is harmless; the first one is kept
+            body = self.template_bodies.setdefault(
+                key, EncodedBody.build(encode_json(template), self.last_modified))
+        return body
+
+    def template_key(self, path: str, lean: bool = False) -> Tuple[int, bool]:
+        """(position, lean) of a single-template lookup; raises TemplateNotFound"""
+        if path.startswith(BY_NAME_PREFIX):
+            selector = path[len(BY_NAME_PREFIX):]
+            pos = self.index.by_name(selector)
+            kind = "name"
+        else:
+            selector = path[len(TEMPLATE_LOOKUP_PREFIX):]
+            pos = self.index.by_id(selector)
+            kind = "id"
+        if pos is None:
+            raise TemplateNotFound(f"No template with {kind} {selector!r}")
+        return pos, lean
+
+    def changes(self, since: Optional[str]) -> EncodedBody:
+        """Delta from an earlier version to this one for /templates/changes
+
+        Versions no longer in the history (or no ``since``) get a full
+        answer. Each delta is encoded once and kept with the snapshot.
+        """
+        old = self.history.get(since) if since and self.history is not None else None
+        key = old.version if old is not None else None
+        body = self.deltas.get(key)
+        record_lookup('changes', body is not None)
+        if body is None:
+            delta = catalog_delta(old, self.fingerprint, self.index.templates)
+            body = self.deltas.setdefault(
+                key, EncodedBody.build(encode_json(delta), self.last_modified))
+        return body
+
+    def changes_key(self, since: Optional[str]) -> Optional[str]:
+        """Version a delta is computed from (None for a full answer)"""
+        old = self.history.get(since) if since and self.history is not None else None
+        return old.version if old is not None else None
+
+    @cached_property
+    def lean(self) -> EncodedBody:
+        """Portainer-spec-only projection, compactly encoded"""
+        return EncodedBody.build(encode_json(lean_catalog(self.data)), self.last_modified)
+
+
+def record_lookup(cache: str, hit: bool):
+    """Count a cache lookup in the metrics and note it for the access log"""
+    result = 'hit' if hit else 'miss'
+    REGISTRY.inc('template_server_cache_lookups_total', (cache, result))
+    note_cache(result)
+
+
+def file_signature(path) -> Tuple[int, int, int]:
+    """Cheap change detector: (mtime_ns, size, inode)"""
+    st = os.stat(path)
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+
+def compress_variants(body: bytes) -> Dict[str, bytes]:
+    """Build every supported content-coding of a body once"""
+    encodings = {'identity': body}
+    gzipped = gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+    if len(gzipped) < len(body):
+        encodings['gzip'] = gzipped
+    if brotli is not None:
+        compressed = brotli.compress(body, quality=BROTLI_QUALITY)
+        if len(compressed) < len(body):
+            encodings['br'] = compressed
+    return encodings
+
+
+def content_etag(body: bytes) -> str:
+    """Strong ETag derived from a hash of the exact bytes sent"""
+    return '"%s"' % hashlib.sha256(body).hexdigest()[:32]
+
+
+def http_date(timestamp: float) -> str:
+    """RFC 9110 IMF-fixdate for Last-Modified / Date headers"""
+    return formatdate(timestamp, usegmt=True)
+
+
+def is_not_modified(if_none_match: Optional[str], if_modified_since: Optional[str],
+                    etag: str, last_modified: str) -> bool:
+    """Evaluate conditional GET headers against the current representation
+
+    If-None-Match takes precedence; If-Modified-Since is only consulted
+    when the client sent no entity tags (RFC 9110 section 13.2.2).
+    """
+    if if_none_match is not None:
+        if if_none_match.strip() == '*':
+            return True
+        # Weak comparison: a W/ prefix still matches the same bytes
+        candidates = (tag.strip() for tag in if_none_match.split(','))
+        return any((tag[2:] if tag.startswith('W/') else tag) == etag
+                   for tag in candidates)
+
+    if if_modified_since:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+            modified = parsedate_to_datetime(last_modified)
+        except (TypeError, ValueError, IndexError):
+            return False
+        if since.tzinfo is None:
+            return False
+        return modified <= since
+    return False
+
+
+class TemplateNotFound(LookupError):
+    """No template matches a /templates/{id} or /templates/by-name/{name} lookup"""
+
+
+class RangeNotSatisfiable(ValueError):
+    """Range header that selects no bytes of the representation"""
+
+
+def parse_range(range_header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """(offset, length) for a single "bytes=" range, or None to send everything
+
+    Multiple ranges and unknown units are ignored (a full 200 is a valid
+    answer to those); an unsatisfiable range raises RangeNotSatisfiable.
+    """
+    if not range_header:
+        return None
+    unit, _, spec = range_header.partition('=')
+    if unit.strip().lower() != 'bytes' or ',' in spec:
+        return None
+    first, sep, last = spec.strip().partition('-')
+    if not sep:
+        return None
+    try:
+        if not first:
+            suffix = int(last)
+            start, end = size - suffix, size - 1
+        else:
+            start = int(first)
+            end = int(last) if last else size - 1
+    except ValueError:
+        return None
+    if not first:
+        if suffix <= 0:
+            raise RangeNotSatisfiable(range_header)
+        start = max(0, start)
+    elif start >= size:
+        raise RangeNotSatisfiable(range_header)
+    if end < start:
+        return None
+    end = min(end, size - 1)
+    return start, end - start + 1
+
+
+def if_range_matches(if_range: Optional[str], etag: str, last_modified: str) -> bool:
+    """If-Range: only honour Range when the client's copy is still current"""
+    if if_range is None:
+        return True
+    if_range = if_range.strip()
+    if if_range.startswith('"') or if_range.startswith('W/'):
+        return if_range == etag
+    return if_range == last_modified
+
+
+def negotiate_encoding(accept_encoding: Optional[str], available: Iterable[str]) -> str:
+    """Pick the best content-coding for an Accept-Encoding header (RFC 9110)"""
+    if not accept_encoding:
+        return 'identity'
+
+    qvalues = {}
+    for item in accept_encoding.split(','):
+        coding, _, params = item.strip().partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in params.split(';'):
+            name, _, value = param.strip().partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        qvalues[coding] = q
+
+    def quality(coding: str) -> float:
+        if coding in qvalues:
+            return qvalues[coding]
+        if '*' in qvalues:
+            return qvalues['*']
+        # identity is acceptable unless explicitly refused, but any listed
+        # coding wins over it
+        return 0.001 if coding == 'identity' else 0.0
+
+    best, best_q = 'identity', 0.0
+    for coding in ENCODING_PREFERENCE:
+        if coding not in available:
+            continue
+        q = quality(coding)
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+def encode_json(data) -> bytes:
+    """Compact UTF-8 JSON for derived representations"""
+    with timed('serialize'):
+        return json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def lean_template(template: dict) -> dict:
+    """Keep only the fields Portainer's template spec defines"""
+    return {key: template[key] for key in PORTAINER_TEMPLATE_FIELDS if key in template}
+
+
+def lean_catalog(data: dict) -> dict:
+    return {
+        'version': data.get('version', '2'),
+        'templates': [lean_template(t) for t in data.get('templates', []) if isinstance(t, dict)],
+    }
+
+
+def lean_requested(params: Dict[str, List[str]]) -> bool:
+    """?lean=1 or ?format=lean"""
+    return (params.get('lean', ['0'])[-1].lower() in ('1', 'true', 'yes')
+            or params.get('format', [''])[-1].lower() == 'lean')
+
+
+def wants_lean(path: str, query: str = '') -> bool:
+    """Lean projection via its own path or query parameter"""
+    return path == LEAN_PATH or lean_requested(parse_qs(query))
+
+
+def time_to_listen() -> float:
+    """Milliseconds since the serving core was imported (process start, roughly)"""
+    return (time.perf_counter() - IMPORTED_AT) * 1000
+
+
+def report_listening():
+    print(f"⏱️ Accepting connections {time_to_listen():.0f} ms after start")
+
+
+def start_warmup(cache: 'TemplateCache'):
+    """Validate the catalog in the background and report when it is in service
+
+    Servers call this before binding so they listen immediately; requests
+    get the raw file until the snapshot is ready.
+    """
+    cache.warm()
+
+    def report():
+        try:
+            snapshot = cache.get()
+        except Exception as e:
+            print(f"❌ Template validation failed: {e}")
+            return
+        print(f"✅ Template validation successful - {snapshot.template_count} templates found "
+              f"({time_to_listen():.0f} ms after start)")
+
+    threading.Thread(target=report, name="catalog-warmup", daemon=True).start()
+
+
+def probe_response(cache: 'TemplateCache', path: str,
+                   max_age: float = MAX_CATALOG_AGE) -> Tuple[int, List[Tuple[str, str]], bytes]:
+    """(status, headers, body) for /healthz and /readyz, answered from memory
+
+    /readyz is 503 until a snapshot is in service and, with ``max_age``,
+    when the catalog file has not changed for that long. A file on disk
+    that fails to load is reported in the body but keeps the probe at 200
+    while the last good snapshot is served: one bad write must not take
+    every backend out of the load balancer at once.
+    """
+    if path == HEALTH_PATH:
+        return 200, [('Content-Type', 'text/plain; charset=utf-8'), ('Content-Length', '3'),
+                     ('Cache-Control', 'no-store')], b"ok\n"
+
+    try:
+        # At most one stat() per check interval; notices changed or broken files
+        snapshot = cache.get(wait=False)
+    except Exception:
+        snapshot = None
+    state = {'ready': False}
+    if snapshot is not None:
+        age = time.time() - snapshot.signature[0] / 1e9
+        state.update(version=snapshot.version, templates=snapshot.template_count,
+                     age_seconds=round(age, 1),
+                     loaded_seconds_ago=round(time.time() - snapshot.loaded_at, 1))
+        state['ready'] = not (max_age and age > max_age)
+        if not state['ready']:
+            state['reason'] = f"catalog older than {max_age:g}s"
+    else:
+        state['reason'] = "catalog not loaded"
+    if cache.last_error is not None:
+        # Reported either way; only fatal without a snapshot to fall back on
+        state['last_error'] = cache.last_error
+    body = encode_json(state)
+    return (200 if state['ready'] else 503,
+            [('Content-Type', 'application/json; charset=utf-8'), ('Content-Length', str(len(body))),
+             ('Cache-Control', 'no-store')], body)
+
+
+def serves_raw_file(path: str, query: str = '') -> bool:
+    """Whether the request maps to the unmodified catalog file
+
+    Only these can be answered from disk before the first snapshot exists.
+    """
+    return not path.startswith(TEMPLATES_PATH) and not wants_lean(path, query)
+
+
+def route_label(path: str) -> str:
+    """Bounded-cardinality path label for metrics"""
+    if path in METRIC_ROUTES or path == CHANGES_PATH:
+        return path
+    if path.startswith(BY_NAME_PREFIX):
+        return BY_NAME_PREFIX + "{name}"
+    if path.startswith(TEMPLATE_LOOKUP_PREFIX):
+        return TEMPLATE_LOOKUP_PREFIX + "{id}"
+    if path.startswith(COMPOSE_PREFIX):
+        return COMPOSE_PREFIX + "{name}"
+    return "static" if path.endswith('.json') else "other"
+
+
+def select_representation(snapshot: CatalogSnapshot, path: str, query: str = '') -> EncodedBody:
+    """Map a catalog request path + query string to the representation to send
+
+    Raises ValueError for malformed /templates filters and TemplateNotFound
+    for unknown single-template lookups.
+    """
+    if path == TEMPLATES_PATH:
+        return snapshot.query(parse_qs(query))
+    if path == CHANGES_PATH:
+        return snapshot.changes(parse_qs(query).get('since', [''])[0].strip('"') or None)
+    if path.startswith(TEMPLATE_LOOKUP_PREFIX):
+        return snapshot.template(path, lean=lean_requested(parse_qs(query)))
+    if wants_lean(path, query):
+        record_lookup('lean', 'lean' in vars(snapshot))   # built on first use
+        return snapshot.lean
+    return snapshot.catalog
+
+
+def representation_cached(snapshot: CatalogSnapshot, path: str, query: str = '') -> bool:
+    """Whether select_representation would answer from memory without building
+
+    Lets the asyncio engine keep hits on the event loop and move the
+    filtering and compression of a miss to a thread. Requests that fail
+    (unknown template, malformed filter) count as cached: they fail fast.
+    """
+    if path == TEMPLATES_PATH:
+        key = snapshot.query_key(parse_qs(query))
+        with snapshot.query_lock:
+            return key in snapshot.query_cache
+    if path == CHANGES_PATH:
+        since = parse_qs(query).get('since', [''])[0].strip('"') or None
+        return snapshot.changes_key(since) in snapshot.deltas
+    if path.startswith(TEMPLATE_LOOKUP_PREFIX):
+        try:
+            key = snapshot.template_key(path, lean=lean_requested(parse_qs(query)))
+        except TemplateNotFound:
+            return True
+        return key in snapshot.template_bodies
+    if wants_lean(path, query):
+        return 'lean' in vars(snapshot)
+    return True
+
+
+def load_snapshot(path, history: Optional[VersionHistory] = None) -> CatalogSnapshot:
+    """Read, validate and pre-encode the catalog file"""
+    signature = file_signature(path)
+    with timed('read'), open(path, 'rb') as f:
+        body = f.read()
+    with timed('parse'):
+        data = json.loads(body)
+    # Second resolution: that is all Last-Modified can express
+    last_modified = http_date(signature[0] // 1_000_000_000)
+    catalog = EncodedBody.build(body, last_modified)
+    # Content hash: the identity ETag without quotes
+    version = catalog.etags['identity'].strip('"')
+    index = TemplateIndex(data.get('templates', []))
+    return CatalogSnapshot(
+        path=str(path),
+        data=data,
+        template_count=len(data.get('templates', [])),
+        signature=signature,
+        loaded_at=time.time(),
+        version=version,
+        last_modified=last_modified,
+        catalog=catalog,
+        index=index,
+        fingerprint=CatalogVersion.build(version, index.templates),
+        history=history,
+    )
+
+
+def catalog_response(representation: EncodedBody, request_headers,
+                     extra_headers: Iterable[Tuple[str, str]] = ()
+                     ) -> Tuple[int, List[Tuple[str, str]], Optional[Payload]]:
+    """Build (status, headers, payload) for a catalog representation
+
+    Transport-neutral so both the http.server handlers and the asyncio
+    engine share one implementation. ``request_headers`` only needs a
+    case-insensitive ``get`` (http.client.HTTPMessage) or lower-case keys.
+    304 and 416 come back without a payload.
+    """
+    encoding = negotiate_encoding(request_headers.get('accept-encoding'), representation.encodings)
+    etag = representation.etag(encoding)
+    headers = [
+        ('ETag', etag),
+        ('Last-Modified', representation.last_modified),
+        ('Vary', 'Accept-Encoding'),
+        ('Accept-Ranges', 'bytes'),
+    ]
+    headers.extend(extra_headers)
+
+    if_none_match = request_headers.get('if-none-match')
+    if_modified_since = request_headers.get('if-modified-since')
+    if if_none_match is not None or if_modified_since is not None:
+        not_modified = is_not_modified(if_none_match, if_modified_since,
+                                       etag, representation.last_modified)
+        REGISTRY.inc('template_server_conditional_requests_total',
+                     ('not_modified' if not_modified else 'modified',))
+        if not_modified:
+            note_cache('not_modified')
+            return 304, headers, None
+    if CACHE_RESULT.get() is None:
+        note_cache('hit')
+
+    size = len(representation.encoded(encoding))
+    entity = [('Content-Type', representation.content_type)]
+    if encoding != 'identity':
+        entity.append(('Content-Encoding', encoding))
+
+    byte_range = None
+    if if_range_matches(request_headers.get('if-range'), etag, representation.last_modified):
+        try:
+            byte_range = parse_range(request_headers.get('range'), size)
+        except RangeNotSatisfiable:
+            entity.append(('Content-Range', f"bytes */{size}"))
+            entity.append(('Content-Length', '0'))
+            return 416, entity + headers, None
+
+    payload = representation.payload(encoding, byte_range)
+    entity.append(('Content-Length', str(payload.length)))
+    if byte_range is None:
+        return 200, entity + headers, payload
+    offset, length = byte_range
+    entity.append(('Content-Range', f"bytes {offset}-{offset + length - 1}/{size}"))
+    return 206, entity + headers, payload
+
+
+class Rebuild:
+    """One in-flight catalog load that concurrent callers can wait on"""
+
+    def __init__(self, signature: Tuple[int, int, int]):
+        self.signature = signature
+        self.done = threading.Event()
+        self.error: Optional[BaseException] = None
+
+
+class TemplateCache:
+    """Thread-safe cache holding the current catalog snapshot
+
+    A changed file is loaded, validated and pre-encoded on a background
+    thread while requests keep getting the previous snapshot; the new one
+    is swapped in with a single reference assignment. Only one rebuild
+    runs at a time, and only callers with no snapshot at all (first load)
+    wait for it - or, with ``get(wait=False)``, fall back to the raw file
+    so a freshly started server answers before validation has finished.
+    A file that fails to load is reported and not retried until it
+    changes again; the previous snapshot stays in service.
+    """
+
+    def __init__(self, path, check_interval: float = DEFAULT_CHECK_INTERVAL):
+        self.path = Path(path).absolute()
+        self.check_interval = check_interval
+        self._snapshot: Optional[CatalogSnapshot] = None
+        self._next_check = 0.0
+        self._lock = threading.Lock()
+        self._rebuild: Optional[Rebuild] = None
+        self._failed: Optional[Rebuild] = None
+        self.last_error: Optional[str] = None
+        self.history = VersionHistory()
+        REGISTRY.gauge('template_server_templates',
+                       lambda: self._snapshot.template_count if self._snapshot else 0)
+        REGISTRY.gauge('template_server_catalog_ready', lambda: int(self.ready))
+
+    @property
+    def ready(self) -> bool:
+        """True once a validated snapshot is in service"""
+        return self._snapshot is not None
+
+    def warm(self):
+        """Start the first load in the background without waiting for it"""
+        self.get(wait=False)
+
+    def get(self, wait: bool = True) -> Optional[CatalogSnapshot]:
+        """Return the current snapshot, starting a reload if the file changed
+
+        Before the first load completes this blocks, or returns None with
+        ``wait=False``.
+        """
+        snapshot = self._snapshot
+        if snapshot is not None and time.monotonic() < self._next_check:
+            return snapshot
+
+        with self._lock:
+            snapshot = self._snapshot
+            now = time.monotonic()
+            if snapshot is not None and now < self._next_check:
+                return snapshot
+            self._next_check = now + self.check_interval
+
+            rebuild = self._rebuild
+            if rebuild is None:
+                try:
+                    signature = file_signature(self.path)
+                except OSError:
+                    if snapshot is not None:
+                        return snapshot
+                    raise
+                if snapshot is not None and snapshot.signature == signature:
+                    return snapshot
+                failed = self._failed
+                if failed is not None and failed.signature == signature:
+                    # Same broken bytes as last time - don't parse them again
+                    if snapshot is not None:
+                        return snapshot
+                    raise failed.error
+                rebuild = self._rebuild = Rebuild(signature)
+                threading.Thread(target=self._load, args=(rebuild,),
+                                 name="catalog-reload", daemon=True).start()
+
+        if snapshot is not None or not wait:
+            return snapshot
+        rebuild.done.wait()
+        if rebuild.error is not None:
+            raise rebuild.error
+        return self._snapshot
+
+    def _load(self, rebuild: Rebuild):
+        started = time.perf_counter()
+        try:
+            snapshot = load_snapshot(self.path, self.history)
+        except Exception as e:
+            # A writer may be halfway through the file - keep serving the
+            # last good version and retry once the file changes again.
+            REGISTRY.inc('template_server_catalog_reloads_total', ('failure',))
+            rebuild.error = e
+            self.last_error = f"{type(e).__name__}: {e}"
+            if self._snapshot is not None:
+                print(f"⚠️ Catalog reload failed, still serving version "
+                      f"{self._snapshot.version[:12]}: {self.last_error}")
+            with self._lock:
+                self._failed = rebuild
+                self._rebuild = None
+        else:
+            REGISTRY.observe('template_server_catalog_reload_duration_seconds',
+                             time.perf_counter() - started)
+            REGISTRY.inc('template_server_catalog_reloads_total', ('success',))
+            self.history.add(snapshot.fingerprint)
+            with self._lock:
+                self._snapshot = snapshot
+                self._failed = None
+                self._rebuild = None
+            self.last_error = None
+        finally:
+            rebuild.done.set()
+
+    @property
+    def template_count(self) -> int:
+        """Template count of the current snapshot (0 if it cannot be loaded)"""
+        try:
+            return self.get().template_count
+        except (OSError, ValueError):
+            return 0
+
+
+class CachedCatalogMixin:
+    """http.server handler mixin that answers catalog requests from a TemplateCache
+
+    Set ``template_cache`` on the handler class before serving. Requests for
+    ``catalog_paths`` are answered from memory (or with 304 Not Modified);
+    everything else falls through to the base handler. ``catalog_headers``
+    are added to catalog responses only, e.g. CORS for handlers whose
+    ``end_headers`` does not add them. Every response is recorded in the
+    metrics registry, which is served on ``/metrics``. With a
+    ``variant_store`` (template_variants.VariantStore) the other catalog
+    files are answered from memory too once it has loaded, and with a
+    ``composer`` (template_compose.CatalogComposer) composed catalogs are
+    served on /catalogs.
+    """
+
+    template_cache: Optional[TemplateCache] = None
+    variant_store = None
+    composer = None
+    catalog_paths = (TEMPLATE_PATH, LEAN_PATH, TEMPLATES_PATH)
+    catalog_headers: Tuple[Tuple[str, str], ...] = ()
+
+    def is_catalog_request(self) -> bool:
+        path = self.path.split('?', 1)[0]
+        return path in self.catalog_paths or path.startswith(TEMPLATE_LOOKUP_PREFIX)
+
+    def is_composition_request(self) -> bool:
+        path = self.path.split('?', 1)[0]
+        return self.composer is not None and (path == COMPOSE_PATH or path.startswith(COMPOSE_PREFIX))
+
+    def do_GET(self):
+        path = self.path.split('?', 1)[0]
+        if path == METRICS_PATH:
+            self.send_metrics()
+        elif path in PROBE_PATHS:
+            self.send_probe(path)
+        elif self.is_catalog_request():
+            self.send_catalog()
+        elif self.is_composition_request():
+            self.send_composition()
+        elif not self.send_variant():
+            super().do_GET()
+
+    def do_HEAD(self):
+        path = self.path.split('?', 1)[0]
+        if path in PROBE_PATHS:
+            self.send_probe(path, head_only=True)
+        elif self.is_catalog_request():
+            self.send_catalog(head_only=True)
+        elif self.is_composition_request():
+            self.send_composition(head_only=True)
+        elif not self.send_variant(head_only=True):
+            super().do_HEAD()
+
+    def send_metrics(self):
+        body = REGISTRY.render()
+        self.send_response(200)
+        self.send_header('Content-Type', METRICS_CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_probe(self, path: str, head_only: bool = False):
+        status, headers, body = probe_response(self.template_cache, path)
+        self.send_response(status)
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        if not head_only:
+            self.wfile.write(body)
+
+    # -- metrics hooks -------------------------------------------------------
+
+    def setup(self):
+        super().setup()
+        REGISTRY.inc('template_server_active_connections', (), 1)
+        unix = getattr(self.connection, 'family', None) == socket.AF_UNIX
+        REGISTRY.inc('template_server_connections_total', ('unix' if unix else 'tcp',))
+
+    def finish(self):
+        REGISTRY.inc('template_server_active_connections', (), -1)
+        super().finish()
+
+    def parse_request(self):
+        CACHE_RESULT.set(None)
+        SAMPLER.start()
+        self.metric_started = time.perf_counter()
+        self.metric_status = None
+        self.metric_encoding = 'identity'
+        self.metric_bytes = 0
+        return super().parse_request()
+
+    def send_response(self, code, message=None):
+        self.metric_status = code
+        self.cache_control_sent = False
+        super().send_response(code, message)
+
+    def send_header(self, keyword, value):
+        name = keyword.lower()
+        if name == 'cache-control':
+            # The response's own (e.g. no-store on probes) wins over the
+            # default a handler's end_headers adds to everything
+            if self.cache_control_sent:
+                return
+            self.cache_control_sent = True
+        elif name == 'content-encoding':
+            self.metric_encoding = value
+        elif name == 'content-length' and self.command != 'HEAD':
+            self.metric_bytes = int(value)
+        super().send_header(keyword, value)
+
+    def end_headers(self):
+        timing = TIMING.get()
+        if timing is not None:
+            self.send_header('Server-Timing', timing.header())
+        super().end_headers()
+
+    def handle_one_request(self):
+        self.metric_status = None
+        self.metric_started = time.perf_counter()
+        self.metric_encoding = 'identity'
+        self.metric_bytes = 0
+        super().handle_one_request()
+        if self.metric_status is not None:
+            self.record_request()
+
+    def record_request(self):
+        path = route_label(getattr(self, 'path', '').split('?', 1)[0])
+        REGISTRY.inc('template_server_requests_total',
+                     (path, str(self.metric_status), self.metric_encoding))
+        REGISTRY.observe('template_server_request_duration_seconds',
+                         time.perf_counter() - self.metric_started, (path,))
+        if self.metric_bytes:
+            REGISTRY.inc('template_server_response_bytes_total', (path,), self.metric_bytes)
+        timing = TIMING.get()
+        if timing is not None:
+            timing.observe()
+        if path in PROBE_PATHS:
+            return  # probes every few seconds would drown the access log
+        ACCESS_LOG.log(access_record(
+            self.client_address[0] if isinstance(self.client_address, tuple) else '-',
+            getattr(self, 'command', None) or '-', getattr(self, 'path', ''),
+            self.metric_status, self.metric_bytes,
+            time.perf_counter() - self.metric_started, self.metric_encoding))
+
+    def log_request(self, code='-', size='-'):
+        """Access lines go to the structured ACCESS_LOG (see record_request)"""
+
+    def send_catalog(self, head_only: bool = False):
+        """Send the cached catalog bytes in the best accepted encoding"""
+        path, _, query = self.path.partition('?')
+        path = unquote(path)
+        record_lookup('snapshot', self.template_cache.ready)
+        try:
+            with timed('cache'):
+                snapshot = self.template_cache.get(wait=not serves_raw_file(path, query))
+            if snapshot is None:
+                self.send_raw_catalog(head_only)
+                return
+        except FileNotFoundError:
+            self.send_error(404, "Template file not found")
+            return
+        except (OSError, ValueError) as e:
+            self.send_error(500, f"Error reading template: {e}")
+            return
+
+        try:
+            with timed('select'):
+                representation = select_representation(snapshot, path, query)
+        except TemplateNotFound as e:
+            self.send_error(404, str(e))
+            return
+        except ValueError as e:
+            self.send_error(400, str(e))
+            return
+        self.send_representation(representation, head_only)
+
+    def send_variant(self, head_only: bool = False) -> bool:
+        """Serve a catalog variant from the variant store; False if it has none"""
+        if self.variant_store is None:
+            return False
+        representation = self.variant_store.get(unquote(self.path.split('?', 1)[0]).lstrip('/'))
+        if representation is None:
+            return False
+        self.send_representation(representation, head_only)
+        return True
+
+    def send_composition(self, head_only: bool = False):
+        """Send a composed catalog, building it on first request"""
+        path, _, query = self.path.partition('?')
+        try:
+            representation = self.composer.get(unquote(path), query)
+        except LookupError as e:
+            self.send_error(404, str(e))
+            return
+        except (OSError, ValueError) as e:
+            self.send_error(500, f"Error composing catalog: {e}")
+            return
+        self.send_representation(representation, head_only)
+
+    def send_representation(self, representation: EncodedBody, head_only: bool = False):
+        status, headers, payload = catalog_response(representation, self.headers, self.catalog_headers)
+        self.send_response(status)
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        if payload is not None and not head_only:
+            self.send_payload(payload)
+
+    def send_raw_catalog(self, head_only: bool = False):
+        """Catalog straight from disk while the first snapshot is still loading"""
+        note_cache('raw')
+        with open(self.template_cache.path, 'rb') as f:
+            stat = os.fstat(f.fileno())
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(stat.st_size))
+            self.send_header('Last-Modified', http_date(stat.st_mtime))
+            for name, value in self.catalog_headers:
+                self.send_header(name, value)
+            self.end_headers()
+            if not head_only:
+                self.copyfile(f, self.wfile)
+
+    def send_payload(self, payload: Payload):
+        """Zero-copy sendfile(2) for spooled bodies, plain write otherwise"""
+        with timed('write'):
+            if payload.spool is not None and hasattr(self.connection, 'sendfile'):
+                self.wfile.flush()
+                self.connection.sendfile(payload.spool, payload.offset, payload.length)
+            else:
+                self.wfile.write(payload.view())
+
+    def copyfile(self, source, outputfile):
+        """SimpleHTTPRequestHandler static files (e.g. catalog variants) via sendfile"""
+        if outputfile is self.wfile and hasattr(self.connection, 'sendfile'):
+            try:
+                source.fileno()
+            except (AttributeError, OSError):
+                pass
+            else:
+                with timed('write'):
+                    self.wfile.flush()
+                    self.connection.sendfile(source, source.tell())
+                return
+        with timed('write'):
+            super().copyfile(source, outputfile)
+
+
+class KeepAliveMixin:
+    """HTTP/1.1 persistent connections for http.server handlers
+
+    Idle connections are closed after ``keepalive_timeout`` seconds and
+    each connection serves at most ``max_keepalive_requests`` requests.
+    While connections wait for a pool worker (worker_pool), responses
+    close the connection, and an idle pooled connection waits for its next
+    request in short slices, giving its worker up as soon as another
+    connection is queued, so idle keep-alive clients do not hold workers.
+    Every response must carry a Content-Length (or be bodyless) for the
+    client to find the next response on the same socket. Error responses
+    to well-formed, bodyless requests (404, 400, 416, ...) keep the
+    connection open too; ``send_error`` would otherwise always close it.
+    """
+
+    protocol_version = "HTTP/1.1"
+    keepalive_timeout = KEEPALIVE_TIMEOUT
+    max_keepalive_requests = MAX_KEEPALIVE_REQUESTS
+
+    def setup(self):
+        super().setup()
+        self.requests_served = 0
+        self.request_parsed = False
+        self.error_keeps_alive = False
+        if self.connection.family in (socket.AF_INET, socket.AF_INET6):
+            # Headers and body go out in separate writes; with Nagle the
+            # body waits for the client's delayed ACK (~40 ms)
+            self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def handle_one_request(self):
+        # Waiting for the next request line is the idle period
+        if not self.wait_for_request():
+            self.close_connection = True
+            return
+        self.connection.settimeout(self.keepalive_timeout)
+        self.request_parsed = False
+        super().handle_one_request()
+
+    def wait_for_request(self) -> bool:
+        """Idle wait of a pooled keep-alive connection; False gives the connection up
+
+        Blocked in readline() the worker would be lost to queued
+        connections for up to ``keepalive_timeout``.
+        """
+        pool = getattr(self.server, 'worker_pool', None)
+        if pool is None or not self.requests_served:
+            return True
+        deadline = time.monotonic() + self.keepalive_timeout
+        while True:
+            # A pipelined request may already be buffered
+            self.connection.setblocking(False)
+            try:
+                if self.rfile.peek(1):
+                    return True
+            except OSError:
+                return True       # reset or similar: let readline() report it
+            if pool.depth or time.monotonic() >= deadline:
+                return False
+            if select.select([self.connection], [], [], IDLE_POLL_INTERVAL)[0]:
+                return True       # data or EOF, readline() tells which
+
+    def parse_request(self):
+        self.connection.settimeout(SEND_TIMEOUT)
+        self.request_parsed = super().parse_request()
+        return self.request_parsed
+
+    def send_error(self, code, message=None, explain=None):
+        # Malformed requests, and requests whose unread body would be taken
+        # for the next request line, still get "Connection: close"
+        self.error_keeps_alive = (self.request_parsed and not self.headers.get('Transfer-Encoding')
+                                  and self.headers.get('Content-Length', '0').strip() in ('', '0'))
+        try:
+            super().send_error(code, message, explain)
+        finally:
+            self.error_keeps_alive = False
+
+    def send_header(self, keyword, value):
+        if self.error_keeps_alive and keyword.lower() == 'connection':
+            return
+        super().send_header(keyword, value)
+
+    def end_headers(self):
+        self.error_keeps_alive = False
+        self.requests_served += 1
+        if not self.close_connection:
+            pool = getattr(self.server, 'worker_pool', None)
+            if self.requests_served >= self.max_keepalive_requests or (pool is not None and pool.depth):
+                self.send_header('Connection', 'close')
+            else:
+                if self.request_version == 'HTTP/1.0':
+                    self.send_header('Connection', 'keep-alive')
+                self.send_header('Keep-Alive', f"timeout={int(self.keepalive_timeout)}, "
+                                               f"max={self.max_keepalive_requests - self.requests_served}")
+        super().end_headers()
+
+    def send_empty_response(self, code: int = 200):
+        """Bodyless answer (e.g. CORS preflight) that keeps the connection usable"""
+        self.send_response(code)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
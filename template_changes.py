@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Template Changes - catalog deltas between recent versions
+Keeps per-template fingerprints of the last few catalog versions so
+mirrors can ask "what changed since <version>" and fetch only the added,
+modified and removed templates instead of the whole catalog.
+"""
+
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Union
+
+CHANGES_PATH = "/templates/changes"
+# Catalog versions remembered for deltas; older "since" values get a full answer
+VERSION_HISTORY = 16
+
+TemplateKey = Union[int, str]
+
+
+def template_keys(templates: List[dict]) -> List[TemplateKey]:
+    """Stable key per template: its integer id, else its title (or name)
+
+    Repeated keys get a "#2", "#3", ... suffix so every key is unique.
+    """
+    keys: List[TemplateKey] = []
+    seen: Dict[TemplateKey, int] = {}
+    for template in templates:
+        key = template.get('id')
+        if not isinstance(key, int) or isinstance(key, bool):
+            key = str(template.get('title') or template.get('name') or '')
+        count = seen[key] = seen.get(key, 0) + 1
+        keys.append(key if count == 1 else f"{key}#{count}")
+    return keys
+
+
+@dataclass(frozen=True)
+class CatalogVersion:
+    """Template keys (in catalog order) and content hashes of one version"""
+    version: str
+    keys: List[TemplateKey]
+    hashes: Dict[TemplateKey, str]
+
+    @classmethod
+    def build(cls, version: str, templates: List[dict]) -> 'CatalogVersion':
+        keys = template_keys(templates)
+        hashes = {
+            key: hashlib.sha1(json.dumps(template, sort_keys=True).encode('utf-8')).hexdigest()
+            for key, template in zip(keys, templates)
+        }
+        return cls(version, keys, hashes)
+
+
+class VersionHistory:
+    """Bounded ring of recent catalog versions, oldest evicted first"""
+
+    def __init__(self, size: int = VERSION_HISTORY):
+        self.size = size
+        self._versions: 'OrderedDict[str, CatalogVersion]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, version: CatalogVersion):
+        with self._lock:
+            self._versions[version.version] = version
+            self._versions.move_to_end(version.version)
+            while len(self._versions) > self.size:
+                self._versions.popitem(last=False)
+
+    def get(self, version: str) -> Optional[CatalogVersion]:
+        return self._versions.get(version)
+
+    def __len__(self) -> int:
+        return len(self._versions)
+
+
+def catalog_delta(old: Optional[CatalogVersion], new: CatalogVersion,
+                  templates: List[dict]) -> dict:
+    """Added/modified templates (full objects) and removed keys from old to new
+
+    ``templates`` are the templates of ``new`` in catalog order. Without
+    ``old`` (unknown or evicted version) every template is returned with
+    ``"full": true`` so the client replaces its copy instead of patching.
+    """
+    delta = {'since': old.version if old else None, 'version': new.version, 'full': old is None}
+    if old is None:
+        delta.update(added=templates, modified=[], removed=[], order=new.keys)
+        return delta
+
+    added, modified = [], []
+    for key, template in zip(new.keys, templates):
+        previous = old.hashes.get(key)
+        if previous is None:
+            added.append(template)
+        elif previous != new.hashes[key]:
+            modified.append(template)
+    delta.update(added=added, modified=modified,
+                 removed=[key for key in old.keys if key not in new.hashes])
+    # Key order lets clients place added templates; only sent when it changed
+    if old.keys != new.keys:
+        delta['order'] = new.keys
+    return delta
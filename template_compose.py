@@ -0,0 +1,351 @@
+#!/usr/bin/env python3
+"""
+Template Compose - combined catalogs built from named template collections
+A composition spec (config/compositions.json) names collections - groups
+of template files with include/exclude filters - and compositions, which
+merge collections in precedence order: when two collections carry the
+same template (same type and title), the earlier one wins. A composed
+catalog is built on its first request and its encoded body is cached
+under the content hashes of the collections it was built from. Files are
+only re-read when their stat signature changes, and only collections
+whose file contents changed are filtered again.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs
+
+from template_cache import (
+    COMPOSE_PREFIX, DEFAULT_CHECK_INTERVAL, EncodedBody, encode_json,
+    file_signature, http_date, record_lookup,
+)
+from template_index import FILTER_FIELDS, TemplateIndex, normalize
+from request_timing import timed
+from template_metrics import REGISTRY
+
+# Spec file, relative to the repository root unless TEMPLATE_COMPOSITIONS is set
+COMPOSITIONS_FILE = "config/compositions.json"
+COMPOSITIONS_ENV = "TEMPLATE_COMPOSITIONS"
+COMPOSED_CACHE_SIZE = 16          # encoded composed catalogs kept in memory
+FILTER_KEYS = FILTER_FIELDS + ('q',)
+
+
+class CompositionNotFound(LookupError):
+    """No composition (or collection) with the requested name"""
+
+
+def filter_spec(spec, where: str) -> Dict[str, object]:
+    """Normalize an include/exclude filter to TemplateIndex.search keywords"""
+    if not isinstance(spec, dict):
+        raise ValueError(f"{where}: filter must be an object")
+    unknown = set(spec) - set(FILTER_KEYS)
+    if unknown:
+        raise ValueError(f"{where}: unknown filter {', '.join(sorted(unknown))} "
+                         f"(expected {', '.join(FILTER_KEYS)})")
+    search = {}
+    for key, value in spec.items():
+        if key == 'q':
+            search['q'] = str(value)
+        else:
+            values = value if isinstance(value, list) else [value]
+            search[key] = [str(v) for v in values]
+    return search
+
+
+def template_identity(template: dict) -> Tuple[str, str]:
+    """Key under which templates from different sources count as the same one
+
+    "📖 Documentation" and "Documentation" of the same type collide; a
+    template without title or name is only a duplicate of identical JSON.
+    """
+    label = template.get('title') or template.get('name')
+    kind = str(template.get('type', 1))
+    if label:
+        return kind, normalize(label)
+    return kind, encode_json(template).decode('utf-8')
+
+
+@dataclass(frozen=True)
+class CollectionSpec:
+    name: str
+    files: Tuple[str, ...]
+    include: Dict[str, object]
+    exclude: Tuple[Dict[str, object], ...]
+    description: str = ''
+
+    @classmethod
+    def parse(cls, name: str, spec) -> 'CollectionSpec':
+        if not isinstance(spec, dict) or not spec.get('files'):
+            raise ValueError(f"collection {name!r}: 'files' is required")
+        files = spec['files'] if isinstance(spec['files'], list) else [spec['files']]
+        exclude = spec.get('exclude') or []
+        exclude = exclude if isinstance(exclude, list) else [exclude]
+        return cls(
+            name=name,
+            files=tuple(str(f) for f in files),
+            include=filter_spec(spec.get('include') or {}, f"collection {name!r} include"),
+            exclude=tuple(filter_spec(e, f"collection {name!r} exclude") for e in exclude),
+            description=str(spec.get('description', '')),
+        )
+
+
+@dataclass(frozen=True)
+class CompositionSpec:
+    name: str
+    collections: Tuple[str, ...]      # precedence order, first wins
+    description: str = ''
+    version: Optional[str] = None     # output "version", else the first source's
+
+
+@dataclass
+class SourceFile:
+    """One parsed template file, re-read only when its stat signature changes"""
+    signature: Tuple[int, int, int]
+    digest: str
+    version: Optional[str]
+    templates: List[dict]
+
+
+@dataclass
+class CollectionState:
+    """Filtered templates of a collection and the file contents they came from"""
+    key: Tuple[Tuple[str, str], ...]  # (path, content hash) per file
+    digest: str
+    version: Optional[str]
+    modified: int                     # newest file mtime, seconds
+    templates: List[dict]
+
+
+@dataclass
+class Spec:
+    signature: Optional[Tuple[int, int, int]]
+    collections: Dict[str, CollectionSpec]
+    compositions: Dict[str, CompositionSpec]
+    listing: Optional[EncodedBody] = None
+
+
+def parse_spec(data, signature=None) -> Spec:
+    if not isinstance(data, dict):
+        raise ValueError("composition spec must be an object")
+    collections = {name: CollectionSpec.parse(name, spec)
+                   for name, spec in (data.get('collections') or {}).items()}
+    compositions = {}
+    for name, spec in (data.get('compositions') or {}).items():
+        if not isinstance(spec, dict) or not spec.get('collections'):
+            raise ValueError(f"composition {name!r}: 'collections' is required")
+        members = tuple(spec['collections'])
+        unknown = [c for c in members if c not in collections]
+        if unknown:
+            raise ValueError(f"composition {name!r}: unknown collection {', '.join(unknown)}")
+        version = spec.get('version')
+        compositions[name] = CompositionSpec(name, members, str(spec.get('description', '')),
+                                             None if version is None else str(version))
+    return Spec(signature, collections, compositions)
+
+
+class CatalogComposer:
+    """Composed catalogs served on /catalogs/<name>, built and cached on demand
+
+    ``/catalogs`` lists the compositions; ``/catalogs?collections=a,b``
+    composes named collections ad hoc, in the given order. The spec file
+    is reloaded when it changes; a broken spec keeps the last good one.
+    """
+
+    def __init__(self, spec_path=None, base_dir=None,
+                 check_interval: float = DEFAULT_CHECK_INTERVAL,
+                 cache_size: int = COMPOSED_CACHE_SIZE):
+        root = Path(__file__).parent.absolute()
+        spec_path = spec_path or os.environ.get(COMPOSITIONS_ENV) or root / COMPOSITIONS_FILE
+        self.spec_path = Path(spec_path).absolute()
+        self.base_dir = Path(base_dir).absolute() if base_dir is not None else root
+        self.check_interval = check_interval
+        self.cache_size = cache_size
+        self.files: Dict[Path, SourceFile] = {}
+        self.collections: Dict[str, CollectionState] = {}
+        self.encoded: 'OrderedDict[tuple, EncodedBody]' = OrderedDict()
+        # (members, version) -> (next check, cache key) for the stat-free fast path
+        self.current: Dict[tuple, Tuple[float, tuple]] = {}
+        self._spec: Optional[Spec] = None
+        self._spec_checked = 0.0
+        self._lock = threading.Lock()
+
+    # -- spec ----------------------------------------------------------------
+
+    def spec(self) -> Spec:
+        now = time.monotonic()
+        spec = self._spec
+        if spec is not None and now < self._spec_checked:
+            return spec
+        self._spec_checked = now + self.check_interval
+        try:
+            signature = file_signature(self.spec_path)
+        except FileNotFoundError:
+            self._spec = Spec(None, {}, {})
+            return self._spec
+        if spec is not None and spec.signature == signature:
+            return spec
+        try:
+            with open(self.spec_path, 'rb') as f:
+                self._spec = parse_spec(json.loads(f.read()), signature)
+        except (OSError, ValueError) as e:
+            if spec is None:
+                raise ValueError(f"{self.spec_path.name}: {e}") from e
+            print(f"⚠️ Composition spec reload failed, keeping the previous one: {e}")
+            self._spec = Spec(signature, spec.collections, spec.compositions, spec.listing)
+        return self._spec
+
+    # -- requests ------------------------------------------------------------
+
+    def get(self, path: str, query: str = '') -> EncodedBody:
+        """Representation for a /catalogs request
+
+        Raises CompositionNotFound for unknown names and ValueError for a
+        bad spec or request.
+        """
+        spec = self.spec()
+        name = path[len(COMPOSE_PREFIX):] if path.startswith(COMPOSE_PREFIX) else ''
+        if name:
+            composition = spec.compositions.get(name)
+            if composition is None:
+                raise CompositionNotFound(f"No composition named {name!r}")
+            return self.compose(spec, composition.collections, composition.version)
+
+        requested = [c for value in parse_qs(query).get('collections', [])
+                     for c in value.split(',') if c.strip()]
+        if not requested:
+            return self.listing(spec)
+        requested = [c.strip() for c in requested]
+        unknown = [c for c in requested if c not in spec.collections]
+        if unknown:
+            raise CompositionNotFound(f"No collection named {', '.join(map(repr, unknown))}")
+        return self.compose(spec, tuple(requested))
+
+    def listing(self, spec: Spec) -> EncodedBody:
+        if spec.listing is None:
+            document = {
+                'compositions': [
+                    {'name': c.name, 'url': COMPOSE_PREFIX + c.name,
+                     'description': c.description, 'collections': list(c.collections)}
+                    for c in spec.compositions.values()],
+                'collections': [
+                    {'name': c.name, 'description': c.description, 'files': list(c.files)}
+                    for c in spec.collections.values()],
+            }
+            modified = spec.signature[0] // 1_000_000_000 if spec.signature else 0
+            spec.listing = EncodedBody.build(encode_json(document), http_date(modified))
+        return spec.listing
+
+    def compose(self, spec: Spec, members: Tuple[str, ...],
+                version: Optional[str] = None) -> EncodedBody:
+        """Encoded catalog merging ``members`` in precedence order"""
+        fast = self.current.get((members, version))
+        if fast is not None and time.monotonic() < fast[0]:
+            body = self.encoded.get(fast[1])
+            if body is not None:
+                record_lookup('composition', True)
+                return body
+
+        with self._lock, timed('compose'):
+            states = [self._collection(spec.collections[name]) for name in members]
+            key = (members, version) + tuple(state.digest for state in states)
+            self.current[(members, version)] = (time.monotonic() + self.check_interval, key)
+            body = self.encoded.get(key)
+            if body is not None:
+                self.encoded.move_to_end(key)
+                record_lookup('composition', True)
+                return body
+
+            record_lookup('composition', False)
+            seen = set()
+            templates = []
+            for state in states:
+                for template in state.templates:
+                    identity = template_identity(template)
+                    if identity not in seen:
+                        seen.add(identity)
+                        templates.append(template)
+            if version is None:
+                version = next((s.version for s in states if s.version is not None), "2")
+            if version == "3":
+                # v3 ids must be unique across the merged sources
+                templates = [dict(t, id=n) for n, t in enumerate(templates, 1)]
+            body = EncodedBody.build(
+                encode_json({'version': version, 'templates': templates}),
+                http_date(max((s.modified for s in states), default=0)))
+            self.encoded[key] = body
+            while len(self.encoded) > self.cache_size:
+                self.encoded.popitem(last=False)
+            return body
+
+    # -- collections (lock held) ---------------------------------------------
+
+    def _collection(self, spec: CollectionSpec) -> CollectionState:
+        paths = []
+        for pattern in spec.files:
+            matches = sorted(p for p in self.base_dir.glob(pattern) if p.is_file())
+            paths.extend(p for p in matches if p not in paths)
+        sources = [(path, self._source(path)) for path in paths]
+        # The filters are part of the key: editing them re-composes too
+        key = (('spec', repr(spec)),) + tuple((str(path), source.digest) for path, source in sources)
+        state = self.collections.get(spec.name)
+        if state is not None and state.key == key:
+            return state
+
+        REGISTRY.inc('template_server_collection_rebuilds_total', (spec.name,))
+        templates = [t for _, source in sources for t in source.templates]
+        index = TemplateIndex(templates)
+        selected = index.search(**spec.include) if spec.include else index.templates
+        for exclude in spec.exclude:
+            if exclude:
+                dropped = {id(t) for t in index.search(**exclude)}
+                selected = [t for t in selected if id(t) not in dropped]
+        state = CollectionState(
+            key=key,
+            digest=hashlib.blake2b(repr(key).encode('utf-8'), digest_size=16).hexdigest(),
+            version=next((s.version for _, s in sources if s.version is not None), None),
+            modified=max((s.signature[0] // 1_000_000_000 for _, s in sources), default=0),
+            templates=selected,
+        )
+        self.collections[spec.name] = state
+        return state
+
+    def _source(self, path: Path) -> SourceFile:
+        signature = file_signature(path)
+        source = self.files.get(path)
+        if source is not None and source.signature == signature:
+            return source
+        with open(path, 'rb') as f:
+            raw = f.read()
+        digest = hashlib.blake2b(raw, digest_size=16).hexdigest()
+        if source is not None and source.digest == digest:
+            # Touched but unchanged: keep the parsed templates
+            source.signature = signature
+            return source
+        try:
+            data = json.loads(raw)
+        except ValueError as e:
+            if source is None:
+                raise ValueError(f"{path.name}: {e}") from e
+            # Half-written file: keep composing from its last good contents
+            # and don't parse the same broken bytes again
+            print(f"⚠️ Keeping previous {path.name} for compositions: {e}")
+            source.signature = signature
+            return source
+        if isinstance(data, list):
+            version, templates = None, data
+        elif isinstance(data, dict):
+            version = data.get('version')
+            templates = data.get('templates') or []
+        else:
+            version, templates = None, []
+        source = SourceFile(signature, digest, None if version is None else str(version),
+                            [t for t in templates if isinstance(t, dict)])
+        self.files[path] = source
+        return source
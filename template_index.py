@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Template Index - inverted indexes over a Portainer template catalog
+Built once per catalog version so filtered queries (category, platform,
+type, image repository, free text) are set intersections instead of a
+scan over every template, and single-template lookups by id or name are
+one dictionary access.
+"""
+
+import re
+from bisect import bisect_left
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Set
+
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+# Free-text query tokens shorter than this are ignored
+MIN_TOKEN_LENGTH = 2
+
+FILTER_FIELDS = ('category', 'platform', 'type', 'image')
+
+
+def normalize(value) -> str:
+    """Case- and decoration-insensitive key ("📖 Documentation" -> "documentation")"""
+    return " ".join(TOKEN_RE.findall(str(value).lower()))
+
+
+def tokenize(text) -> List[str]:
+    return [t for t in TOKEN_RE.findall(str(text).lower()) if len(t) >= MIN_TOKEN_LENGTH]
+
+
+def image_keys(image: str) -> Set[str]:
+    """Lookup keys for an image reference
+
+    "lscr.io/linuxserver/bookstack:stable" is found by its full repository,
+    the repository without registry ("linuxserver/bookstack") and its last
+    path component ("bookstack"). Official images also match "library/x".
+    """
+    ref = image.strip().lower().split('@', 1)[0]
+    last = ref.rsplit('/', 1)[-1]
+    if ':' in last:
+        ref = ref[:len(ref) - len(last)] + last.split(':', 1)[0]
+    parts = ref.split('/')
+    if len(parts) > 1 and ('.' in parts[0] or ':' in parts[0] or parts[0] == 'localhost'):
+        parts = parts[1:]
+    keys = {ref, "/".join(parts), parts[-1]}
+    if len(parts) == 1:
+        keys.add(f"library/{parts[0]}")
+    return keys
+
+
+class TemplateIndex:
+    """Inverted indexes from normalized field values to template positions"""
+
+    def __init__(self, templates: Iterable[dict]):
+        self.templates: List[dict] = [t for t in templates if isinstance(t, dict)]
+        self.fields: Dict[str, Dict[str, Set[int]]] = {f: defaultdict(set) for f in FILTER_FIELDS}
+        self.tokens: Dict[str, Set[int]] = defaultdict(set)
+        # First template wins when ids or names collide
+        self.ids: Dict[int, int] = {}
+        self.names: Dict[str, int] = {}
+        self.titles: Dict[str, int] = {}
+
+        for pos, template in enumerate(self.templates):
+            template_id = template.get('id')
+            if isinstance(template_id, int) and not isinstance(template_id, bool):
+                self.ids.setdefault(template_id, pos)
+            if template.get('name'):
+                self.names.setdefault(str(template['name']).strip().lower(), pos)
+            if template.get('title'):
+                self.titles.setdefault(str(template['title']).strip().lower(), pos)
+            for category in template.get('categories') or []:
+                self.fields['category'][normalize(category)].add(pos)
+            if template.get('platform'):
+                self.fields['platform'][normalize(template['platform'])].add(pos)
+            if template.get('type') is not None:
+                self.fields['type'][str(template['type'])].add(pos)
+            if isinstance(template.get('image'), str):
+                for key in image_keys(template['image']):
+                    self.fields['image'][key].add(pos)
+            for field in ('title', 'description', 'name', 'note'):
+                for token in tokenize(template.get(field) or ''):
+                    self.tokens[token].add(pos)
+
+        self.vocabulary = sorted(self.tokens)
+
+    def by_id(self, template_id: str) -> Optional[int]:
+        """Position of the template with this integer id"""
+        template_id = template_id.strip()
+        if not template_id.isdigit():
+            return None
+        return self.ids.get(int(template_id))
+
+    def by_name(self, name: str) -> Optional[int]:
+        """Position by stack name, falling back to the title (case-insensitive)
+
+        Most catalog entries have no ``name``, so "Duck DNS" and "duckdns"
+        both resolve.
+        """
+        key = name.strip().lower()
+        pos = self.names.get(key)
+        return pos if pos is not None else self.titles.get(key)
+
+    def match_field(self, field: str, values: Iterable[str]) -> Set[int]:
+        """Positions matching any of the values (OR within one field)"""
+        index = self.fields[field]
+        matched: Set[int] = set()
+        for value in values:
+            key = value.strip().lower() if field == 'image' else normalize(value)
+            matched |= index.get(key, set())
+        return matched
+
+    def match_text(self, query: str) -> Optional[Set[int]]:
+        """Positions containing every query token as a word prefix (AND)"""
+        result: Optional[Set[int]] = None
+        for token in tokenize(query):
+            matched: Set[int] = set()
+            start = bisect_left(self.vocabulary, token)
+            for word in self.vocabulary[start:]:
+                if not word.startswith(token):
+                    break
+                matched |= self.tokens[word]
+            result = matched if result is None else result & matched
+            if not result:
+                return set()
+        return result
+
+    def search(self, category: Iterable[str] = (), platform: Iterable[str] = (),
+               type: Iterable[str] = (), image: Iterable[str] = (), q: str = '') -> List[dict]:
+        """Templates matching all given filters, in catalog order"""
+        result: Optional[Set[int]] = None
+        for field, values in (('category', category), ('platform', platform),
+                              ('type', type), ('image', image)):
+            values = [v for v in values if v]
+            if not values:
+                continue
+            if field == 'type' and not all(v.strip().isdigit() for v in values):
+                raise ValueError("type must be an integer (1 container, 2 swarm stack, 3 compose stack)")
+            matched = self.match_field(field, values)
+            result = matched if result is None else result & matched
+        if q:
+            matched = self.match_text(q)
+            if matched is not None:
+                result = matched if result is None else result & matched
+
+        if result is None:
+            return list(self.templates)
+        return [self.templates[pos] for pos in sorted(result)]
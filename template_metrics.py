@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+"""
+Template Metrics - Prometheus text exposition for the template servers
+Each thread records into its own shard (plain dicts only that thread
+writes), so the request path never takes a lock. A scrape sums the
+shards; in pre-fork mode every worker also publishes its totals to a
+shared directory and the scraped worker merges them.
+"""
+
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+METRICS_PATH = "/metrics"
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+PUBLISH_INTERVAL = 2.0            # seconds between worker snapshots in pre-fork mode
+MAX_SHARDS = 256                  # fold shards of finished threads beyond this
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+RELOAD_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# name -> (type, help, label names, histogram buckets)
+METRICS = {
+    'template_server_requests_total': (
+        'counter', "HTTP requests served", ('path', 'status', 'encoding'), None),
+    'template_server_request_duration_seconds': (
+        'histogram', "Time from request line to response sent", ('path',), LATENCY_BUCKETS),
+    'template_server_response_bytes_total': (
+        'counter', "Response body bytes sent", ('path',), None),
+    'template_server_conditional_requests_total': (
+        'counter', "Catalog requests carrying validators, by outcome", ('result',), None),
+    'template_server_query_cache_total': (
+        'counter', "Filtered query cache lookups", ('result',), None),
+    'template_server_cache_lookups_total': (
+        'counter', "Snapshot and encoded-body cache lookups", ('cache', 'result'), None),
+    'template_server_active_connections': (
+        'gauge', "Open client connections", (), None),
+    'template_server_connections_total': (
+        'counter', "Accepted client connections by transport", ('transport',), None),
+    'template_server_catalog_reloads_total': (
+        'counter', "Catalog file (re)loads", ('result',), None),
+    'template_server_catalog_reload_duration_seconds': (
+        'histogram', "Time to read, validate and pre-encode the catalog", (), RELOAD_BUCKETS),
+    'template_server_templates': (
+        'gauge', "Templates in the current catalog", (), None),
+    'template_server_collection_rebuilds_total': (
+        'counter', "Composition collections re-filtered after their files changed", ('collection',), None),
+    'template_server_rate_limited_total': (
+        'counter', "Requests and connections refused with 429", ('reason',), None),
+    'template_server_access_log_dropped_total': (
+        'counter', "Access log records dropped because the queue was full", (), None),
+    'template_server_pool_queue_depth': (
+        'gauge', "Connections waiting for a pool worker", (), None),
+    'template_server_pool_busy_workers': (
+        'gauge', "Pool workers serving a connection", (), None),
+    'template_server_pool_queue_wait_seconds': (
+        'histogram', "Time accepted connections waited for a pool worker", (), LATENCY_BUCKETS),
+    'template_server_shed_total': (
+        'counter', "Connections refused with 503 because the pool queue was full", (), None),
+    'template_server_phase_duration_seconds': (
+        'histogram', "Time spent per request phase (sampled requests only)", ('phase',), LATENCY_BUCKETS),
+    'template_server_catalog_ready': (
+        'gauge', "1 once a validated catalog snapshot is in service", (), None),
+}
+
+
+class Shard:
+    """Counters and histograms written by a single thread"""
+
+    def __init__(self):
+        self.thread = threading.current_thread()
+        self.values: Dict[Tuple[str, Tuple[str, ...]], float] = {}
+        # (name, labels) -> [bucket counts..., +Inf count, sum]
+        self.histograms: Dict[Tuple[str, Tuple[str, ...]], List[float]] = {}
+
+
+class MetricsRegistry:
+    """Lock-free recording, aggregation at scrape time"""
+
+    def __init__(self):
+        self._local = threading.local()
+        self._shards: List[Shard] = []
+        self._retired = Shard()
+        self._lock = threading.Lock()   # shard registration and scrapes only
+        self.gauges: Dict[str, Callable[[], float]] = {}
+        self.peer_dir: Optional[str] = None
+        self.worker: Optional[int] = None
+        self._published = 0.0
+
+    def _shard(self) -> Shard:
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = Shard()
+            with self._lock:
+                self._shards.append(shard)
+                if len(self._shards) > MAX_SHARDS:
+                    self._fold_finished()
+        return shard
+
+    def inc(self, name: str, labels: Tuple[str, ...] = (), value: float = 1):
+        values = self._shard().values
+        key = (name, labels)
+        values[key] = values.get(key, 0) + value
+
+    def observe(self, name: str, value: float, labels: Tuple[str, ...] = ()):
+        histograms = self._shard().histograms
+        key = (name, labels)
+        counts = histograms.get(key)
+        if counts is None:
+            buckets = METRICS[name][3]
+            counts = histograms[key] = [0] * (len(buckets) + 2)
+        counts[bisect_left(METRICS[name][3], value)] += 1
+        counts[-1] += value
+
+    def gauge(self, name: str, read: Callable[[], float]):
+        """Gauge evaluated at scrape time (process-wide, not summed over workers)"""
+        self.gauges[name] = read
+
+    def reset(self):
+        """Forget everything recorded so far (e.g. state inherited across fork)"""
+        with self._lock:
+            self._shards = []
+            self._retired = Shard()
+            self._local = threading.local()
+
+    # -- aggregation ---------------------------------------------------------
+
+    def _fold_finished(self):
+        """Merge shards of exited threads into the retired totals (lock held)"""
+        alive = []
+        for shard in self._shards:
+            if shard.thread.is_alive():
+                alive.append(shard)
+            else:
+                merge(self._retired.values, self._retired.histograms,
+                      shard.values, shard.histograms)
+        self._shards = alive
+
+    def collect(self) -> Tuple[Dict, Dict]:
+        """Totals for this process"""
+        with self._lock:
+            self._fold_finished()
+            values = dict(self._retired.values)
+            histograms = {k: list(v) for k, v in self._retired.histograms.items()}
+            for shard in self._shards:
+                # dict() / list() copies are atomic under the GIL, so the
+                # owning thread can keep writing while we read
+                merge(values, histograms, dict(shard.values),
+                      {k: list(v) for k, v in dict(shard.histograms).items()})
+        return values, histograms
+
+    def publish(self, force: bool = False):
+        """Write this worker's totals for its peers (pre-fork mode only)"""
+        if self.peer_dir is None or self.worker is None:
+            return
+        now = time.monotonic()
+        if not force and now - self._published < PUBLISH_INTERVAL:
+            return
+        self._published = now
+        values, histograms = self.collect()
+        document = {
+            'values': [[name, list(labels), value] for (name, labels), value in values.items()],
+            'histograms': [[name, list(labels), counts]
+                           for (name, labels), counts in histograms.items()],
+        }
+        path = os.path.join(self.peer_dir, f"worker-{self.worker}.json")
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, 'w') as f:
+            json.dump(document, f)
+        os.replace(tmp, path)
+
+    def collect_all(self) -> Tuple[Dict, Dict]:
+        """Totals for this process plus the last published totals of its peers"""
+        if self.peer_dir is None or self.worker is None:
+            return self.collect()
+        self.publish(force=True)
+        values: Dict = {}
+        histograms: Dict = {}
+        for entry in sorted(os.listdir(self.peer_dir)):
+            if not entry.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(self.peer_dir, entry)) as f:
+                    document = json.load(f)
+            except (OSError, ValueError):
+                continue
+            merge(values, histograms,
+                  {(name, tuple(labels)): value for name, labels, value in document['values']},
+                  {(name, tuple(labels)): counts for name, labels, counts in document['histograms']})
+        return values, histograms
+
+    def render(self) -> bytes:
+        """Prometheus text exposition format (version 0.0.4)"""
+        values, histograms = self.collect_all()
+        for name, read in self.gauges.items():
+            try:
+                values[(name, ())] = read()
+            except Exception:
+                pass
+
+        lines = []
+        for name, (kind, help_text, label_names, buckets) in METRICS.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            if kind == 'histogram':
+                for (metric, labels), counts in sorted(histograms.items()):
+                    if metric != name:
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(buckets + (float('inf'),), counts):
+                        cumulative += count
+                        le = "+Inf" if bound == float('inf') else repr(bound)
+                        lines.append(f"{name}_bucket{format_labels(label_names + ('le',), labels + (le,))} "
+                                     f"{cumulative}")
+                    lines.append(f"{name}_sum{format_labels(label_names, labels)} {counts[-1]}")
+                    lines.append(f"{name}_count{format_labels(label_names, labels)} {cumulative}")
+            else:
+                for (metric, labels), value in sorted(values.items()):
+                    if metric == name:
+                        lines.append(f"{name}{format_labels(label_names, labels)} {format_value(value)}")
+        return ("\n".join(lines) + "\n").encode('utf-8')
+
+
+def merge(values: Dict, histograms: Dict, more_values: Dict, more_histograms: Dict):
+    for key, value in more_values.items():
+        values[key] = values.get(key, 0) + value
+    for key, counts in more_histograms.items():
+        total = histograms.get(key)
+        if total is None:
+            histograms[key] = list(counts)
+        else:
+            for i, count in enumerate(counts):
+                total[i] += count
+
+
+def escape_label(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def format_labels(names: Iterable[str], values: Iterable[str]) -> str:
+    pairs = [f'{name}="{escape_label(value)}"' for name, value in zip(names, values)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+# Process-wide registry shared by every server in this repository
+REGISTRY = MetricsRegistry()
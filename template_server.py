@@ -6,27 +6,32 @@ Serves Portainer templates with proper CORS headers for web integration
 
 import http.server
 import socketserver
-import json
 import os
 import sys
 import socket
 import threading
 from pathlib import Path
 
+from template_cache import (
+    CACHE_CONTROL, CachedCatalogMixin, KeepAliveMixin, TemplateCache, report_listening, start_warmup,
+)
+
 # Configuration
 PORT = 8091
 BIND_HOST_V4 = "0.0.0.0"  # IPv4 binding
 BIND_HOST_V6 = "::"       # IPv6 binding
 
-class IPv4Server(socketserver.TCPServer):
-    """IPv4 TCP Server"""
+class IPv4Server(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    """IPv4 TCP Server (threaded so idle keep-alive clients don't block others)"""
     address_family = socket.AF_INET
     allow_reuse_address = True
+    daemon_threads = True
 
-class IPv6Server(socketserver.TCPServer):
+class IPv6Server(socketserver.ThreadingMixIn, socketserver.TCPServer):
     """IPv6 TCP Server with dual-stack support"""
     address_family = socket.AF_INET6
     allow_reuse_address = True
+    daemon_threads = True
     
     def __init__(self, server_address, RequestHandlerClass, bind_and_activate=True):
         super().__init__(server_address, RequestHandlerClass, bind_and_activate=False)
@@ -59,7 +64,7 @@ class DualStackTCPServer(socketserver.TCPServer):
                 print(f"IPv6 binding also failed: {e2}")
                 raise
 
-class PortainerTemplateHandler(http.server.SimpleHTTPRequestHandler):
+class PortainerTemplateHandler(KeepAliveMixin, CachedCatalogMixin, http.server.SimpleHTTPRequestHandler):
     """Custom handler with CORS headers for Portainer compatibility"""
     
     def end_headers(self):
@@ -67,15 +72,12 @@ class PortainerTemplateHandler(http.server.SimpleHTTPRequestHandler):
         self.send_header('Access-Control-Allow-Origin', '*')
         self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
         self.send_header('Access-Control-Allow-Headers', 'Content-Type')
-        self.send_header('Cache-Control', 'no-cache, no-store, must-revalidate')
-        self.send_header('Pragma', 'no-cache')
-        self.send_header('Expires', '0')
+        self.send_header('Cache-Control', CACHE_CONTROL)
         super().end_headers()
     
     def do_OPTIONS(self):
         """Handle OPTIONS requests for CORS preflight"""
-        self.send_response(200)
-        self.end_headers()
+        self.send_empty_response(200)
     
     def log_message(self, format, *args):
         """Custom log format"""
@@ -95,15 +97,10 @@ def main():
         print("❌ portainer-template.json not found in web directory!")
         sys.exit(1)
     
-    # Validate JSON
-    try:
-        with open(template_file, 'r') as f:
-            data = json.load(f)
-            template_count = len(data.get('templates', []))
-            print(f"✅ Template validation successful - {template_count} templates found")
-    except Exception as e:
-        print(f"❌ Template validation failed: {e}")
-        sys.exit(1)
+    # Validate JSON in the background; the raw file is served until it is ready
+    cache = TemplateCache(template_file)
+    start_warmup(cache)
+    PortainerTemplateHandler.template_cache = cache
     
     # Change to web directory
     os.chdir(str(web_dir))
@@ -113,7 +110,6 @@ def main():
     print(f"🌐 IPv4 Server: http://{BIND_HOST_V4}:{PORT}")
     print(f"🌐 IPv6 Server: http://[{BIND_HOST_V6}]:{PORT}")
     print(f"🔗 Template URL: http://localhost:{PORT}/portainer-template.json")
-    print(f"📊 Templates available: {template_count}")
     
     servers = []
     threads = []
@@ -146,6 +142,7 @@ def main():
             sys.exit(1)
         
         print(f"✅ Server(s) started successfully on port {PORT}")
+        report_listening()
         print("🔄 Server is running... (Ctrl+C to stop)")
         
         # Keep main thread alive
@@ -3,19 +3,26 @@
 🚀 Simple Template Server - Alternative Port
 Serves Portainer templates on port 8092
 """
-import json
 import logging
 from http.server import HTTPServer, SimpleHTTPRequestHandler
-from pathlib import Path
 import socketserver
 import os
 
+from template_cache import CACHE_CONTROL, CachedCatalogMixin, TemplateCache, report_listening, start_warmup
+
 # Logging setup
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-class TemplateHandler(SimpleHTTPRequestHandler):
+class TemplateHandler(CachedCatalogMixin, SimpleHTTPRequestHandler):
+    catalog_headers = (
+        ('Access-Control-Allow-Origin', '*'),
+        ('Access-Control-Allow-Methods', 'GET, POST, OPTIONS'),
+        ('Access-Control-Allow-Headers', 'Content-Type'),
+        ('Cache-Control', CACHE_CONTROL),
+    )
+    
     def do_GET(self):
-        if self.path == '/portainer-template.json':
+        if self.is_catalog_request():
             self.serve_template()
         elif self.path == '/':
             self.serve_index()
@@ -23,47 +30,12 @@ class TemplateHandler(SimpleHTTPRequestHandler):
             super().do_GET()
     
     def serve_template(self):
-        """Serve the Portainer template JSON"""
-        template_path = Path('web/portainer-template.json')
-        
-        if not template_path.exists():
-            self.send_error(404, 'Template not found')
-            return
-        
-        try:
-            with open(template_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            
-            # Set CORS headers
-            self.send_response(200)
-            self.send_header('Content-Type', 'application/json')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
-            self.send_header('Access-Control-Allow-Headers', 'Content-Type')
-            self.end_headers()
-            
-            # Send JSON data
-            json_data = json.dumps(data, indent=2, ensure_ascii=False)
-            self.wfile.write(json_data.encode('utf-8'))
-            
-            logging.info(f"✅ Template served: {len(data.get('templates', []))} templates")
-            
-        except Exception as e:
-            logging.error(f"❌ Error serving template: {e}")
-            self.send_error(500, f'Internal server error: {e}')
+        """Serve the Portainer template JSON from the in-memory cache"""
+        self.send_catalog()
     
     def serve_index(self):
         """Serve a simple status page"""
-        template_path = Path('web/portainer-template.json')
-        template_count = 0
-        
-        if template_path.exists():
-            try:
-                with open(template_path, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    template_count = len(data.get('templates', []))
-            except:
-                pass
+        template_count = self.template_cache.template_count
         
         html = f"""
         <!DOCTYPE html>
@@ -117,24 +89,17 @@ def main():
     port = 8092
     
     # Change to the correct directory
-    os.chdir('/home/holythreekingstreescrowns/Schreibtisch/Portainer Template')
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
     
     try:
+        TemplateHandler.template_cache = TemplateCache('web/portainer-template.json')
+        start_warmup(TemplateHandler.template_cache)
+        
         with socketserver.TCPServer(("", port), TemplateHandler) as httpd:
-            template_path = Path('web/portainer-template.json')
-            template_count = 0
-            
-            if template_path.exists():
-                try:
-                    with open(template_path, 'r', encoding='utf-8') as f:
-                        data = json.load(f)
-                        template_count = len(data.get('templates', []))
-                except:
-                    pass
+            report_listening()
             
             logging.info("🚀 PORTAINER TEMPLATE SERVER")
             logging.info("=" * 50)
-            logging.info(f"📊 Templates loaded: {template_count}")
             logging.info(f"🌐 Server starting on port {port}")
             logging.info(f"🔗 Template URL: http://localhost:{port}/portainer-template.json")
             logging.info(f"📊 Status page: http://localhost:{port}/")
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+Template Variants - structure-sharing store for the web/ catalog variants
+The dozens of portainer-template-*.json variants are mostly the same
+templates with a few different top-level blocks. Every variant is parsed
+into one shared pool: identical subtrees (templates, env lists, labels,
+...) and strings are deduplicated by content hash, so a variant is just a
+small top-level object referencing shared nodes and memory grows with
+the differences between variants, not with their count. Encoded bodies
+are built on first request and kept in a small LRU.
+"""
+
+import hashlib
+import json
+import sys
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from template_cache import (
+    TEMPLATE_FILENAME, EncodedBody, encode_json, file_signature, http_date, record_lookup,
+)
+
+VARIANT_GLOB = "portainer-template*.json"
+VARIANT_CACHE_SIZE = 4            # encoded variants kept in memory
+
+
+def content_hash(node) -> bytes:
+    """Hash of a JSON subtree's canonical encoding (key order kept: it is served)"""
+    encoded = json.dumps(node, ensure_ascii=False, separators=(',', ':'))
+    return hashlib.blake2b(encoded.encode('utf-8', 'surrogatepass'), digest_size=16).digest()
+
+
+class NodePool:
+    """Hash-consing table: one shared object per distinct JSON subtree
+
+    Shared nodes are referenced by several variants and must never be
+    mutated.
+    """
+
+    def __init__(self):
+        self.nodes: Dict[bytes, object] = {}
+        self.strings: Dict[str, str] = {}
+
+    def intern(self, node):
+        """Shared equivalent of a freshly parsed JSON value"""
+        if isinstance(node, str):
+            return self.strings.setdefault(node, node)
+        if not isinstance(node, (dict, list)):
+            # Numbers, booleans and null are small (and mostly cached) already
+            return node
+        # A known subtree is reused whole without looking inside it
+        key = content_hash(node)
+        shared = self.nodes.get(key)
+        if shared is None:
+            if isinstance(node, dict):
+                shared = {sys.intern(name): self.intern(value) for name, value in node.items()}
+            else:
+                shared = [self.intern(value) for value in node]
+            self.nodes[key] = shared
+        return shared
+
+    def prune(self, roots: List[object]):
+        """Forget pool entries no longer reachable from ``roots``"""
+        seen = set()
+        stack = list(roots)
+        while stack:
+            node = stack.pop()
+            if id(node) in seen:
+                continue
+            seen.add(id(node))
+            if isinstance(node, dict):
+                stack.extend(node.values())
+            elif isinstance(node, list):
+                stack.extend(node)
+        self.nodes = {key: node for key, node in self.nodes.items() if id(node) in seen}
+        self.strings = {key: value for key, value in self.strings.items() if id(value) in seen}
+
+
+@dataclass
+class Variant:
+    """One catalog file, expressed as references into the shared pool"""
+    name: str
+    path: Path
+    signature: Tuple[int, int, int]
+    last_modified: str
+    document: object
+
+
+class VariantStore:
+    """Catalog variants below a web directory, parsed once and served from memory
+
+    ``get`` returns None for unknown names (and until ``load`` has run),
+    so callers fall back to serving the file from disk.
+    """
+
+    def __init__(self, web_dir, cache_size: int = VARIANT_CACHE_SIZE,
+                 exclude: Tuple[str, ...] = (TEMPLATE_FILENAME,)):
+        self.web_dir = Path(web_dir)
+        self.cache_size = cache_size
+        self.exclude = exclude
+        self.pool = NodePool()
+        self.variants: Dict[str, Variant] = {}
+        self.encoded: 'OrderedDict[Tuple[str, Tuple[int, int, int]], EncodedBody]' = OrderedDict()
+        self.ready = False
+        self._lock = threading.Lock()        # variants and the encoded LRU
+        self._pool_lock = threading.Lock()   # interning and pruning
+
+    def start(self) -> 'VariantStore':
+        """Load in a background thread (the files stay servable from disk meanwhile)"""
+        threading.Thread(target=self.load, name="variant-load", daemon=True).start()
+        return self
+
+    def load(self) -> 'VariantStore':
+        started = time.perf_counter()
+        for path in sorted(self.web_dir.glob(VARIANT_GLOB)):
+            if path.name in self.exclude:
+                continue
+            try:
+                variant = self._parse(path)
+            except (OSError, ValueError) as e:
+                print(f"⚠️ Skipping catalog variant {path.name}: {e}")
+                continue
+            with self._lock:
+                self.variants[variant.name] = variant
+        self.ready = True
+        stats = self.stats()
+        print(f"🧬 {stats['variants']} catalog variants loaded in "
+              f"{time.perf_counter() - started:.1f}s ({stats['shared_nodes']} shared nodes)")
+        return self
+
+    def _parse(self, path: Path) -> Variant:
+        signature = file_signature(path)
+        with open(path, 'rb') as f:
+            data = json.loads(f.read())
+        with self._pool_lock:
+            document = self.pool.intern(data)
+        return Variant(path.name, path, signature,
+                       http_date(signature[0] // 1_000_000_000), document)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.variants
+
+    def get(self, name: str) -> Optional[EncodedBody]:
+        """Encoded variant (e.g. "portainer-template-gold-certified.json"), or None"""
+        variant = self.variants.get(name)
+        if variant is None:
+            return None
+        try:
+            if file_signature(variant.path) != variant.signature:
+                variant = self._reload(variant)
+        except (OSError, ValueError):
+            # Deleted or half-written: let the static file handler answer
+            return None
+
+        key = (variant.name, variant.signature)
+        with self._lock:
+            body = self.encoded.get(key)
+            if body is not None:
+                self.encoded.move_to_end(key)
+        record_lookup('variant', body is not None)
+        if body is not None:
+            return body
+        body = EncodedBody.build(encode_json(variant.document), variant.last_modified)
+        with self._lock:
+            self.encoded[key] = body
+            while len(self.encoded) > self.cache_size:
+                self.encoded.popitem(last=False)
+        return body
+
+    def _reload(self, old: Variant) -> Variant:
+        variant = self._parse(old.path)
+        with self._lock:
+            self.variants[variant.name] = variant
+            roots = [v.document for v in self.variants.values()]
+        with self._pool_lock:
+            self.pool.prune(roots)
+        return variant
+
+    def stats(self) -> dict:
+        return {
+            'variants': len(self.variants),
+            'shared_nodes': len(self.pool.nodes),
+            'shared_strings': len(self.pool.strings),
+            'encoded': len(self.encoded),
+        }
@@ -11,281 +11,341 @@ from pathlib import Path
 import socketserver
 import os
 import threading
+from urllib.parse import parse_qs
+
+from template_cache import CACHE_CONTROL, CachedCatalogMixin, TemplateCache, report_listening, start_warmup
 
 # Logging setup
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-class TestTemplateHandler(SimpleHTTPRequestHandler):
+# Seconds between checks of the catalog version by the background test runner
+TEST_WATCH_INTERVAL = 5.0
+
+def run_comprehensive_tests(base_dir='.', data=None):
+    """Run comprehensive deployment tests against a project directory
+
+    ``data`` is an already parsed catalog (e.g. a cache snapshot); without
+    it the template file is read from ``base_dir``.
+    """
+    base_dir = Path(base_dir)
+    results = {
+        "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "tests": {}
+    }
+
+    # Test 1: JSON Validation
+    template_path = base_dir / 'web' / 'portainer-template.json'
+    try:
+        if data is None:
+            with open(template_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        results["tests"]["json_validation"] = {
+            "status": "✅ PASS",
+            "templates_count": len(data.get('templates', [])),
+            "message": "JSON is valid and parseable"
+        }
+    except Exception as e:
+        results["tests"]["json_validation"] = {
+            "status": "❌ FAIL",
+            "error": str(e)
+        }
+
+    # Test 2: Portainer Format Validation
+    try:
+        # Check for common Portainer format issues
+        format_issues = []
+        for i, template in enumerate(data.get('templates', [])):
+            if 'ports' in template:
+                for port in template['ports']:
+                    if isinstance(port, dict):
+                        format_issues.append(f"Template {i}: Port should be string, not dict")
+
+        if format_issues:
+            results["tests"]["portainer_format"] = {
+                "status": "❌ FAIL",
+                "issues": format_issues
+            }
+        else:
+            results["tests"]["portainer_format"] = {
+                "status": "✅ PASS",
+                "message": "All templates are Portainer-compatible"
+            }
+    except Exception as e:
+        results["tests"]["portainer_format"] = {
+            "status": "❌ FAIL",
+            "error": str(e)
+        }
+
+    # Test 3: Stack File Validation
+    stack_results = []
+    stack_dir = base_dir / 'stacks'
+    if stack_dir.exists():
+        for stack_file in stack_dir.glob('*.yml'):
+            try:
+                # Basic YAML validation would go here
+                stack_results.append({
+                    "file": stack_file.name,
+                    "status": "✅ EXISTS",
+                    "size": stack_file.stat().st_size
+                })
+            except Exception as e:
+                stack_results.append({
+                    "file": stack_file.name,
+                    "status": "❌ ERROR",
+                    "error": str(e)
+                })
+
+    results["tests"]["stack_validation"] = {
+        "status": "✅ PASS" if stack_results else "⚠️ NO_STACKS",
+        "stacks": stack_results
+    }
+
+    return results
+
+class TestResultsCache:
+    """Comprehensive test results, recomputed in the background per catalog version
+
+    A single worker thread reruns the suite when the catalog content hash
+    changes (or on ``refresh()``); requests only ever read the last
+    encoded result.
+    """
+
+    def __init__(self, template_cache, base_dir='.', interval=TEST_WATCH_INTERVAL):
+        self.template_cache = template_cache
+        self.base_dir = base_dir
+        self.interval = interval
+        self.results = None
+        self.body = None
+        self.running = False
+        self._refresh = False
+        self._wake = threading.Event()
+
+    def start(self):
+        threading.Thread(target=self._worker, name="test-runner", daemon=True).start()
+        return self
+
+    def refresh(self):
+        """Rerun the suite even if the catalog did not change"""
+        self._refresh = True
+        self._wake.set()
+
+    def _worker(self):
+        while True:
+            try:
+                snapshot = self.template_cache.get()
+            except Exception:
+                snapshot = None
+            version = snapshot.version if snapshot else None
+            if self._refresh or self.results is None or self.results["catalog_version"] != version:
+                self._refresh = False
+                self.running = True
+                started = time.perf_counter()
+                try:
+                    results = run_comprehensive_tests(self.base_dir, snapshot.data if snapshot else None)
+                except Exception as e:
+                    results = {"timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+                               "tests": {}, "error": str(e)}
+                results["catalog_version"] = version
+                results["duration_ms"] = round((time.perf_counter() - started) * 1000, 1)
+                self.body = json.dumps(results, indent=2, ensure_ascii=False).encode('utf-8')
+                self.results = results
+                self.running = False
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+def render_dashboard(template_count, server_status, port=8094):
+    """Render the test dashboard HTML"""
+    return f"""
+    <!DOCTYPE html>
+    <html>
+    <head>
+        <title>🧪 Portainer Template Test Dashboard</title>
+        <meta charset="utf-8">
+        <style>
+            body {{ font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif; margin: 0; background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); color: white; }}
+            .container {{ max-width: 1200px; margin: 0 auto; padding: 20px; }}
+            .header {{ text-align: center; margin-bottom: 30px; }}
+            .status-grid {{ display: grid; grid-template-columns: repeat(auto-fit, minmax(300px, 1fr)); gap: 20px; margin-bottom: 30px; }}
+            .status-card {{ background: rgba(255,255,255,0.1); backdrop-filter: blur(10px); border-radius: 15px; padding: 20px; border: 1px solid rgba(255,255,255,0.2); }}
+            .status-icon {{ font-size: 2em; margin-bottom: 10px; }}
+            .test-section {{ background: rgba(255,255,255,0.1); backdrop-filter: blur(10px); border-radius: 15px; padding: 20px; margin-bottom: 20px; }}
+            .test-button {{ background: #28a745; color: white; border: none; padding: 12px 24px; border-radius: 8px; cursor: pointer; font-size: 16px; margin: 10px; }}
+            .test-button:hover {{ background: #218838; }}
+            .url-box {{ background: rgba(0,0,0,0.3); padding: 15px; border-radius: 10px; margin: 10px 0; font-family: monospace; }}
+            .count {{ font-size: 3em; font-weight: bold; color: #ffd700; }}
+            .live-status {{ display: inline-block; width: 10px; height: 10px; background: #28a745; border-radius: 50%; margin-right: 8px; animation: pulse 2s infinite; }}
+            @keyframes pulse {{ 0% {{ opacity: 1; }} 50% {{ opacity: 0.5; }} 100% {{ opacity: 1; }} }}
+            .refresh-btn {{ background: #007bff; }}
+            .test-results {{ background: rgba(0,0,0,0.3); padding: 15px; border-radius: 10px; margin-top: 15px; max-height: 400px; overflow-y: auto; }}
+        </style>
+    </head>
+    <body>
+        <div class="container">
+            <div class="header">
+                <h1>🧪 Portainer Template Test Dashboard</h1>
+                <p><span class="live-status"></span>Comprehensive Deployment Testing Suite</p>
+            </div>
+
+            <div class="status-grid">
+                <div class="status-card">
+                    <div class="status-icon">📊</div>
+                    <h3>Template Collection</h3>
+                    <div class="count">{template_count}</div>
+                    <p>Templates Available</p>
+                </div>
+
+                <div class="status-card">
+                    <div class="status-icon">🚀</div>
+                    <h3>Server Status</h3>
+                    <p style="font-size: 1.5em; margin: 10px 0;">{server_status}</p>
+                    <p>Test Server Active</p>
+                </div>
+
+                <div class="status-card">
+                    <div class="status-icon">💎</div>
+                    <h3>Certification</h3>
+                    <p>✅ Pink Star Diamond</p>
+                    <p>✅ EU-GDPR Compliant</p>
+                    <p>✅ Portainer Compatible</p>
+                </div>
+            </div>
+
+            <div class="test-section">
+                <h2>🔗 Template URLs</h2>
+                <div class="url-box">
+                    <strong>Local Test Server:</strong><br>
+                    <a href="/portainer-template.json" style="color: #ffd700;">http://localhost:{port}/portainer-template.json</a>
+                </div>
+                <div class="url-box">
+                    <strong>GitHub Production:</strong><br>
+                    <a href="https://raw.githubusercontent.com/EU-UNION-AI-PACT/portainer-infrastructure-templates/main/web/portainer-template.json" style="color: #ffd700;" target="_blank">https://raw.githubusercontent.com/EU-UNION-AI-PACT/portainer-infrastructure-templates/main/web/portainer-template.json</a>
+                </div>
+            </div>
+
+            <div class="test-section">
+                <h2>🧪 Testing Suite</h2>
+                <button class="test-button" onclick="runTests()">🚀 Run Full Test Suite</button>
+                <button class="test-button refresh-btn" onclick="location.reload()">🔄 Refresh Dashboard</button>
+                <button class="test-button" onclick="testPortainerLoad()">🐳 Test Portainer Load</button>
+
+                <div id="test-results" class="test-results" style="display: none;">
+                    <h3>📋 Test Results</h3>
+                    <div id="results-content">Running tests...</div>
+                </div>
+            </div>
+
+            <div class="test-section">
+                <h2>📊 Quick Stats</h2>
+                <p>🕒 Last Updated: {time.strftime("%Y-%m-%d %H:%M:%S")}</p>
+                <p>🌍 Server Port: {port}</p>
+                <p>📂 Template File: web/portainer-template.json</p>
+                <p>🔄 Auto-refresh: Every 30 seconds</p>
+            </div>
+        </div>
+
+        <script>
+            function runTests() {{
+                document.getElementById('test-results').style.display = 'block';
+                document.getElementById('results-content').innerHTML = '🔄 Running comprehensive tests...';
+
+                fetch('/test')
+                    .then(response => response.json())
+                    .then(data => {{
+                        let html = '<pre>' + JSON.stringify(data, null, 2) + '</pre>';
+                        document.getElementById('results-content').innerHTML = html;
+                    }})
+                    .catch(error => {{
+                        document.getElementById('results-content').innerHTML = '❌ Error: ' + error;
+                    }});
+            }}
+
+            function testPortainerLoad() {{
+                document.getElementById('test-results').style.display = 'block';
+                document.getElementById('results-content').innerHTML = '🐳 Testing Portainer template load...';
+
+                fetch('/portainer-template.json')
+                    .then(response => response.json())
+                    .then(data => {{
+                        let result = '✅ SUCCESS: Template loaded with ' + data.templates.length + ' templates\\n';
+                        result += '📊 Categories found: ' + new Set(data.templates.flatMap(t => t.categories || [])).size;
+                        document.getElementById('results-content').innerHTML = '<pre>' + result + '</pre>';
+                    }})
+                    .catch(error => {{
+                        document.getElementById('results-content').innerHTML = '❌ Error loading template: ' + error;
+                    }});
+            }}
+
+            // Auto-refresh every 30 seconds
+            setTimeout(() => location.reload(), 30000);
+        </script>
+    </body>
+    </html>
+    """
+
+def wants_refresh(query) -> bool:
+    """True for ?refresh=1 (query as parsed by urllib.parse.parse_qs)"""
+    return query.get('refresh', [''])[0] in ('1', 'true', 'yes')
+
+def test_results_response(test_results, refresh=False):
+    """(status, body) for /test: cached results, or 202 while the first run is pending"""
+    if refresh:
+        test_results.refresh()
+    body = test_results.body
+    if body is None:
+        return 202, json.dumps({"status": "⏳ RUNNING", "message": "Tests are running, retry shortly"},
+                               ensure_ascii=False).encode('utf-8')
+    return 200, body
+
+class TestTemplateHandler(CachedCatalogMixin, SimpleHTTPRequestHandler):
+    catalog_headers = (
+        ('Access-Control-Allow-Origin', '*'),
+        ('Access-Control-Allow-Methods', 'GET, POST, OPTIONS'),
+        ('Access-Control-Allow-Headers', 'Content-Type'),
+        ('Cache-Control', CACHE_CONTROL),
+    )
+    
+    # Shared TestResultsCache, set up in main()
+    test_results = None
+    
     def do_GET(self):
-        if self.path == '/portainer-template.json':
+        path, _, query = self.path.partition('?')
+        if self.is_catalog_request():
             self.serve_template()
-        elif self.path == '/test':
-            self.serve_test_results()
+        elif path == '/test':
+            self.serve_test_results(query)
         elif self.path == '/':
             self.serve_dashboard()
         else:
             super().do_GET()
     
     def serve_template(self):
-        """Serve the Portainer template JSON"""
-        template_path = Path('web/portainer-template.json')
-        
-        if not template_path.exists():
-            self.send_error(404, 'Template not found')
-            return
-        
-        try:
-            with open(template_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            
-            # Set CORS headers for testing
-            self.send_response(200)
-            self.send_header('Content-Type', 'application/json')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
-            self.send_header('Access-Control-Allow-Headers', 'Content-Type')
-            self.send_header('Cache-Control', 'no-cache, no-store, must-revalidate')
-            self.send_header('Pragma', 'no-cache')
-            self.send_header('Expires', '0')
-            self.end_headers()
-            
-            # Send JSON data
-            json_data = json.dumps(data, indent=2, ensure_ascii=False)
-            self.wfile.write(json_data.encode('utf-8'))
-            
-            logging.info(f"✅ Template served: {len(data.get('templates', []))} templates")
-            
-        except Exception as e:
-            logging.error(f"❌ Error serving template: {e}")
-            self.send_error(500, f'Internal server error: {e}')
+        """Serve the Portainer template JSON from the in-memory cache"""
+        self.send_catalog()
     
-    def serve_test_results(self):
-        """Serve comprehensive test results"""
-        results = self.run_comprehensive_tests()
+    def serve_test_results(self, query=''):
+        """Serve the latest comprehensive test results (``?refresh=1`` reruns them)"""
+        status, body = test_results_response(self.test_results, wants_refresh(parse_qs(query)))
         
-        self.send_response(200)
+        self.send_response(status)
         self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
         self.send_header('Access-Control-Allow-Origin', '*')
         self.end_headers()
-        
-        json_data = json.dumps(results, indent=2, ensure_ascii=False)
-        self.wfile.write(json_data.encode('utf-8'))
-    
-    def run_comprehensive_tests(self):
-        """Run comprehensive deployment tests"""
-        results = {
-            "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
-            "tests": {}
-        }
-        
-        # Test 1: JSON Validation
-        template_path = Path('web/portainer-template.json')
-        try:
-            with open(template_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            results["tests"]["json_validation"] = {
-                "status": "✅ PASS",
-                "templates_count": len(data.get('templates', [])),
-                "message": "JSON is valid and parseable"
-            }
-        except Exception as e:
-            results["tests"]["json_validation"] = {
-                "status": "❌ FAIL",
-                "error": str(e)
-            }
-        
-        # Test 2: Portainer Format Validation
-        try:
-            # Check for common Portainer format issues
-            format_issues = []
-            for i, template in enumerate(data.get('templates', [])):
-                if 'ports' in template:
-                    for port in template['ports']:
-                        if isinstance(port, dict):
-                            format_issues.append(f"Template {i}: Port should be string, not dict")
-            
-            if format_issues:
-                results["tests"]["portainer_format"] = {
-                    "status": "❌ FAIL",
-                    "issues": format_issues
-                }
-            else:
-                results["tests"]["portainer_format"] = {
-                    "status": "✅ PASS",
-                    "message": "All templates are Portainer-compatible"
-                }
-        except Exception as e:
-            results["tests"]["portainer_format"] = {
-                "status": "❌ FAIL",
-                "error": str(e)
-            }
-        
-        # Test 3: Stack File Validation
-        stack_results = []
-        stack_dir = Path('stacks')
-        if stack_dir.exists():
-            for stack_file in stack_dir.glob('*.yml'):
-                try:
-                    # Basic YAML validation would go here
-                    stack_results.append({
-                        "file": stack_file.name,
-                        "status": "✅ EXISTS",
-                        "size": stack_file.stat().st_size
-                    })
-                except Exception as e:
-                    stack_results.append({
-                        "file": stack_file.name,
-                        "status": "❌ ERROR",
-                        "error": str(e)
-                    })
-        
-        results["tests"]["stack_validation"] = {
-            "status": "✅ PASS" if stack_results else "⚠️ NO_STACKS",
-            "stacks": stack_results
-        }
-        
-        return results
+        self.wfile.write(body)
     
     def serve_dashboard(self):
         """Serve comprehensive test dashboard"""
-        template_path = Path('web/portainer-template.json')
         template_count = 0
         server_status = "🟢 ONLINE"
         
-        if template_path.exists():
-            try:
-                with open(template_path, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    template_count = len(data.get('templates', []))
-            except:
-                server_status = "🔴 JSON ERROR"
+        try:
+            template_count = self.template_cache.get().template_count
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError):
+            server_status = "🔴 JSON ERROR"
         
-        html = f"""
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <title>🧪 Portainer Template Test Dashboard</title>
-            <meta charset="utf-8">
-            <style>
-                body {{ font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif; margin: 0; background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); color: white; }}
-                .container {{ max-width: 1200px; margin: 0 auto; padding: 20px; }}
-                .header {{ text-align: center; margin-bottom: 30px; }}
-                .status-grid {{ display: grid; grid-template-columns: repeat(auto-fit, minmax(300px, 1fr)); gap: 20px; margin-bottom: 30px; }}
-                .status-card {{ background: rgba(255,255,255,0.1); backdrop-filter: blur(10px); border-radius: 15px; padding: 20px; border: 1px solid rgba(255,255,255,0.2); }}
-                .status-icon {{ font-size: 2em; margin-bottom: 10px; }}
-                .test-section {{ background: rgba(255,255,255,0.1); backdrop-filter: blur(10px); border-radius: 15px; padding: 20px; margin-bottom: 20px; }}
-                .test-button {{ background: #28a745; color: white; border: none; padding: 12px 24px; border-radius: 8px; cursor: pointer; font-size: 16px; margin: 10px; }}
-                .test-button:hover {{ background: #218838; }}
-                .url-box {{ background: rgba(0,0,0,0.3); padding: 15px; border-radius: 10px; margin: 10px 0; font-family: monospace; }}
-                .count {{ font-size: 3em; font-weight: bold; color: #ffd700; }}
-                .live-status {{ display: inline-block; width: 10px; height: 10px; background: #28a745; border-radius: 50%; margin-right: 8px; animation: pulse 2s infinite; }}
-                @keyframes pulse {{ 0% {{ opacity: 1; }} 50% {{ opacity: 0.5; }} 100% {{ opacity: 1; }} }}
-                .refresh-btn {{ background: #007bff; }}
-                .test-results {{ background: rgba(0,0,0,0.3); padding: 15px; border-radius: 10px; margin-top: 15px; max-height: 400px; overflow-y: auto; }}
-            </style>
-        </head>
-        <body>
-            <div class="container">
-                <div class="header">
-                    <h1>🧪 Portainer Template Test Dashboard</h1>
-                    <p><span class="live-status"></span>Comprehensive Deployment Testing Suite</p>
-                </div>
-                
-                <div class="status-grid">
-                    <div class="status-card">
-                        <div class="status-icon">📊</div>
-                        <h3>Template Collection</h3>
-                        <div class="count">{template_count}</div>
-                        <p>Templates Available</p>
-                    </div>
-                    
-                    <div class="status-card">
-                        <div class="status-icon">🚀</div>
-                        <h3>Server Status</h3>
-                        <p style="font-size: 1.5em; margin: 10px 0;">{server_status}</p>
-                        <p>Test Server Active</p>
-                    </div>
-                    
-                    <div class="status-card">
-                        <div class="status-icon">💎</div>
-                        <h3>Certification</h3>
-                        <p>✅ Pink Star Diamond</p>
-                        <p>✅ EU-GDPR Compliant</p>
-                        <p>✅ Portainer Compatible</p>
-                    </div>
-                </div>
-                
-                <div class="test-section">
-                    <h2>🔗 Template URLs</h2>
-                    <div class="url-box">
-                        <strong>Local Test Server:</strong><br>
-                        <a href="/portainer-template.json" style="color: #ffd700;">http://localhost:8094/portainer-template.json</a>
-                    </div>
-                    <div class="url-box">
-                        <strong>GitHub Production:</strong><br>
-                        <a href="https://raw.githubusercontent.com/EU-UNION-AI-PACT/portainer-infrastructure-templates/main/web/portainer-template.json" style="color: #ffd700;" target="_blank">https://raw.githubusercontent.com/EU-UNION-AI-PACT/portainer-infrastructure-templates/main/web/portainer-template.json</a>
-                    </div>
-                </div>
-                
-                <div class="test-section">
-                    <h2>🧪 Testing Suite</h2>
-                    <button class="test-button" onclick="runTests()">🚀 Run Full Test Suite</button>
-                    <button class="test-button refresh-btn" onclick="location.reload()">🔄 Refresh Dashboard</button>
-                    <button class="test-button" onclick="testPortainerLoad()">🐳 Test Portainer Load</button>
-                    
-                    <div id="test-results" class="test-results" style="display: none;">
-                        <h3>📋 Test Results</h3>
-                        <div id="results-content">Running tests...</div>
-                    </div>
-                </div>
-                
-                <div class="test-section">
-                    <h2>📊 Quick Stats</h2>
-                    <p>🕒 Last Updated: {time.strftime("%Y-%m-%d %H:%M:%S")}</p>
-                    <p>🌍 Server Port: 8094</p>
-                    <p>📂 Template File: web/portainer-template.json</p>
-                    <p>🔄 Auto-refresh: Every 30 seconds</p>
-                </div>
-            </div>
-            
-            <script>
-                function runTests() {{
-                    document.getElementById('test-results').style.display = 'block';
-                    document.getElementById('results-content').innerHTML = '🔄 Running comprehensive tests...';
-                    
-                    fetch('/test')
-                        .then(response => response.json())
-                        .then(data => {{
-                            let html = '<pre>' + JSON.stringify(data, null, 2) + '</pre>';
-                            document.getElementById('results-content').innerHTML = html;
-                        }})
-                        .catch(error => {{
-                            document.getElementById('results-content').innerHTML = '❌ Error: ' + error;
-                        }});
-                }}
-                
-                function testPortainerLoad() {{
-                    document.getElementById('test-results').style.display = 'block';
-                    document.getElementById('results-content').innerHTML = '🐳 Testing Portainer template load...';
-                    
-                    fetch('/portainer-template.json')
-                        .then(response => response.json())
-                        .then(data => {{
-                            let result = '✅ SUCCESS: Template loaded with ' + data.templates.length + ' templates\\n';
-                            result += '📊 Categories found: ' + new Set(data.templates.flatMap(t => t.categories || [])).size;
-                            document.getElementById('results-content').innerHTML = '<pre>' + result + '</pre>';
-                        }})
-                        .catch(error => {{
-                            document.getElementById('results-content').innerHTML = '❌ Error loading template: ' + error;
-                        }});
-                }}
-                
-                // Auto-refresh every 30 seconds
-                setTimeout(() => location.reload(), 30000);
-            </script>
-        </body>
-        </html>
-        """
+        html = render_dashboard(template_count, server_status)
         
         self.send_response(200)
         self.send_header('Content-Type', 'text/html; charset=utf-8')
@@ -297,24 +357,18 @@ def main():
     port = 8094
     
     # Change to the correct directory
-    os.chdir('/home/holythreekingstreescrowns/Schreibtisch/Portainer Template')
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
     
     try:
+        TestTemplateHandler.template_cache = TemplateCache('web/portainer-template.json')
+        start_warmup(TestTemplateHandler.template_cache)
+        TestTemplateHandler.test_results = TestResultsCache(TestTemplateHandler.template_cache).start()
+        
         with socketserver.TCPServer(("", port), TestTemplateHandler) as httpd:
-            template_path = Path('web/portainer-template.json')
-            template_count = 0
-            
-            if template_path.exists():
-                try:
-                    with open(template_path, 'r', encoding='utf-8') as f:
-                        data = json.load(f)
-                        template_count = len(data.get('templates', []))
-                except:
-                    pass
+            report_listening()
             
             logging.info("🧪 PORTAINER TEMPLATE TEST SERVER")
             logging.info("=" * 60)
-            logging.info(f"📊 Templates loaded: {template_count}")
             logging.info(f"🌐 Test Server running on port {port}")
             logging.info(f"🎯 Test Dashboard: http://localhost:{port}/")
             logging.info(f"🔗 Template URL: http://localhost:{port}/portainer-template.json")
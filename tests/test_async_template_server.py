@@ -0,0 +1,58 @@
+"""Request handling of the asyncio engine against a small catalog"""
+
+import asyncio
+import json
+
+import pytest
+
+from async_template_server import AsyncTemplateServer, create_listen_socket
+from template_cache import TEMPLATE_FILENAME
+
+CATALOG = {'version': '2', 'templates': [{'type': 1, 'title': 'nginx', 'image': 'nginx:latest'}]}
+
+
+@pytest.fixture
+def web_dir(tmp_path):
+    (tmp_path / TEMPLATE_FILENAME).write_text(json.dumps(CATALOG))
+    (tmp_path / "index.html").write_text("<html></html>")
+    return tmp_path
+
+
+async def exchange(server: AsyncTemplateServer, raw: bytes) -> bytes:
+    """Send one raw request to a running server and read until it closes"""
+    sock = create_listen_socket(0, "127.0.0.1", verbose=False)
+    await server.start(sock)
+    try:
+        reader, writer = await asyncio.open_connection(*sock.getsockname()[:2])
+        writer.write(raw)
+        response = await asyncio.wait_for(reader.read(), 5)
+        writer.close()
+        return response
+    finally:
+        await server.shutdown(grace=0)
+
+
+def test_nul_byte_path_is_404(web_dir):
+    server = AsyncTemplateServer(web_dir, quiet=True)
+    response = asyncio.run(exchange(
+        server, b"GET /%00 HTTP/1.1\r\nHost: x\r\nConnection: close\r\n\r\n"))
+    assert response.startswith(b"HTTP/1.1 404 ")
+
+
+def test_handler_error_is_500(web_dir, monkeypatch):
+    server = AsyncTemplateServer(web_dir, quiet=True)
+
+    async def broken(request):
+        raise RuntimeError("handler bug")
+
+    monkeypatch.setattr(server, 'serve_static', broken)
+    response = asyncio.run(exchange(
+        server, b"GET /index.html HTTP/1.1\r\nHost: x\r\nConnection: close\r\n\r\n"))
+    assert response.startswith(b"HTTP/1.1 500 ")
+
+
+def test_negative_content_length_is_400(web_dir):
+    server = AsyncTemplateServer(web_dir, quiet=True)
+    response = asyncio.run(exchange(
+        server, b"GET /index.html HTTP/1.1\r\nHost: x\r\nContent-Length: -1\r\n\r\n"))
+    assert response.startswith(b"HTTP/1.1 400 ")
@@ -0,0 +1,39 @@
+"""Catalog snapshot representations and their caches"""
+
+import json
+
+from template_cache import (
+    TEMPLATE_FILENAME, load_snapshot, representation_cached, select_representation,
+)
+
+CATALOG = {'version': '2', 'templates': [
+    {'id': 1, 'type': 1, 'title': 'nginx', 'image': 'nginx:latest', 'categories': ['web']},
+    {'id': 2, 'type': 1, 'title': 'postgres', 'image': 'postgres:16', 'categories': ['database']},
+]}
+
+
+def snapshot(tmp_path):
+    path = tmp_path / TEMPLATE_FILENAME
+    path.write_text(json.dumps(CATALOG))
+    return load_snapshot(path)
+
+
+def test_representation_cached_after_first_build(tmp_path):
+    snap = snapshot(tmp_path)
+    requests = [
+        ('/templates', 'category=database'),
+        ('/templates/1', ''),
+        ('/templates/by-name/nginx', 'lean=1'),
+        ('/portainer-template.lean.json', ''),
+        ('/templates/changes', ''),
+    ]
+    for path, query in requests:
+        assert not representation_cached(snap, path, query), path
+        select_representation(snap, path, query)
+        assert representation_cached(snap, path, query), path
+
+
+def test_full_catalog_and_unknown_template_need_no_build(tmp_path):
+    snap = snapshot(tmp_path)
+    assert representation_cached(snap, '/portainer-template.json')
+    assert representation_cached(snap, '/templates/999')
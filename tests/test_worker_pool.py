@@ -0,0 +1,73 @@
+"""Bounded worker pool behind the keep-alive http.server handlers"""
+
+import http.client
+import http.server
+import socketserver
+import threading
+import time
+
+import pytest
+
+from template_cache import KeepAliveMixin
+from worker_pool import BoundedPoolServerMixin, WorkerPool
+
+
+class Handler(KeepAliveMixin, http.server.BaseHTTPRequestHandler):
+    keepalive_timeout = 15.0
+
+    def do_GET(self):
+        body = b"ok\n"
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class Server(BoundedPoolServerMixin, socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+
+
+@pytest.fixture
+def server():
+    Server.worker_pool = WorkerPool(workers=2, queue_size=8)
+    httpd = Server(("127.0.0.1", 0), Handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def get(connection: http.client.HTTPConnection):
+    connection.request('GET', '/')
+    response = connection.getresponse()
+    response.read()
+    return response
+
+
+def test_idle_keepalive_connections_do_not_starve_queued_requests(server):
+    port = server.server_address[1]
+    # Pin every worker with a kept-alive connection that then goes idle
+    idle = [http.client.HTTPConnection("127.0.0.1", port, timeout=5) for _ in range(2)]
+    for connection in idle:
+        assert get(connection).getheader('Connection') != 'close'
+
+    started = time.monotonic()
+    queued = http.client.HTTPConnection("127.0.0.1", port, timeout=20)
+    assert get(queued).status == 200
+    assert time.monotonic() - started < 2.0
+
+    for connection in idle + [queued]:
+        connection.close()
+
+
+def test_keepalive_connection_serves_several_requests(server):
+    connection = http.client.HTTPConnection("127.0.0.1", server.server_address[1], timeout=5)
+    assert get(connection).status == 200
+    sock = connection.sock
+    for _ in range(2):
+        assert get(connection).status == 200
+    assert connection.sock is sock
+    connection.close()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Worker Pool - bounded concurrency and load shedding for the threaded servers
+A fixed set of worker threads serves connections from a bounded queue.
+When the queue is full a new connection is answered immediately with
+503 Service Unavailable + Retry-After instead of being accepted and left
+to stall, so clients that are admitted keep predictable latency during
+polling spikes. Queue depth, busy workers and shed connections are
+exported as metrics.
+"""
+
+import os
+import queue
+import threading
+import time
+from typing import Callable, Optional
+
+from template_metrics import REGISTRY
+
+# Defaults, overridable with TEMPLATE_POOL_WORKERS / TEMPLATE_POOL_QUEUE;
+# 0 workers keeps the unbounded thread-per-connection behaviour
+POOL_WORKERS = 64                 # connections served concurrently
+POOL_QUEUE = 256                  # accepted connections waiting for a worker
+SHED_RETRY_AFTER = 1              # seconds suggested to shed clients
+
+
+class WorkerPool:
+    """Fixed worker threads fed from a bounded queue"""
+
+    def __init__(self, workers: int = POOL_WORKERS, queue_size: int = POOL_QUEUE):
+        self.workers = max(1, workers)
+        self.pending: 'queue.Queue[tuple]' = queue.Queue(max(1, queue_size))
+        self.busy = 0
+        self._started = False
+        self._lock = threading.Lock()   # start-up and the busy count
+        REGISTRY.gauge('template_server_pool_queue_depth', lambda: self.depth)
+        REGISTRY.gauge('template_server_pool_busy_workers', lambda: self.busy)
+
+    @classmethod
+    def from_env(cls) -> Optional['WorkerPool']:
+        """Pool configured from the environment, or None for thread-per-connection"""
+        workers = int(os.environ.get('TEMPLATE_POOL_WORKERS', POOL_WORKERS))
+        queue_size = int(os.environ.get('TEMPLATE_POOL_QUEUE', POOL_QUEUE))
+        if workers <= 0:
+            return None
+        return cls(workers, queue_size)
+
+    @property
+    def depth(self) -> int:
+        return self.pending.qsize()
+
+    def start(self):
+        with self._lock:
+            if self._started:
+                return
+            for i in range(self.workers):
+                threading.Thread(target=self._worker, name=f"pool-worker-{i}", daemon=True).start()
+            self._started = True
+
+    def submit(self, task: Callable[[], None]) -> bool:
+        """Queue a task; False (and counted as shed) if the queue is full"""
+        if not self._started:
+            self.start()
+        try:
+            self.pending.put_nowait((task, time.perf_counter()))
+        except queue.Full:
+            REGISTRY.inc('template_server_shed_total')
+            return False
+        return True
+
+    def _worker(self):
+        while True:
+            task, queued = self.pending.get()
+            REGISTRY.observe('template_server_pool_queue_wait_seconds', time.perf_counter() - queued)
+            with self._lock:
+                self.busy += 1
+            try:
+                task()
+            finally:
+                with self._lock:
+                    self.busy -= 1
+
+
+def service_unavailable(retry_after: int = SHED_RETRY_AFTER) -> bytes:
+    """Complete 503 response for connections shed before reaching a handler"""
+    body = b"Server busy, retry later\n"
+    return (f"HTTP/1.1 503 Service Unavailable\r\n"
+            f"Retry-After: {retry_after}\r\n"
+            f"Content-Type: text/plain; charset=utf-8\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: close\r\n\r\n").encode('latin-1') + body
+
+
+class BoundedPoolServerMixin:
+    """socketserver mixin serving connections on a shared WorkerPool
+
+    Put it before ThreadingMixIn. Set ``worker_pool`` on the server (one
+    pool may serve several listeners); None falls back to a thread per
+    connection.
+    """
+
+    worker_pool: Optional[WorkerPool] = None
+    # Kernel listen backlog; socketserver's default of 5 makes bursts wait
+    # for SYN retransmits (1s+) before the pool ever sees them
+    request_queue_size = 128
+
+    def process_request(self, request, client_address):
+        pool = self.worker_pool
+        if pool is None:
+            return super().process_request(request, client_address)
+        if not pool.submit(lambda: self.process_request_thread(request, client_address)):
+            try:
+                request.settimeout(1.0)
+                request.sendall(service_unavailable())
+                # Closing with an unread request would reset the connection
+                # and could discard the 503 before the client reads it
+                request.setblocking(False)
+                request.recv(65536)
+            except OSError:
+                pass
+            self.shutdown_request(request)